@@ -0,0 +1,549 @@
+"""
+Consulta de CNPJ em lote: leitura do arquivo enviado (CSV/NDJSON), validação e
+deduplicação, consultas com concorrência limitada (cache, base offline e cota
+da BrasilAPI em prioridade de segundo plano) e resultados gravados no Redis
+para que o lote possa ser retomado pelo ID
+
+Chaves no Redis (expiram em BATCH_JOB_TTL):
+    batch_job:{id}          hash com status, total e contadores
+    batch_job:{id}:items    CNPJs válidos e únicos do lote
+    batch_job:{id}:results  resultados JSON, na ordem em que ficaram prontos
+    batch_job:{id}:runner   lease do worker que executa o lote (renovado a cada gravação)
+"""
+import asyncio
+import csv
+import io
+import json
+import logging
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+from config import settings
+from document_validation import validate_cnpjs
+from external_apis import brasil_api
+from security import async_redis_client, only_digits
+from upstream_scheduler import PRIORITY_BACKGROUND, set_upstream_context
+
+logger = logging.getLogger(__name__)
+
+# Estado do lote
+STATUS_RUNNING = "running"
+STATUS_DONE = "done"
+STATUS_INTERRUPTED = "interrupted"
+
+# Resultado de cada CNPJ
+RESULT_FOUND = "found"
+RESULT_NOT_FOUND = "not_found"
+RESULT_INVALID = "invalid"
+RESULT_ERROR = "error"
+
+# Colunas da saída CSV (campos da resposta /cnpj/v1 da BrasilAPI)
+CSV_FIELDS = (
+    "cnpj", "status", "razao_social", "nome_fantasia", "descricao_situacao_cadastral",
+    "cnae_fiscal", "cnae_fiscal_descricao", "uf", "municipio", "error"
+)
+
+# Lease do worker: sem renovação nesse prazo, o lote é considerado interrompido
+RUNNER_LEASE_SECONDS = 60
+# Intervalo máximo entre gravações no Redis com lote em andamento
+FLUSH_INTERVAL = 1.0
+# Resultados de lotes concluídos mantidos em memória quando não puderam ser
+# gravados no Redis (com o Redis disponível, lotes concluídos são lidos de lá)
+MAX_LOCAL_RESULTS = 100000
+# Resultados lidos por LRANGE ao transmitir lotes de outro worker
+STREAM_CHUNK = 1000
+
+
+class BatchTooLarge(ValueError):
+    """Arquivo com mais CNPJs que BATCH_MAX_ITEMS"""
+
+
+def _is_json_line(line: str) -> bool:
+    """Linha é um objeto ou string JSON (NDJSON) e não um cabeçalho CSV"""
+    try:
+        return isinstance(json.loads(line), (dict, str))
+    except json.JSONDecodeError:
+        return False
+
+
+def parse_upload(content: bytes, filename: str = "", content_type: str = "",
+                 max_items: int = settings.BATCH_MAX_ITEMS) -> List[str]:
+    """
+    Extrair os CNPJs de um arquivo CSV ou NDJSON
+
+    CSV: usa a coluna "cnpj" se houver cabeçalho, senão a primeira coluna
+    (separador "," ou ";"). NDJSON: objetos {"cnpj": ...} ou strings, um por linha.
+
+    Args:
+        content: Conteúdo do arquivo
+        filename: Nome do arquivo enviado (define o formato pela extensão)
+        content_type: Content-Type da parte do upload
+        max_items: Máximo de linhas aceitas
+
+    Returns:
+        Documentos na ordem do arquivo (sem validação)
+
+    Raises:
+        BatchTooLarge: Mais linhas que max_items
+        ValueError: Arquivo ilegível
+    """
+    try:
+        text = content.decode("utf-8-sig")
+    except UnicodeDecodeError:
+        text = content.decode("latin-1")
+
+    lines = [line for line in text.splitlines() if line.strip()]
+    if len(lines) > max_items + 1:
+        raise BatchTooLarge(f"Batch exceeds {max_items} items")
+    if not lines:
+        return []
+
+    filename = (filename or "").lower()
+    content_type = (content_type or "").lower()
+    if filename.endswith((".ndjson", ".jsonl")) or "ndjson" in content_type or "jsonl" in content_type:
+        is_ndjson = True
+    elif filename.endswith(".csv") or "csv" in content_type:
+        is_ndjson = False
+    else:
+        # Formato não informado: NDJSON só se a primeira linha for JSON válido
+        # ("cnpj","nome" exportado pelo Excel também começa com aspas)
+        is_ndjson = _is_json_line(lines[0])
+
+    documents: List[str] = []
+    if is_ndjson:
+        for number, line in enumerate(lines, 1):
+            try:
+                value = json.loads(line)
+            except json.JSONDecodeError:
+                raise ValueError(f"Invalid JSON on line {number}")
+            if isinstance(value, dict):
+                value = value.get("cnpj")
+            documents.append(str(value) if value is not None else "")
+    else:
+        delimiter = ";" if lines[0].count(";") > lines[0].count(",") else ","
+        rows = csv.reader(lines, delimiter=delimiter)
+        header = next(rows)
+        column = 0
+        normalized = [cell.strip().lower() for cell in header]
+        if "cnpj" in normalized:
+            column = normalized.index("cnpj")
+        elif header and only_digits(header[0]):
+            # Sem cabeçalho: a primeira linha já é um CNPJ
+            documents.append(header[0])
+        for row in rows:
+            documents.append(row[column] if len(row) > column else "")
+
+    if len(documents) > max_items:
+        raise BatchTooLarge(f"Batch exceeds {max_items} items")
+    return documents
+
+
+def prepare_documents(documents: List[str]) -> Tuple[List[str], List[str], int]:
+    """
+    Validar e deduplicar os documentos do lote
+
+    Args:
+        documents: Documentos como vieram no arquivo
+
+    Returns:
+        Tupla (CNPJs válidos e únicos na ordem do arquivo, entradas inválidas únicas,
+        quantidade de duplicados descartados)
+    """
+    cleaned = [only_digits(document) for document in documents]
+    valid_flags = validate_cnpjs(cleaned)
+
+    valid: Dict[str, None] = {}
+    invalid: Dict[str, None] = {}
+    for document, cnpj_clean, is_valid in zip(documents, cleaned, valid_flags):
+        if is_valid:
+            valid.setdefault(cnpj_clean, None)
+        else:
+            invalid.setdefault(document.strip()[:32], None)
+
+    duplicates = len(documents) - len(valid) - len(invalid)
+    return list(valid), list(invalid), duplicates
+
+
+def csv_line(values) -> str:
+    """Linha CSV (com aspas quando necessário)"""
+    buffer = io.StringIO()
+    csv.writer(buffer).writerow(values)
+    return buffer.getvalue()
+
+
+def result_csv_line(result: Dict[str, Any]) -> str:
+    """Linha CSV de um resultado, nas colunas de CSV_FIELDS"""
+    data = result.get("data") or {}
+    return csv_line(
+        result.get(field, "") if field in ("cnpj", "status", "error") else (data.get(field) or "")
+        for field in CSV_FIELDS
+    )
+
+
+class BatchJob:
+    """Lote em execução (ou carregado do Redis) com seus resultados"""
+
+    def __init__(self, job_id: str, owner: str, items: List[str], status: str = STATUS_RUNNING,
+                 invalid: int = 0, duplicates: int = 0, created_at: Optional[float] = None):
+        self.id = job_id
+        self.owner = owner
+        self.items = items
+        self.status = status
+        self.invalid = invalid
+        self.duplicates = duplicates
+        self.created_at = created_at or time.time()
+        self.results: List[Dict[str, Any]] = []
+        self.flushed = 0
+        self.last_flush = time.monotonic()
+        self.task: Optional[asyncio.Task] = None
+        self._changed = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+
+    @property
+    def total(self) -> int:
+        return len(self.items) + self.invalid
+
+    def append(self, result: Dict[str, Any]) -> None:
+        """Registrar resultado e acordar quem está transmitindo o lote"""
+        self.results.append(result)
+        self._notify()
+
+    def finish(self, status: str) -> None:
+        self.status = status
+        self._notify()
+
+    def _notify(self) -> None:
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    def summary(self) -> Dict[str, Any]:
+        """Metadados do lote (resposta de status e hash no Redis)"""
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "total": self.total,
+            "completed": len(self.results),
+            "invalid": self.invalid,
+            "duplicates": self.duplicates,
+            "created_at": int(self.created_at)
+        }
+
+
+class BatchJobManager:
+    """Executa os lotes deste worker e localiza lotes de outros workers no Redis"""
+
+    def __init__(self, redis_client, concurrency: int, ttl: int, flush_size: int):
+        """
+        Args:
+            redis_client: Cliente redis.asyncio (None mantém os lotes só em memória)
+            concurrency: Consultas simultâneas por lote
+            ttl: Tempo de retenção do lote no Redis em segundos
+            flush_size: Resultados acumulados por gravação no Redis
+        """
+        self.redis_client = redis_client
+        self.concurrency = max(1, concurrency)
+        self.ttl = ttl
+        self.flush_size = max(1, flush_size)
+        self._jobs: "OrderedDict[str, BatchJob]" = OrderedDict()
+        self._runner_id = uuid.uuid4().hex
+        self.submitted = 0
+        self.resumed = 0
+        self.lookups = 0
+        self.errors = 0
+
+    @staticmethod
+    def _key(job_id: str, suffix: str = "") -> str:
+        return f"batch_job:{job_id}{suffix}"
+
+    def _track(self, job: BatchJob) -> None:
+        """Guardar lote em execução na memória"""
+        self._jobs[job.id] = job
+        self._jobs.move_to_end(job.id)
+
+    def _release(self, job: BatchJob) -> None:
+        """
+        Tirar da memória o lote encerrado cujos resultados já estão no Redis;
+        os que não foram gravados ficam até somarem MAX_LOCAL_RESULTS resultados
+        """
+        if self.redis_client is not None and job.flushed == len(job.results):
+            self._jobs.pop(job.id, None)
+
+        kept = sum(len(other.results) for other in self._jobs.values() if other.status != STATUS_RUNNING)
+        for job_id in list(self._jobs):
+            if kept <= MAX_LOCAL_RESULTS:
+                break
+            other = self._jobs[job_id]
+            if other.status != STATUS_RUNNING:
+                kept -= len(other.results)
+                del self._jobs[job_id]
+
+    async def submit(self, documents: List[str], owner: str) -> BatchJob:
+        """
+        Criar lote e iniciar as consultas em segundo plano
+
+        Args:
+            documents: Documentos extraídos do arquivo
+            owner: Usuário autenticado que enviou o lote
+
+        Returns:
+            Lote criado (inválidos já constam nos resultados)
+        """
+        items, invalid, duplicates = prepare_documents(documents)
+        job = BatchJob(uuid.uuid4().hex, owner, items, invalid=len(invalid), duplicates=duplicates)
+        for document in invalid:
+            job.append({"cnpj": document, "status": RESULT_INVALID})
+
+        if self.redis_client is not None:
+            try:
+                pipe = self.redis_client.pipeline(transaction=False)
+                pipe.hset(self._key(job.id), mapping={**job.summary(), "owner": owner})
+                for start in range(0, len(items), STREAM_CHUNK):
+                    pipe.rpush(self._key(job.id, ":items"), *items[start:start + STREAM_CHUNK])
+                pipe.expire(self._key(job.id), self.ttl)
+                pipe.expire(self._key(job.id, ":items"), self.ttl)
+                pipe.set(self._key(job.id, ":runner"), self._runner_id, ex=RUNNER_LEASE_SECONDS)
+                await pipe.execute()
+            except Exception as e:
+                logger.error(f"Failed to persist batch job {job.id}, it will not be resumable: {e}")
+
+        self.submitted += 1
+        self._start(job)
+        logger.info(
+            f"Batch job {job.id} submitted by {owner}: {len(items)} lookups, "
+            f"{len(invalid)} invalid, {duplicates} duplicates"
+        )
+        return job
+
+    def _start(self, job: BatchJob) -> None:
+        self._track(job)
+        job.task = asyncio.create_task(self._run(job))
+
+    async def _lookup(self, cnpj_clean: str) -> Dict[str, Any]:
+        """Consultar um CNPJ (cache, base offline e BrasilAPI)"""
+        self.lookups += 1
+        try:
+            data = await brasil_api.lookup_cnpj(cnpj_clean)
+        except Exception as e:
+            self.errors += 1
+            return {"cnpj": cnpj_clean, "status": RESULT_ERROR, "error": type(e).__name__}
+        if data is None:
+            return {"cnpj": cnpj_clean, "status": RESULT_NOT_FOUND}
+        return {"cnpj": cnpj_clean, "status": RESULT_FOUND, "data": data}
+
+    async def _run(self, job: BatchJob) -> None:
+        """Consultar os CNPJs pendentes com no máximo `concurrency` em andamento"""
+        # Cota da BrasilAPI: lotes cedem a vez às consultas interativas do bot
+        set_upstream_context(f"batch:{job.id}", PRIORITY_BACKGROUND)
+        done = {result["cnpj"] for result in job.results}
+        pending = iter([cnpj for cnpj in job.items if cnpj not in done])
+
+        async def worker() -> None:
+            for cnpj_clean in pending:
+                job.append(await self._lookup(cnpj_clean))
+                # Gravação em andamento já leva (ou a próxima levará) este resultado
+                if job._flush_lock.locked():
+                    continue
+                if len(job.results) - job.flushed >= self.flush_size or \
+                        time.monotonic() - job.last_flush >= FLUSH_INTERVAL:
+                    await self._flush(job)
+
+        async def heartbeat() -> None:
+            # Renova o lease mesmo sem resultados novos (upstream lento)
+            while True:
+                await asyncio.sleep(RUNNER_LEASE_SECONDS / 3)
+                await self._flush(job)
+
+        keepalive = asyncio.create_task(heartbeat())
+        try:
+            await asyncio.gather(*(worker() for _ in range(min(self.concurrency, len(job.items)) or 1)))
+        finally:
+            keepalive.cancel()
+
+        job.finish(STATUS_DONE)
+        await self._flush(job)
+        self._release(job)
+        logger.info(f"Batch job {job.id} finished: {len(job.results)} results")
+
+    async def _flush(self, job: BatchJob) -> None:
+        """Gravar no Redis os resultados novos, o status e renovar o lease"""
+        job.last_flush = time.monotonic()
+        if self.redis_client is None:
+            return
+
+        # Protegida do cancelamento (stop): a gravação em andamento termina e
+        # atualiza job.flushed antes que a gravação final obtenha o lock
+        await asyncio.shield(self._write_progress(job))
+
+    async def _write_progress(self, job: BatchJob) -> None:
+        # Uma gravação por vez; job.flushed só avança depois do EXEC, então após
+        # uma falha a próxima gravação reenvia a mesma fatia
+        async with job._flush_lock:
+            start, end = job.flushed, len(job.results)
+            try:
+                pipe = self.redis_client.pipeline(transaction=True)
+                if end > start:
+                    pipe.rpush(
+                        self._key(job.id, ":results"),
+                        *(json.dumps(result, ensure_ascii=False) for result in job.results[start:end])
+                    )
+                pipe.hset(self._key(job.id), mapping={"status": job.status, "completed": end})
+                for suffix in ("", ":items", ":results"):
+                    pipe.expire(self._key(job.id, suffix), self.ttl)
+                if job.status == STATUS_RUNNING:
+                    pipe.set(self._key(job.id, ":runner"), self._runner_id, ex=RUNNER_LEASE_SECONDS)
+                else:
+                    pipe.delete(self._key(job.id, ":runner"))
+                await pipe.execute()
+                job.flushed = end
+            except Exception as e:
+                logger.error(f"Failed to persist batch job {job.id} progress: {e}")
+
+    async def _load(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Metadados do lote no Redis (status corrigido se o worker sumiu)"""
+        if self.redis_client is None:
+            return None
+        meta, runner = await asyncio.gather(
+            self.redis_client.hgetall(self._key(job_id)),
+            self.redis_client.get(self._key(job_id, ":runner"))
+        )
+        if not meta:
+            return None
+        if meta.get("status") == STATUS_RUNNING and runner is None:
+            meta["status"] = STATUS_INTERRUPTED
+        return meta
+
+    async def status(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Progresso do lote
+
+        Returns:
+            Metadados do lote ou None se desconhecido/expirado
+        """
+        job = self._jobs.get(job_id)
+        if job is not None:
+            return job.summary()
+        meta = await self._load(job_id)
+        if meta is None:
+            return None
+        return {
+            "job_id": job_id,
+            "status": meta["status"],
+            "total": int(meta.get("total", 0)),
+            "completed": int(meta.get("completed", 0)),
+            "invalid": int(meta.get("invalid", 0)),
+            "duplicates": int(meta.get("duplicates", 0)),
+            "created_at": int(meta.get("created_at", 0))
+        }
+
+    async def resume(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Retomar lote interrompido (queda ou deploy do worker que o executava)
+
+        Lotes em andamento ou concluídos não são alterados.
+
+        Returns:
+            Metadados do lote ou None se desconhecido/expirado
+        """
+        meta = await self.status(job_id)
+        if meta is None or meta["status"] != STATUS_INTERRUPTED or self.redis_client is None:
+            return meta
+
+        # Lease tomado com NX: só um worker retoma o lote
+        claimed = await self.redis_client.set(
+            self._key(job_id, ":runner"), self._runner_id, ex=RUNNER_LEASE_SECONDS, nx=True
+        )
+        if not claimed:
+            return await self.status(job_id)
+
+        raw = await self.redis_client.hgetall(self._key(job_id))
+        items = await self.redis_client.lrange(self._key(job_id, ":items"), 0, -1)
+        results = await self.redis_client.lrange(self._key(job_id, ":results"), 0, -1)
+        job = BatchJob(
+            job_id, raw.get("owner", ""), items,
+            invalid=int(raw.get("invalid", 0)),
+            duplicates=int(raw.get("duplicates", 0)),
+            created_at=float(raw.get("created_at", 0)) or None
+        )
+        job.results = [json.loads(result) for result in results]
+        job.flushed = len(job.results)
+
+        self.resumed += 1
+        self._start(job)
+        logger.info(f"Batch job {job_id} resumed with {len(job.results)}/{job.total} results")
+        return job.summary()
+
+    async def stream(self, job_id: str, offset: int = 0) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Transmitir os resultados a partir de offset, conforme ficam prontos
+
+        Lotes deste worker são lidos da memória; os de outros workers, do Redis.
+        Termina quando o lote acaba (ou é interrompido).
+        """
+        job = self._jobs.get(job_id)
+        if job is not None:
+            while True:
+                changed = job._changed
+                while offset < len(job.results):
+                    yield job.results[offset]
+                    offset += 1
+                if job.status != STATUS_RUNNING:
+                    return
+                await changed.wait()
+
+        if self.redis_client is None:
+            return
+        key = self._key(job_id, ":results")
+        finished = False
+        while True:
+            results = await self.redis_client.lrange(key, offset, offset + STREAM_CHUNK - 1)
+            for result in results:
+                yield json.loads(result)
+            offset += len(results)
+            if len(results) == STREAM_CHUNK:
+                continue
+            if finished:
+                return
+            meta = await self._load(job_id)
+            if meta is None or meta["status"] != STATUS_RUNNING:
+                # Lote encerrado: a lista não muda mais; uma última leitura
+                # pega o que foi gravado depois do LRANGE acima
+                finished = True
+                continue
+            await asyncio.sleep(FLUSH_INTERVAL)
+
+    async def stop(self) -> None:
+        """Interromper os lotes deste worker, gravando o progresso para retomada"""
+        running = [job for job in self._jobs.values() if job.status == STATUS_RUNNING and job.task]
+        for job in running:
+            job.task.cancel()
+        for job in running:
+            try:
+                await job.task
+            except asyncio.CancelledError:
+                pass
+            except Exception as e:
+                logger.error(f"Batch job {job.id} failed: {e}")
+            if job.status == STATUS_RUNNING:
+                job.finish(STATUS_INTERRUPTED)
+                await self._flush(job)
+            self._release(job)
+
+    def stats(self) -> Dict[str, int]:
+        """Contadores dos lotes"""
+        return {
+            "running": sum(1 for job in self._jobs.values() if job.status == STATUS_RUNNING),
+            "submitted": self.submitted,
+            "resumed": self.resumed,
+            "lookups": self.lookups,
+            "errors": self.errors
+        }
+
+
+# Instância global dos lotes de CNPJ
+batch_jobs = BatchJobManager(
+    async_redis_client,
+    concurrency=settings.BATCH_CONCURRENCY,
+    ttl=settings.BATCH_JOB_TTL,
+    flush_size=settings.BATCH_FLUSH_SIZE
+)
@@ -0,0 +1,68 @@
+"""
+Micro-benchmark do anonimizador de logs (linhas/segundo)
+
+Uso:
+    python -m benchmarks.bench_anonymizer [--lines 200000]
+"""
+import argparse
+import logging
+import re
+import time
+from logging_config import AnonymizedFormatter, anonymize
+
+SAMPLE_LINES = [
+    "POST /api/webhook/telegram - 200",
+    "CNPJ 12.345.678/0001-90 consulted successfully",
+    "CNPJ 12345678000190 consulted successfully",
+    "Servidor data for CPF 123.456.789-09 retrieved",
+    "No benefícios data found for CPF 12345678909",
+    "Email joao.silva@example.com.br found in 3 breaches",
+    "Message sent to (11) 98765-4321",
+    "Rate limit exceeded for 123456789 on telegram",
+    "HTTP client pool created for https://brasilapi.com.br",
+    "Partition maintenance finished without changes",
+]
+
+
+def legacy_anonymize(text: str) -> str:
+    """Implementação anterior: quatro passadas com regex não pré-compilada"""
+    text = re.sub(r'\d{3}\.\d{3}\.\d{3}-\d{2}', 'XXX.XXX.XXX-XX', str(text))
+    text = re.sub(r'\d{2}\.\d{3}\.\d{3}/\d{4}-\d{2}', 'XX.XXX.XXX/XXXX-XX', str(text))
+    text = re.sub(
+        r'[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}', 'user@example.com', str(text)
+    )
+    text = re.sub(r'\(\d{2}\)\s?\d{4,5}-\d{4}', '(XX)XXXX-XXXX', str(text))
+    return text
+
+
+def measure(name: str, func, lines: int) -> float:
+    """Executar func sobre as linhas de exemplo e imprimir a vazão"""
+    samples = (SAMPLE_LINES * (lines // len(SAMPLE_LINES) + 1))[:lines]
+    start = time.perf_counter()
+    for line in samples:
+        func(line)
+    elapsed = time.perf_counter() - start
+    throughput = lines / elapsed
+    print(f"{name:<28} {throughput:>14,.0f} lines/sec")
+    return throughput
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--lines", type=int, default=200000)
+    args = parser.parse_args()
+
+    formatter = AnonymizedFormatter("%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+
+    def format_record(line: str) -> str:
+        record = logging.LogRecord("bench", logging.INFO, __file__, 0, "%s", (line,), None)
+        return formatter.format(record)
+
+    legacy = measure("legacy (4 x re.sub)", legacy_anonymize, args.lines)
+    current = measure("anonymize (single pass)", anonymize, args.lines)
+    measure("AnonymizedFormatter.format", format_record, args.lines)
+    print(f"speedup: {current / legacy:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+"""
+Micro-benchmark da validação de CPF/CNPJ: escalar (security) x lote (NumPy)
+
+Uso:
+    python -m benchmarks.bench_validators [--documents 100000]
+"""
+import argparse
+import random
+import time
+from document_validation import NUMPY_AVAILABLE, validate_cnpjs, validate_cpfs
+from security import CNPJ_WEIGHTS, CPF_WEIGHTS, mod11_check_digit, validate_cnpj, validate_cpf
+
+
+def make_document(size: int, weights: tuple, valid: bool) -> str:
+    """Gerar documento aleatório (com dígitos verificadores corretos se valid)"""
+    base = "".join(random.choice("0123456789") for _ in range(size - 2))
+    first = mod11_check_digit(base, weights[0])
+    second = mod11_check_digit(f"{base}{first}", weights[1])
+    if not valid:
+        second = (second + 1) % 10
+    return f"{base}{first}{second}"
+
+
+def measure(name: str, func, documents: list) -> float:
+    """Executar func sobre os documentos e imprimir a vazão"""
+    start = time.perf_counter()
+    func(documents)
+    elapsed = time.perf_counter() - start
+    throughput = len(documents) / elapsed
+    print(f"{name:<28} {throughput:>14,.0f} docs/sec")
+    return throughput
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--documents", type=int, default=100000)
+    args = parser.parse_args()
+
+    if not NUMPY_AVAILABLE:
+        print("NumPy not installed: batch path falls back to the scalar validator")
+
+    for label, size, weights, scalar, batch in (
+        ("CPF", 11, CPF_WEIGHTS, validate_cpf, validate_cpfs),
+        ("CNPJ", 14, CNPJ_WEIGHTS, validate_cnpj, validate_cnpjs),
+    ):
+        documents = [make_document(size, weights, random.random() < 0.9) for _ in range(args.documents)]
+
+        expected = [scalar(document) for document in documents]
+        assert batch(documents) == expected, f"{label}: batch and scalar results differ"
+
+        print(f"{label} ({args.documents} documents)")
+        scalar_rate = measure("  scalar (security)", lambda docs: [scalar(d) for d in docs], documents)
+        batch_rate = measure("  batch (document_validation)", batch, documents)
+        print(f"  speedup: {batch_rate / scalar_rate:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,263 @@
+"""
+Cache em dois níveis (LRU em memória + Redis) com TTL, cache negativo,
+stale-while-revalidate e stale-if-error
+"""
+import asyncio
+import json
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional
+from metrics import observe_redis
+
+logger = logging.getLogger(__name__)
+
+
+class CacheEntry:
+    """Valor em cache com prazos de validade"""
+
+    __slots__ = ("value", "fresh_until", "stale_until", "error_until")
+
+    def __init__(
+        self,
+        value: Any,
+        fresh_until: float,
+        stale_until: float,
+        error_until: Optional[float] = None
+    ):
+        self.value = value
+        self.fresh_until = fresh_until
+        self.stale_until = stale_until
+        # Até quando a entrada pode substituir um upstream com falha
+        self.error_until = stale_until if error_until is None else error_until
+
+    def to_json(self) -> str:
+        return json.dumps({
+            "v": self.value,
+            "f": self.fresh_until,
+            "s": self.stale_until,
+            "e": self.error_until
+        })
+
+    @classmethod
+    def from_json(cls, raw: str) -> "CacheEntry":
+        data = json.loads(raw)
+        return cls(data["v"], data["f"], data["s"], data.get("e"))
+
+
+class LRUCache:
+    """Cache LRU limitado em memória (nível 1)"""
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self._entries: "OrderedDict[str, CacheEntry]" = OrderedDict()
+        self.evictions = 0
+
+    def get(self, key: str, now: float) -> Optional[CacheEntry]:
+        """Obter entrada ainda utilizável (fresca, stale ou reserva para erros)"""
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if now >= entry.error_until:
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def set(self, key: str, entry: CacheEntry) -> None:
+        """Inserir entrada, removendo a menos usada se necessário"""
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def delete(self, key: str) -> None:
+        """Remover entrada"""
+        self._entries.pop(key, None)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class TieredCache:
+    """
+    Cache em dois níveis na frente de um carregador assíncrono
+
+    O carregador retorna o valor encontrado, None para "não encontrado"
+    (cacheado com TTL curto) ou lança exceção para erros transitórios
+    (nunca cacheados). Em erro, um valor expirado ainda dentro de
+    error_ttl é servido no lugar da exceção.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        max_size: int,
+        ttl: int,
+        stale_ttl: int,
+        negative_ttl: int,
+        redis_client=None,
+        error_ttl: int = 0
+    ):
+        """
+        Args:
+            name: Nome do cache (prefixo das chaves no Redis)
+            max_size: Número máximo de entradas em memória
+            ttl: Segundos em que a entrada é considerada fresca
+            stale_ttl: Segundos adicionais em que a entrada é servida enquanto é revalidada
+            negative_ttl: Segundos de cache para resultados não encontrados
+            redis_client: Cliente Redis compartilhado (None desativa o nível 2)
+            error_ttl: Segundos após o stale em que a entrada ainda é servida se o upstream falhar
+        """
+        self.name = name
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.negative_ttl = negative_ttl
+        self.error_ttl = error_ttl
+        self.redis_client = redis_client
+        self._local = LRUCache(max_size)
+        self._refreshing: Dict[str, asyncio.Task] = {}
+        self._counters = {
+            "hits": 0,
+            "stale_hits": 0,
+            "redis_hits": 0,
+            "negative_hits": 0,
+            "misses": 0,
+            "error_hits": 0,
+            "refreshes": 0,
+            "redis_errors": 0
+        }
+
+    def _redis_key(self, key: str) -> str:
+        return f"cache:{self.name}:{key}"
+
+    def _make_entry(self, value: Any) -> CacheEntry:
+        now = time.time()
+        if value is None:
+            return CacheEntry(None, now + self.negative_ttl, now + self.negative_ttl)
+        stale_until = now + self.ttl + self.stale_ttl
+        return CacheEntry(value, now + self.ttl, stale_until, stale_until + self.error_ttl)
+
+    async def _redis_get(self, key: str) -> Optional[CacheEntry]:
+        if self.redis_client is None:
+            return None
+        try:
+            with observe_redis("cache_get"):
+                raw = await asyncio.to_thread(self.redis_client.get, self._redis_key(key))
+            return CacheEntry.from_json(raw) if raw else None
+        except Exception as e:
+            self._counters["redis_errors"] += 1
+            logger.warning(f"Cache {self.name}: Redis read failed: {e}")
+            return None
+
+    async def _redis_set(self, key: str, entry: CacheEntry) -> None:
+        if self.redis_client is None:
+            return
+        try:
+            expire = max(1, int(entry.error_until - time.time()))
+            with observe_redis("cache_set"):
+                await asyncio.to_thread(
+                    self.redis_client.set, self._redis_key(key), entry.to_json(), ex=expire
+                )
+        except Exception as e:
+            self._counters["redis_errors"] += 1
+            logger.warning(f"Cache {self.name}: Redis write failed: {e}")
+
+    async def _store(self, key: str, value: Any) -> None:
+        entry = self._make_entry(value)
+        self._local.set(key, entry)
+        await self._redis_set(key, entry)
+
+    def _schedule_refresh(self, key: str, loader: Callable[[], Awaitable[Any]]) -> None:
+        """Revalidar entrada stale em segundo plano (uma vez por chave)"""
+        if key in self._refreshing:
+            return
+
+        async def refresh():
+            try:
+                value = await loader()
+                await self._store(key, value)
+                self._counters["refreshes"] += 1
+            except Exception as e:
+                logger.warning(f"Cache {self.name}: background refresh failed: {e}")
+            finally:
+                self._refreshing.pop(key, None)
+
+        self._refreshing[key] = asyncio.create_task(refresh())
+
+    def _serve(self, key: str, entry: CacheEntry, now: float, loader) -> Any:
+        if entry.value is None:
+            self._counters["negative_hits"] += 1
+        if now >= entry.fresh_until:
+            self._counters["stale_hits"] += 1
+            self._schedule_refresh(key, loader)
+        return entry.value
+
+    async def get_or_load(self, key: str, loader: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Obter valor do cache ou carregá-lo do upstream
+
+        Args:
+            key: Chave normalizada
+            loader: Corrotina que busca o valor no upstream
+
+        Returns:
+            Valor em cache/carregado ou None se não encontrado
+        """
+        now = time.time()
+
+        entry = self._local.get(key, now)
+        if entry is not None and now < entry.stale_until:
+            self._counters["hits"] += 1
+            return self._serve(key, entry, now, loader)
+        expired = entry
+
+        if expired is None:
+            entry = await self._redis_get(key)
+            if entry is not None and now < entry.stale_until:
+                self._counters["redis_hits"] += 1
+                self._local.set(key, entry)
+                return self._serve(key, entry, now, loader)
+            if entry is not None and now < entry.error_until:
+                expired = entry
+
+        self._counters["misses"] += 1
+        try:
+            value = await loader()
+        except Exception as e:
+            if expired is None or expired.value is None:
+                raise
+            # stale-if-error: upstream indisponível, servir o último valor conhecido
+            self._counters["error_hits"] += 1
+            logger.warning(f"Cache {self.name}: serving expired entry after upstream error: {e}")
+            return expired.value
+        await self._store(key, value)
+        return value
+
+    async def invalidate(self, key: str) -> None:
+        """Remover chave dos dois níveis"""
+        self._local.delete(key)
+        if self.redis_client is not None:
+            try:
+                await asyncio.to_thread(self.redis_client.delete, self._redis_key(key))
+            except Exception as e:
+                self._counters["redis_errors"] += 1
+                logger.warning(f"Cache {self.name}: Redis delete failed: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Contadores para dimensionamento do cache
+
+        Returns:
+            Dicionário com acertos, falhas, despejos e ocupação
+        """
+        lookups = self._counters["hits"] + self._counters["redis_hits"] + self._counters["misses"]
+        hits = self._counters["hits"] + self._counters["redis_hits"]
+        return {
+            **self._counters,
+            "evictions": self._local.evictions,
+            "size": len(self._local),
+            "max_size": self._local.max_size,
+            "hit_ratio": round(hits / lookups, 4) if lookups else 0.0
+        }
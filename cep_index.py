@@ -0,0 +1,236 @@
+"""
+Índice binário de CEPs mapeado em memória (consulta offline sem BrasilAPI)
+
+Formato do arquivo (little-endian):
+    cabeçalho   magic (8 bytes), versão (uint32), quantidade (uint32)
+    chaves      quantidade x uint32, CEPs ordenados
+    offsets     (quantidade + 1) x uint32, início de cada registro na tabela de strings
+    strings     registros UTF-8 "uf<US>cidade<US>bairro<US>logradouro"
+
+O arquivo é aberto com mmap somente leitura: os workers do uvicorn compartilham
+as mesmas páginas do page cache e a busca binária roda direto sobre o mapeamento.
+
+Geração a partir de um CSV com cabeçalho cep,state,city,neighborhood,street:
+    python -m cep_index build --source ceps.csv --output data/cep.idx
+
+Consulta de teste:
+    python -m cep_index lookup 01001000
+"""
+import argparse
+import csv
+import logging
+import mmap
+import os
+import struct
+import sys
+import time
+from array import array
+from bisect import bisect_left
+from typing import Any, Dict, Optional
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"CEPIDX\x00\x01"
+VERSION = 1
+HEADER = struct.Struct("<8sII")
+FIELD_SEPARATOR = "\x1f"
+FIELDS = ("state", "city", "neighborhood", "street")
+
+# Intervalo entre verificações de troca do arquivo (novo build)
+RELOAD_CHECK_INTERVAL = 60
+
+
+def build_index(source_path: str, output_path: str, delimiter: str = ",") -> int:
+    """
+    Gerar o índice a partir de um CSV de CEPs
+
+    O arquivo é gerado ao lado do destino e trocado atomicamente.
+
+    Args:
+        source_path: CSV com cabeçalho cep,state,city,neighborhood,street
+        output_path: Caminho do índice gerado
+        delimiter: Separador do CSV
+
+    Returns:
+        Quantidade de CEPs indexados
+    """
+    records: Dict[int, bytes] = {}
+    with open(source_path, encoding="utf-8", newline="") as source:
+        for row in csv.DictReader(source, delimiter=delimiter):
+            digits = "".join(filter(str.isdigit, row.get("cep") or ""))
+            if len(digits) != 8:
+                continue
+            records[int(digits)] = FIELD_SEPARATOR.join(
+                (row.get(field) or "").strip() for field in FIELDS
+            ).encode("utf-8")
+
+    keys = array("I", sorted(records))
+    offsets = array("I", [0])
+    blob = bytearray()
+    for key in keys:
+        blob += records[key]
+        offsets.append(len(blob))
+
+    if sys.byteorder != "little":
+        keys.byteswap()
+        offsets.byteswap()
+
+    os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+    tmp_path = f"{output_path}.building"
+    with open(tmp_path, "wb") as output:
+        output.write(HEADER.pack(MAGIC, VERSION, len(keys)))
+        output.write(keys.tobytes())
+        output.write(offsets.tobytes())
+        output.write(blob)
+    os.replace(tmp_path, output_path)
+
+    logger.info(f"CEP index built with {len(keys)} entries ({os.path.getsize(output_path)} bytes)")
+    return len(keys)
+
+
+class CEPIndex:
+    """Consultas no índice mapeado em memória"""
+
+    def __init__(self, path: str):
+        """
+        Args:
+            path: Caminho do índice gerado por build_index
+        """
+        self.path = path
+        self._mmap: Optional[mmap.mmap] = None
+        self._keys: Optional[memoryview] = None
+        self._offsets: Optional[memoryview] = None
+        self._strings_start = 0
+        self._file_mtime: Optional[float] = None
+        self._next_check = 0.0
+        self.lookups = 0
+        self.hits = 0
+
+    def _close(self) -> None:
+        if self._keys is not None:
+            self._keys.release()
+            self._offsets.release()
+        if self._mmap is not None:
+            self._mmap.close()
+        self._mmap = self._keys = self._offsets = None
+
+    def _open(self) -> None:
+        """Mapear o arquivo e validar o cabeçalho"""
+        with open(self.path, "rb") as index_file:
+            mapped = mmap.mmap(index_file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, count = HEADER.unpack_from(mapped, 0)
+        if magic != MAGIC or version != VERSION:
+            mapped.close()
+            raise ValueError(f"Invalid CEP index file: {self.path}")
+        if sys.byteorder != "little":
+            mapped.close()
+            raise ValueError("CEP index requires a little-endian host")
+
+        keys_start = HEADER.size
+        offsets_start = keys_start + count * 4
+        self._strings_start = offsets_start + (count + 1) * 4
+
+        self._close()
+        self._mmap = mapped
+        view = memoryview(mapped)
+        self._keys = view[keys_start:offsets_start].cast("I")
+        self._offsets = view[offsets_start:self._strings_start].cast("I")
+        view.release()
+        logger.info(f"CEP index loaded with {count} entries")
+
+    def _ensure_loaded(self) -> bool:
+        """Abrir (ou reabrir após novo build) o índice; False se não existir"""
+        now = time.monotonic()
+        if now >= self._next_check:
+            self._next_check = now + RELOAD_CHECK_INTERVAL
+            try:
+                mtime = os.stat(self.path).st_mtime
+            except OSError:
+                self._file_mtime = None
+                self._close()
+                return False
+            if mtime != self._file_mtime:
+                try:
+                    self._open()
+                    self._file_mtime = mtime
+                except Exception as e:
+                    logger.error(f"Failed to load CEP index: {e}")
+                    self._close()
+                    self._file_mtime = None
+        return self._keys is not None
+
+    def lookup(self, cep_clean: str) -> Optional[Dict[str, Any]]:
+        """
+        Consultar CEP no índice
+
+        Args:
+            cep_clean: CEP com 8 dígitos
+
+        Returns:
+            Dicionário no formato da BrasilAPI (/address/v2) ou None se ausente
+        """
+        if len(cep_clean) != 8 or not cep_clean.isdigit() or not self._ensure_loaded():
+            return None
+
+        self.lookups += 1
+        key = int(cep_clean)
+        keys = self._keys
+        position = bisect_left(keys, key)
+        if position == len(keys) or keys[position] != key:
+            return None
+        self.hits += 1
+
+        start = self._strings_start + self._offsets[position]
+        end = self._strings_start + self._offsets[position + 1]
+        values = self._mmap[start:end].decode("utf-8").split(FIELD_SEPARATOR)
+
+        result = dict(zip(FIELDS, values))
+        result["cep"] = cep_clean
+        result["service"] = "offline_index"
+        return result
+
+    def stats(self) -> Dict[str, int]:
+        """Contadores do índice"""
+        return {
+            "available": int(self._keys is not None),
+            "entries": len(self._keys) if self._keys is not None else 0,
+            "lookups": self.lookups,
+            "hits": self.hits
+        }
+
+
+# Instância global do índice de CEPs
+cep_index = CEPIndex(settings.CEP_INDEX_PATH)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Índice offline de CEPs")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    build_cmd = commands.add_parser("build", help="Gerar o índice a partir de um CSV")
+    build_cmd.add_argument("--source", required=True, help="CSV com cep,state,city,neighborhood,street")
+    build_cmd.add_argument("--output", default=settings.CEP_INDEX_PATH, help="Arquivo do índice")
+    build_cmd.add_argument("--delimiter", default=",", help="Separador do CSV")
+
+    lookup_cmd = commands.add_parser("lookup", help="Consultar um CEP no índice")
+    lookup_cmd.add_argument("cep")
+
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+    if args.command == "build":
+        start = time.perf_counter()
+        count = build_index(args.source, args.output, args.delimiter)
+        print(f"Indexed {count} CEPs in {time.perf_counter() - start:.1f}s")
+    else:
+        start = time.perf_counter()
+        result = cep_index.lookup("".join(filter(str.isdigit, args.cep)))
+        elapsed_us = (time.perf_counter() - start) * 1e6
+        print(result)
+        print(f"Lookup took {elapsed_us:.0f} µs")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,243 @@
+"""
+Circuit breaker por host (fechado/aberto/meio-aberto) e timeouts adaptativos
+derivados do p99 da latência observada
+"""
+import logging
+import math
+import time
+from collections import deque
+from typing import Any, Dict, Optional
+from config import settings
+from http_clients import host_key
+from metrics import CIRCUIT_STATE, UPSTREAM_TIMEOUT
+
+logger = logging.getLogger(__name__)
+
+STATE_CLOSED = "closed"
+STATE_OPEN = "open"
+STATE_HALF_OPEN = "half_open"
+
+# Valor do estado no gauge de métricas
+STATE_VALUES = {STATE_CLOSED: 0, STATE_HALF_OPEN: 1, STATE_OPEN: 2}
+
+# Amostras mínimas antes de confiar no p99 e intervalo entre recálculos
+MIN_LATENCY_SAMPLES = 20
+RECALCULATE_EVERY = 10
+
+
+def _percentile(ordered: list, q: float) -> float:
+    """Percentil (nearest-rank) de uma lista já ordenada"""
+    return ordered[min(len(ordered) - 1, max(0, math.ceil(len(ordered) * q) - 1))]
+
+
+class CircuitBreaker:
+    """Estado de saúde de um host externo"""
+
+    def __init__(
+        self,
+        name: str,
+        window: int,
+        min_calls: int,
+        failure_rate: float,
+        open_seconds: float,
+        half_open_calls: int,
+        max_timeout: float,
+        min_timeout: float,
+        p99_multiplier: float,
+        adaptive_timeout: bool = True,
+        enabled: bool = True,
+        latency_window: int = 200
+    ):
+        """
+        Args:
+            name: Host monitorado (rótulo de logs e métricas)
+            window: Quantidade de chamadas recentes avaliadas
+            min_calls: Chamadas mínimas na janela antes de abrir o circuito
+            failure_rate: Fração de falhas (0 a 1) que abre o circuito
+            open_seconds: Tempo aberto antes de liberar sondas
+            half_open_calls: Sondas simultâneas permitidas no estado meio-aberto
+            max_timeout: Timeout máximo (e inicial) das chamadas
+            min_timeout: Timeout mínimo das chamadas
+            p99_multiplier: Folga aplicada sobre o p99 observado
+            adaptive_timeout: Ajustar o timeout pela latência observada
+            enabled: Abrir o circuito em falhas (False mantém apenas o timeout adaptativo)
+            latency_window: Latências recentes usadas no cálculo do p95/p99
+        """
+        self.name = name
+        self.min_calls = min_calls
+        self.failure_rate = failure_rate
+        self.open_seconds = open_seconds
+        self.half_open_calls = half_open_calls
+        self.max_timeout = max_timeout
+        self.min_timeout = min(min_timeout, max_timeout)
+        self.p99_multiplier = p99_multiplier
+        self.adaptive_timeout = adaptive_timeout
+        self.enabled = enabled
+
+        self.state = STATE_CLOSED
+        self._outcomes: deque = deque(maxlen=window)  # True = falha
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probes = 0
+        self._latencies: deque = deque(maxlen=latency_window)
+        self._since_recalculation = 0
+        self._timeout = max_timeout
+        self.p95: Optional[float] = None
+        self.rejected = 0
+        self.opened = 0
+
+        CIRCUIT_STATE.labels(name).set(STATE_VALUES[self.state])
+        UPSTREAM_TIMEOUT.labels(name).set(self._timeout)
+
+    def _transition(self, state: str) -> None:
+        if state == self.state:
+            return
+        logger.warning(f"Circuit breaker for {self.name}: {self.state} -> {state}")
+        self.state = state
+        CIRCUIT_STATE.labels(self.name).set(STATE_VALUES[state])
+
+        if state == STATE_OPEN:
+            self.opened += 1
+            self._opened_at = time.monotonic()
+        elif state == STATE_CLOSED:
+            self._outcomes.clear()
+            self._failures = 0
+        self._probes = 0
+
+    def allow(self) -> bool:
+        """
+        Verificar se uma chamada pode ser feita agora
+
+        Returns:
+            False se o circuito estiver aberto (falhar rápido)
+        """
+        if self.state == STATE_OPEN:
+            if time.monotonic() - self._opened_at < self.open_seconds:
+                self.rejected += 1
+                return False
+            self._transition(STATE_HALF_OPEN)
+
+        if self.state == STATE_HALF_OPEN:
+            if self._probes >= self.half_open_calls:
+                self.rejected += 1
+                return False
+            self._probes += 1
+
+        return True
+
+    def release(self) -> None:
+        """Devolver a permissão de uma chamada cancelada sem resultado"""
+        if self.state == STATE_HALF_OPEN and self._probes > 0:
+            self._probes -= 1
+
+    def _push(self, failed: bool) -> None:
+        if len(self._outcomes) == self._outcomes.maxlen and self._outcomes[0]:
+            self._failures -= 1
+        self._outcomes.append(failed)
+        self._failures += failed
+
+    def record_success(self, latency: float) -> None:
+        """
+        Registrar chamada bem-sucedida
+
+        Args:
+            latency: Duração da chamada em segundos
+        """
+        self._record_latency(latency)
+        if self.state == STATE_HALF_OPEN:
+            self._transition(STATE_CLOSED)
+        else:
+            self._push(False)
+
+    def record_failure(self, timed_out: bool = False) -> None:
+        """
+        Registrar falha (erro de rede, timeout ou 5xx)
+
+        Args:
+            timed_out: A chamada estourou o timeout (latência real >= timeout atual)
+        """
+        if timed_out:
+            # Amostra censurada: impede que o timeout adaptativo se feche sobre um upstream lento
+            self._record_latency(self._timeout)
+
+        if self.state == STATE_HALF_OPEN:
+            self._transition(STATE_OPEN)
+            return
+
+        self._push(True)
+        if self.enabled and len(self._outcomes) >= self.min_calls and \
+                self._failures / len(self._outcomes) >= self.failure_rate:
+            self._transition(STATE_OPEN)
+
+    def _record_latency(self, latency: float) -> None:
+        self._latencies.append(latency)
+        self._since_recalculation += 1
+        if self._since_recalculation < RECALCULATE_EVERY or len(self._latencies) < MIN_LATENCY_SAMPLES:
+            return
+
+        self._since_recalculation = 0
+        ordered = sorted(self._latencies)
+        self.p95 = _percentile(ordered, 0.95)
+        if self.adaptive_timeout:
+            p99 = _percentile(ordered, 0.99)
+            self._timeout = min(self.max_timeout, max(self.min_timeout, p99 * self.p99_multiplier))
+            UPSTREAM_TIMEOUT.labels(self.name).set(self._timeout)
+
+    def timeout(self) -> float:
+        """Timeout atual das chamadas ao host (segundos)"""
+        return self._timeout
+
+    def stats(self) -> Dict[str, Any]:
+        """Estado e contadores do circuito"""
+        return {
+            "state": self.state,
+            "calls": len(self._outcomes),
+            "failures": self._failures,
+            "timeout": round(self._timeout, 3),
+            "rejected": self.rejected,
+            "opened": self.opened
+        }
+
+
+class CircuitBreakerRegistry:
+    """Um circuit breaker por host (scheme://host), criado sob demanda"""
+
+    def __init__(self):
+        self._breakers: Dict[str, CircuitBreaker] = {}
+
+    def get(self, url: str) -> CircuitBreaker:
+        """
+        Obter o circuit breaker do host de uma URL
+
+        Args:
+            url: URL que será requisitada
+
+        Returns:
+            Circuit breaker do host
+        """
+        host = host_key(url)
+        breaker = self._breakers.get(host)
+        if breaker is None:
+            breaker = CircuitBreaker(
+                name=host,
+                window=settings.CIRCUIT_BREAKER_WINDOW,
+                min_calls=settings.CIRCUIT_BREAKER_MIN_CALLS,
+                failure_rate=settings.CIRCUIT_BREAKER_FAILURE_RATE,
+                open_seconds=settings.CIRCUIT_BREAKER_OPEN_SECONDS,
+                half_open_calls=settings.CIRCUIT_BREAKER_HALF_OPEN_CALLS,
+                max_timeout=settings.HTTP_TIMEOUT,
+                min_timeout=settings.HTTP_MIN_TIMEOUT,
+                p99_multiplier=settings.HTTP_TIMEOUT_P99_MULTIPLIER,
+                adaptive_timeout=settings.HTTP_ADAPTIVE_TIMEOUT,
+                enabled=settings.CIRCUIT_BREAKER_ENABLED
+            )
+            self._breakers[host] = breaker
+        return breaker
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """Estado de todos os hosts conhecidos"""
+        return {host: breaker.stats() for host, breaker in self._breakers.items()}
+
+
+# Instância global dos circuit breakers
+circuit_breakers = CircuitBreakerRegistry()
@@ -0,0 +1,438 @@
+"""
+Base offline de CNPJ a partir dos dados abertos da Receita Federal
+
+Importação (arquivos .zip baixados de dados.gov.br / arquivos.receitafederal.gov.br):
+    python -m cnpj_store import --source /dados/receita --output data/cnpj.sqlite3
+
+Consulta de teste:
+    python -m cnpj_store lookup 00000000000191
+"""
+import argparse
+import csv
+import glob
+import io
+import logging
+import os
+import sqlite3
+import threading
+import time
+import zipfile
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, Optional
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+# Linhas por INSERT em lote durante a importação
+IMPORT_BATCH_SIZE = 50000
+
+# Intervalo entre verificações de troca do arquivo (nova importação)
+RELOAD_CHECK_INTERVAL = 60
+
+SITUACOES = {"01": "NULA", "02": "ATIVA", "03": "SUSPENSA", "04": "INAPTA", "08": "BAIXADA"}
+PORTES = {"00": "NÃO INFORMADO", "01": "MICRO EMPRESA", "03": "EMPRESA DE PEQUENO PORTE", "05": "DEMAIS"}
+MATRIZ_FILIAL = {"1": "MATRIZ", "2": "FILIAL"}
+FAIXAS_ETARIAS = {
+    "0": "Não se Aplica", "1": "Entre 0 a 12 anos", "2": "Entre 13 a 20 anos",
+    "3": "Entre 21 a 30 anos", "4": "Entre 31 a 40 anos", "5": "Entre 41 a 50 anos",
+    "6": "Entre 51 a 60 anos", "7": "Entre 61 a 70 anos", "8": "Entre 71 a 80 anos",
+    "9": "Maiores de 80 anos"
+}
+
+SCHEMA = """
+CREATE TABLE empresas (
+    cnpj_basico INTEGER PRIMARY KEY,
+    razao_social TEXT,
+    natureza_juridica TEXT,
+    capital_social REAL,
+    porte TEXT
+);
+CREATE TABLE estabelecimentos (
+    cnpj INTEGER PRIMARY KEY,
+    matriz_filial TEXT,
+    nome_fantasia TEXT,
+    situacao TEXT,
+    data_situacao TEXT,
+    motivo_situacao TEXT,
+    data_inicio_atividade TEXT,
+    cnae_principal TEXT,
+    cnaes_secundarios TEXT,
+    tipo_logradouro TEXT,
+    logradouro TEXT,
+    numero TEXT,
+    complemento TEXT,
+    bairro TEXT,
+    cep TEXT,
+    uf TEXT,
+    municipio TEXT,
+    telefone_1 TEXT,
+    telefone_2 TEXT,
+    email TEXT
+);
+CREATE TABLE socios (
+    cnpj_basico INTEGER,
+    identificador TEXT,
+    nome TEXT,
+    qualificacao TEXT,
+    data_entrada TEXT,
+    faixa_etaria TEXT
+);
+CREATE TABLE cnaes (codigo TEXT PRIMARY KEY, descricao TEXT) WITHOUT ROWID;
+CREATE TABLE municipios (codigo TEXT PRIMARY KEY, descricao TEXT) WITHOUT ROWID;
+CREATE TABLE naturezas (codigo TEXT PRIMARY KEY, descricao TEXT) WITHOUT ROWID;
+CREATE TABLE qualificacoes (codigo TEXT PRIMARY KEY, descricao TEXT) WITHOUT ROWID;
+CREATE TABLE motivos (codigo TEXT PRIMARY KEY, descricao TEXT) WITHOUT ROWID;
+CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT) WITHOUT ROWID;
+"""
+
+# Índices criados depois da carga (mais rápido que mantê-los durante os INSERTs)
+POST_IMPORT_INDEXES = "CREATE INDEX ix_socios_cnpj_basico ON socios (cnpj_basico);"
+
+
+def _iter_zip_rows(pattern: str) -> Iterator[List[str]]:
+    """Ler, sem descompactar em disco, as linhas de todos os .zip do padrão"""
+    for path in sorted(glob.glob(pattern)):
+        logger.info(f"Importing {os.path.basename(path)}")
+        with zipfile.ZipFile(path) as archive:
+            for member in archive.namelist():
+                with archive.open(member) as raw:
+                    text = io.TextIOWrapper(raw, encoding="latin-1", newline="")
+                    yield from csv.reader(text, delimiter=";", quotechar='"')
+
+
+def _date(value: str) -> Optional[str]:
+    """AAAAMMDD -> AAAA-MM-DD (None para datas vazias ou zeradas)"""
+    if len(value) != 8 or value == "00000000":
+        return None
+    return f"{value[0:4]}-{value[4:6]}-{value[6:8]}"
+
+
+def _phone(ddd: str, number: str) -> Optional[str]:
+    ddd, number = ddd.strip(), number.strip()
+    return f"{ddd}{number}" if number else None
+
+
+def _insert_batches(conn: sqlite3.Connection, sql: str, rows: Iterator[tuple]) -> int:
+    """Gravar linhas em lotes; retorna o total gravado"""
+    total = 0
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= IMPORT_BATCH_SIZE:
+            conn.executemany(sql, batch)
+            total += len(batch)
+            batch.clear()
+    if batch:
+        conn.executemany(sql, batch)
+        total += len(batch)
+    return total
+
+
+def import_receita(source_dir: str, output_path: str) -> Dict[str, int]:
+    """
+    Importar os .zip da Receita Federal para um arquivo SQLite novo
+
+    O arquivo é montado ao lado do destino e trocado atomicamente no final,
+    então os processos em execução continuam lendo a versão anterior até recarregar.
+
+    Args:
+        source_dir: Diretório com Empresas*.zip, Estabelecimentos*.zip, Socios*.zip, Cnaes.zip etc.
+        output_path: Caminho final do banco SQLite
+
+    Returns:
+        Quantidade de linhas importadas por tabela
+    """
+    directory = os.path.dirname(os.path.abspath(output_path))
+    os.makedirs(directory, exist_ok=True)
+    tmp_path = f"{output_path}.importing"
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+
+    conn = sqlite3.connect(tmp_path)
+    conn.execute("PRAGMA journal_mode = OFF")
+    conn.execute("PRAGMA synchronous = OFF")
+    conn.execute("PRAGMA page_size = 8192")
+    conn.executescript(SCHEMA)
+
+    pattern = lambda name: os.path.join(source_dir, name)  # noqa: E731
+    counts = {}
+
+    for table, name in (
+        ("cnaes", "*Cnaes*.zip"),
+        ("municipios", "*Municipios*.zip"),
+        ("naturezas", "*Naturezas*.zip"),
+        ("qualificacoes", "*Qualificacoes*.zip"),
+        ("motivos", "*Motivos*.zip"),
+    ):
+        counts[table] = _insert_batches(
+            conn,
+            f"INSERT OR REPLACE INTO {table} VALUES (?, ?)",
+            ((row[0], row[1]) for row in _iter_zip_rows(pattern(name)) if len(row) >= 2)
+        )
+
+    counts["empresas"] = _insert_batches(
+        conn,
+        "INSERT OR REPLACE INTO empresas VALUES (?, ?, ?, ?, ?)",
+        (
+            (
+                int(row[0]),
+                row[1],
+                row[2],
+                float(row[4].replace(",", ".") or 0),
+                row[5]
+            )
+            for row in _iter_zip_rows(pattern("*Empresas*.zip")) if len(row) >= 6
+        )
+    )
+
+    counts["estabelecimentos"] = _insert_batches(
+        conn,
+        "INSERT OR REPLACE INTO estabelecimentos VALUES "
+        "(?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+        (
+            (
+                int(row[0] + row[1] + row[2]),
+                row[3],
+                row[4],
+                row[5],
+                _date(row[6]),
+                row[7],
+                _date(row[10]),
+                row[11],
+                row[12],
+                row[13],
+                row[14],
+                row[15],
+                row[16],
+                row[17],
+                row[18],
+                row[19],
+                row[20],
+                _phone(row[21], row[22]),
+                _phone(row[23], row[24]),
+                row[27].lower() or None
+            )
+            for row in _iter_zip_rows(pattern("*Estabelecimentos*.zip")) if len(row) >= 28
+        )
+    )
+
+    counts["socios"] = _insert_batches(
+        conn,
+        "INSERT INTO socios VALUES (?, ?, ?, ?, ?, ?)",
+        (
+            (int(row[0]), row[1], row[2], row[4], _date(row[5]), row[10])
+            for row in _iter_zip_rows(pattern("*Socios*.zip")) if len(row) >= 11
+        )
+    )
+
+    conn.executescript(POST_IMPORT_INDEXES)
+    conn.execute(
+        "INSERT INTO meta VALUES ('imported_at', ?)", (datetime.utcnow().isoformat(),)
+    )
+    conn.commit()
+    conn.execute("VACUUM")
+    conn.close()
+
+    os.replace(tmp_path, output_path)
+    logger.info(f"CNPJ offline store imported: {counts}")
+    return counts
+
+
+class OfflineCNPJStore:
+    """Consultas somente leitura na base offline (uma conexão por thread)"""
+
+    def __init__(self, path: str, max_age_days: int):
+        """
+        Args:
+            path: Caminho do banco SQLite gerado por import_receita
+            max_age_days: Idade máxima da importação antes de preferir a BrasilAPI
+        """
+        self.path = path
+        self.max_age = max_age_days * 86400
+        self._local = threading.local()
+        self._file_mtime: Optional[float] = None
+        self._imported_at: Optional[float] = None
+        self._next_check = 0.0
+        self.lookups = 0
+        self.hits = 0
+
+    def _connection(self) -> Optional[sqlite3.Connection]:
+        """Conexão da thread atual, reaberta quando o arquivo é substituído"""
+        now = time.monotonic()
+        if now >= self._next_check:
+            self._next_check = now + RELOAD_CHECK_INTERVAL
+            try:
+                mtime = os.stat(self.path).st_mtime
+            except OSError:
+                self._file_mtime = None
+                return None
+            if mtime != self._file_mtime:
+                self._file_mtime = mtime
+                self._imported_at = None
+        if self._file_mtime is None:
+            return None
+
+        conn = getattr(self._local, "conn", None)
+        if conn is None or getattr(self._local, "mtime", None) != self._file_mtime:
+            if conn is not None:
+                conn.close()
+            conn = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True, check_same_thread=False)
+            conn.row_factory = sqlite3.Row
+            self._local.conn = conn
+            self._local.mtime = self._file_mtime
+            if self._imported_at is None:
+                row = conn.execute("SELECT value FROM meta WHERE key = 'imported_at'").fetchone()
+                self._imported_at = datetime.fromisoformat(row[0]).timestamp() if row else 0.0
+        return conn
+
+    @property
+    def available(self) -> bool:
+        """Base offline presente no disco"""
+        return self._connection() is not None
+
+    def is_stale(self) -> bool:
+        """Importação mais antiga que a idade máxima configurada"""
+        if self._imported_at is None:
+            return True
+        return time.time() - self._imported_at > self.max_age
+
+    def lookup(self, cnpj_clean: str) -> Optional[Dict[str, Any]]:
+        """
+        Consultar CNPJ na base offline
+
+        Args:
+            cnpj_clean: CNPJ com 14 dígitos
+
+        Returns:
+            Dicionário no formato da BrasilAPI (/cnpj/v1) ou None se ausente
+        """
+        conn = self._connection()
+        if conn is None or len(cnpj_clean) != 14 or not cnpj_clean.isdigit():
+            return None
+
+        self.lookups += 1
+        row = conn.execute(
+            "SELECT e.*, emp.razao_social, emp.natureza_juridica, emp.capital_social, emp.porte, "
+            "cnae.descricao AS cnae_descricao, mun.descricao AS municipio_nome, "
+            "nat.descricao AS natureza_descricao, mot.descricao AS motivo_descricao "
+            "FROM estabelecimentos e "
+            "LEFT JOIN empresas emp ON emp.cnpj_basico = e.cnpj / 1000000 "
+            "LEFT JOIN cnaes cnae ON cnae.codigo = e.cnae_principal "
+            "LEFT JOIN municipios mun ON mun.codigo = e.municipio "
+            "LEFT JOIN naturezas nat ON nat.codigo = emp.natureza_juridica "
+            "LEFT JOIN motivos mot ON mot.codigo = e.motivo_situacao "
+            "WHERE e.cnpj = ?",
+            (int(cnpj_clean),)
+        ).fetchone()
+        if row is None:
+            return None
+        self.hits += 1
+
+        secundarios = [code for code in (row["cnaes_secundarios"] or "").split(",") if code]
+        cnae_names = {}
+        if secundarios:
+            placeholders = ",".join("?" * len(secundarios))
+            cnae_names = dict(conn.execute(
+                f"SELECT codigo, descricao FROM cnaes WHERE codigo IN ({placeholders})", secundarios
+            ).fetchall())
+
+        socios = conn.execute(
+            "SELECT s.identificador, s.nome, s.data_entrada, s.faixa_etaria, "
+            "s.qualificacao, q.descricao AS qualificacao_descricao "
+            "FROM socios s LEFT JOIN qualificacoes q ON q.codigo = s.qualificacao "
+            "WHERE s.cnpj_basico = ?",
+            (int(cnpj_clean[:8]),)
+        ).fetchall()
+
+        return {
+            "cnpj": cnpj_clean,
+            "razao_social": row["razao_social"],
+            "nome_fantasia": row["nome_fantasia"],
+            "identificador_matriz_filial": row["matriz_filial"],
+            "descricao_identificador_matriz_filial": MATRIZ_FILIAL.get(row["matriz_filial"]),
+            "situacao_cadastral": row["situacao"],
+            "descricao_situacao_cadastral": SITUACOES.get((row["situacao"] or "").zfill(2)),
+            "data_situacao_cadastral": row["data_situacao"],
+            "motivo_situacao_cadastral": row["motivo_situacao"],
+            "descricao_motivo_situacao_cadastral": row["motivo_descricao"],
+            "data_inicio_atividade": row["data_inicio_atividade"],
+            "cnae_fiscal": row["cnae_principal"],
+            "cnae_fiscal_descricao": row["cnae_descricao"],
+            "cnaes_secundarios": [
+                {"codigo": code, "descricao": cnae_names.get(code)} for code in secundarios
+            ],
+            "codigo_natureza_juridica": row["natureza_juridica"],
+            "natureza_juridica": row["natureza_descricao"],
+            "capital_social": row["capital_social"],
+            "porte": PORTES.get(row["porte"], row["porte"]),
+            "descricao_tipo_de_logradouro": row["tipo_logradouro"],
+            "logradouro": row["logradouro"],
+            "numero": row["numero"],
+            "complemento": row["complemento"],
+            "bairro": row["bairro"],
+            "cep": row["cep"],
+            "uf": row["uf"],
+            "codigo_municipio": row["municipio"],
+            "municipio": row["municipio_nome"],
+            "ddd_telefone_1": row["telefone_1"],
+            "ddd_telefone_2": row["telefone_2"],
+            "email": row["email"],
+            "qsa": [
+                {
+                    "identificador_de_socio": socio["identificador"],
+                    "nome_socio": socio["nome"],
+                    "codigo_qualificacao_socio": socio["qualificacao"],
+                    "qualificacao_socio": socio["qualificacao_descricao"],
+                    "data_entrada_sociedade": socio["data_entrada"],
+                    "faixa_etaria": FAIXAS_ETARIAS.get(socio["faixa_etaria"])
+                }
+                for socio in socios
+            ],
+            "fonte": "receita_federal_offline"
+        }
+
+    def stats(self) -> Dict[str, Any]:
+        """Contadores da base offline"""
+        return {
+            "available": int(self._file_mtime is not None),
+            "stale": int(self.is_stale()),
+            "lookups": self.lookups,
+            "hits": self.hits
+        }
+
+
+# Instância global da base offline
+cnpj_store = OfflineCNPJStore(
+    path=settings.CNPJ_OFFLINE_DB_PATH,
+    max_age_days=settings.CNPJ_OFFLINE_MAX_AGE_DAYS
+)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Base offline de CNPJ (Receita Federal)")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    import_cmd = commands.add_parser("import", help="Importar os .zip da Receita Federal")
+    import_cmd.add_argument("--source", required=True, help="Diretório com os arquivos .zip")
+    import_cmd.add_argument("--output", default=settings.CNPJ_OFFLINE_DB_PATH, help="Banco SQLite gerado")
+
+    lookup_cmd = commands.add_parser("lookup", help="Consultar um CNPJ na base offline")
+    lookup_cmd.add_argument("cnpj")
+
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+    if args.command == "import":
+        start = time.perf_counter()
+        counts = import_receita(args.source, args.output)
+        print(f"Imported {counts} in {time.perf_counter() - start:.0f}s")
+    else:
+        start = time.perf_counter()
+        result = cnpj_store.lookup("".join(filter(str.isdigit, args.cnpj)))
+        elapsed_us = (time.perf_counter() - start) * 1e6
+        print(result)
+        print(f"Lookup took {elapsed_us:.0f} µs")
+
+
+if __name__ == "__main__":
+    main()
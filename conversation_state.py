@@ -0,0 +1,240 @@
+"""
+Estado da conversa por usuário (ex.: aguardando CNPJ depois de /consulta_cnpj)
+
+Fica em um hash no Redis com expiração (conversation:{plataforma}:{usuário}) e em
+um LRU local com escrita direta. Cada gravação publica uma invalidação no mesmo
+round trip; os demais workers descartam a cópia local ao recebê-la. Enquanto a
+inscrição não estiver ativa, as leituras vão ao Redis.
+"""
+import asyncio
+import logging
+import time
+import uuid
+from typing import Dict, Optional
+from config import settings
+from cache import CacheEntry, LRUCache
+from metrics import observe_redis
+from security import async_redis_blocking_client, async_redis_client
+
+logger = logging.getLogger(__name__)
+
+INVALIDATION_CHANNEL = "conversation_state:invalidate"
+
+
+class ConversationStateStore:
+    """Estado da conversa com cache local coerente entre workers"""
+
+    def __init__(
+        self,
+        redis_client,
+        ttl: int,
+        local_max_size: int,
+        retry_interval: float = 5.0,
+        pubsub_client=None
+    ):
+        """
+        Args:
+            redis_client: Cliente redis.asyncio (None guarda o estado só em memória)
+            ttl: Segundos sem mensagens até a conversa voltar ao estado inicial
+            local_max_size: Conversas mantidas no LRU local
+            retry_interval: Segundos usando só o LRU local após uma falha do Redis
+            pubsub_client: Cliente sem socket_timeout para a escuta das
+                invalidações (padrão: redis_client)
+        """
+        self.redis_client = redis_client
+        self.pubsub_client = pubsub_client or redis_client
+        self.ttl = ttl
+        self.local_max_size = local_max_size
+        self.local = LRUCache(local_max_size)
+        self.retry_interval = retry_interval
+        self._retry_at = 0.0
+        self.worker_id = uuid.uuid4().hex
+        self._subscribed = False
+        self._task: Optional[asyncio.Task] = None
+        # Incrementado a cada escrita/invalidação: leituras do Redis iniciadas
+        # antes dela não entram no LRU local
+        self._generation = 0
+        self.local_hits = 0
+        self.redis_reads = 0
+        self.writes = 0
+        self.invalidations = 0
+        self.redis_errors = 0
+
+    @staticmethod
+    def _key(platform: str, user_id: str) -> str:
+        return f"conversation:{platform}:{user_id}"
+
+    def _redis_available(self) -> bool:
+        """Redis configurado e sem falha dentro de retry_interval"""
+        return self.redis_client is not None and time.monotonic() >= self._retry_at
+
+    def _redis_failed(self, action: str, error: Exception) -> None:
+        self.redis_errors += 1
+        self._retry_at = time.monotonic() + self.retry_interval
+        logger.error(f"Failed to {action} conversation state: {error}")
+
+    def _cache(self, key: str, state: Dict[str, str]) -> None:
+        expires_at = time.time() + self.ttl
+        self.local.set(key, CacheEntry(state, expires_at, expires_at))
+
+    async def get(self, platform: str, user_id: str) -> Dict[str, str]:
+        """
+        Ler o estado da conversa
+
+        Args:
+            platform: "telegram" ou "whatsapp"
+            user_id: ID do usuário na plataforma
+
+        Returns:
+            Campos do estado (vazio se a conversa expirou ou nunca começou)
+        """
+        key = self._key(platform, user_id)
+        now = time.time()
+
+        # Cópia local só é confiável com as invalidações chegando (ou sem Redis)
+        if self._subscribed or self.redis_client is None:
+            entry = self.local.get(key, now)
+            if entry is not None:
+                self.local_hits += 1
+                return dict(entry.value)
+            if self.redis_client is None:
+                return {}
+
+        # Redis fora há pouco: cópia local (se houver) sem pagar o timeout
+        if not self._redis_available():
+            entry = self.local.get(key, now)
+            return dict(entry.value) if entry is not None else {}
+
+        generation = self._generation
+        try:
+            with observe_redis("conversation_get"):
+                state = await self.redis_client.hgetall(key)
+            self.redis_reads += 1
+        except Exception as e:
+            self._redis_failed("read", e)
+            entry = self.local.get(key, now)
+            return dict(entry.value) if entry is not None else {}
+
+        if generation == self._generation:
+            self._cache(key, state)
+        return dict(state)
+
+    async def set(self, platform: str, user_id: str, state: Dict[str, str]) -> None:
+        """
+        Substituir o estado da conversa (uma ida ao Redis: grava, expira e invalida)
+
+        Args:
+            platform: "telegram" ou "whatsapp"
+            user_id: ID do usuário na plataforma
+            state: Novos campos do estado (vazio encerra a conversa)
+        """
+        key = self._key(platform, user_id)
+        self._generation += 1
+        self._cache(key, dict(state))
+        self.writes += 1
+        if not self._redis_available():
+            return
+
+        try:
+            pipe = self.redis_client.pipeline(transaction=True)
+            pipe.delete(key)
+            if state:
+                pipe.hset(key, mapping=state)
+                pipe.expire(key, self.ttl)
+            pipe.publish(INVALIDATION_CHANNEL, f"{key}|{self.worker_id}")
+            with observe_redis("conversation_set"):
+                await pipe.execute()
+        except Exception as e:
+            self._redis_failed("write", e)
+
+    async def touch(self, platform: str, user_id: str, state: Dict[str, str]) -> None:
+        """
+        Renovar a expiração de uma conversa ativa cujo estado não mudou
+
+        Args:
+            platform: "telegram" ou "whatsapp"
+            user_id: ID do usuário na plataforma
+            state: Estado atual (mantido no LRU local com o novo prazo)
+        """
+        key = self._key(platform, user_id)
+        if self.local.get(key, time.time()) is not None:
+            self._cache(key, dict(state))
+        if not self._redis_available():
+            return
+
+        try:
+            with observe_redis("conversation_touch"):
+                await self.redis_client.expire(key, self.ttl)
+        except Exception as e:
+            self._redis_failed("refresh", e)
+
+    async def _listen(self) -> None:
+        """Descartar do LRU local as conversas alteradas por outros workers"""
+        while True:
+            pubsub = self.pubsub_client.pubsub()
+            try:
+                await pubsub.subscribe(INVALIDATION_CHANNEL)
+                # Entradas lidas antes da inscrição podem ter perdido invalidações
+                self.local = LRUCache(self.local_max_size)
+                self._generation += 1
+                self._subscribed = True
+                async for message in pubsub.listen():
+                    if message.get("type") != "message":
+                        continue
+                    key, _, origin = message["data"].rpartition("|")
+                    if origin != self.worker_id:
+                        self._generation += 1
+                        self.local.delete(key)
+                        self.invalidations += 1
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Conversation state invalidation channel failed: {e}")
+            finally:
+                # Invalidações perdidas: o LRU deixa de ser confiável
+                if self._subscribed:
+                    self._subscribed = False
+                    self._generation += 1
+                    self.local = LRUCache(self.local_max_size)
+                try:
+                    await pubsub.aclose()
+                except Exception:
+                    pass
+            await asyncio.sleep(1)
+
+    async def start(self) -> None:
+        """Iniciar a escuta das invalidações"""
+        if self.redis_client is not None and self._task is None:
+            self._task = asyncio.create_task(self._listen())
+
+    async def stop(self) -> None:
+        """Parar a escuta das invalidações"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def stats(self) -> Dict[str, int]:
+        """Contadores do estado de conversa"""
+        return {
+            "size": len(self.local),
+            "subscribed": int(self._subscribed),
+            "local_hits": self.local_hits,
+            "redis_reads": self.redis_reads,
+            "writes": self.writes,
+            "invalidations": self.invalidations,
+            "redis_errors": self.redis_errors
+        }
+
+
+# Instância global do estado de conversa
+conversation_state = ConversationStateStore(
+    async_redis_client,
+    ttl=settings.CONVERSATION_STATE_TTL,
+    local_max_size=settings.CONVERSATION_STATE_LOCAL_MAX_SIZE,
+    retry_interval=settings.REDIS_RETRY_INTERVAL,
+    pubsub_client=async_redis_blocking_client
+)
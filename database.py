@@ -2,24 +2,79 @@
 Configuração e gerenciamento do banco de dados
 """
 import logging
+from typing import AsyncIterator
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker, Session
-from sqlalchemy.pool import NullPool
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
 from config import settings
+from metrics import instrument_engine
 from models import Base
+from partitions import PartitionMaintenance, ensure_query_log_partitions
 
 logger = logging.getLogger(__name__)
 
-# Criar engine
+# Parâmetros do pool de conexões (QueuePool)
+POOL_OPTIONS = {
+    "pool_size": settings.DB_POOL_SIZE,
+    "max_overflow": settings.DB_MAX_OVERFLOW,
+    "pool_pre_ping": settings.DB_POOL_PRE_PING,
+    "pool_recycle": settings.DB_POOL_RECYCLE,
+    "pool_timeout": settings.DB_POOL_TIMEOUT,
+}
+
+
+def get_async_database_url(url: str) -> str:
+    """
+    Converter a URL do PostgreSQL para o driver asyncpg
+    
+    Args:
+        url: URL síncrona (postgresql:// ou postgresql+psycopg2://)
+        
+    Returns:
+        URL com o driver postgresql+asyncpg
+    """
+    for prefix in ("postgresql+psycopg2://", "postgresql://", "postgres://"):
+        if url.startswith(prefix):
+            return "postgresql+asyncpg://" + url[len(prefix):]
+    return url
+
+
+# Criar engine (uso síncrono: criação de tabelas e rotinas administrativas)
 engine = create_engine(
     settings.DATABASE_URL,
-    poolclass=NullPool,
-    echo=settings.DEBUG
+    echo=settings.DEBUG,
+    **POOL_OPTIONS
 )
 
 # Criar session factory
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# Criação antecipada e retenção das partições de query_logs
+partition_maintenance = PartitionMaintenance(
+    engine,
+    interval=settings.PARTITION_MAINTENANCE_INTERVAL,
+    months_ahead=settings.QUERY_LOG_PARTITIONS_AHEAD,
+    retention_months=settings.QUERY_LOG_RETENTION_MONTHS
+)
+
+# Engine assíncrona (caminho quente dos handlers)
+async_engine = create_async_engine(
+    settings.ASYNC_DATABASE_URL or get_async_database_url(settings.DATABASE_URL),
+    echo=settings.DEBUG,
+    **POOL_OPTIONS
+)
+
+# Criar session factory assíncrona
+AsyncSessionLocal = async_sessionmaker(
+    async_engine,
+    autoflush=False,
+    expire_on_commit=False
+)
+
+# Duração dos comandos SQL nas métricas
+instrument_engine(engine, "sync")
+instrument_engine(async_engine.sync_engine, "async")
+
 
 def get_db() -> Session:
     """Obter sessão de banco de dados"""
@@ -30,10 +85,18 @@ def get_db() -> Session:
         db.close()
 
 
+async def get_async_db() -> AsyncIterator[AsyncSession]:
+    """Obter sessão assíncrona de banco de dados"""
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
 def init_db():
     """Inicializar banco de dados"""
     try:
         Base.metadata.create_all(bind=engine)
+        if engine.dialect.name == "postgresql":
+            ensure_query_log_partitions(engine, settings.QUERY_LOG_PARTITIONS_AHEAD)
         logger.info("Database initialized successfully")
     except Exception as e:
         logger.error(f"Failed to initialize database: {e}")
@@ -44,3 +107,9 @@ def close_db():
     """Fechar conexão com banco de dados"""
     engine.dispose()
     logger.info("Database connection closed")
+
+
+async def close_async_db():
+    """Fechar pool de conexões assíncronas"""
+    await async_engine.dispose()
+    logger.info("Async database pool closed")
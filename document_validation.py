@@ -0,0 +1,86 @@
+"""
+Validação em lote de CPF/CNPJ (dígitos verificadores módulo 11) com NumPy
+
+Os documentos viram uma matriz de dígitos (um documento por linha) e os dois
+dígitos verificadores são calculados para todas as linhas com produtos matriciais.
+Sem NumPy, usa a validação escalar de security.
+"""
+from typing import Iterable, List
+from security import CNPJ_WEIGHTS, CPF_WEIGHTS, only_digits, validate_cnpj, validate_cpf
+
+# NumPy é opcional (a validação escalar continua disponível)
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    np = None
+    NUMPY_AVAILABLE = False
+
+
+def _digit_matrix(documents: Iterable[str], size: int):
+    """
+    Converter documentos em matriz (n, size) de dígitos
+
+    Returns:
+        Tupla (matriz uint8, máscara de documentos com o tamanho correto)
+    """
+    # Somente dígitos ASCII: o dtype "S" não codifica outros caracteres
+    cleaned = [only_digits(document) for document in documents]
+    lengths = np.fromiter((len(document) for document in cleaned), dtype=np.int64, count=len(cleaned))
+    # dtype "S<size>" corta ou completa com \\x00; a máscara de tamanho descarta esses casos
+    raw = np.array(cleaned, dtype=f"S{size}")
+    if raw.size == 0:
+        return np.zeros((0, size), dtype=np.uint8), lengths == size
+    digits = raw.view(np.uint8).reshape(-1, size) - ord("0")
+    return digits, lengths == size
+
+
+def _check_digits(digits, weights: tuple):
+    """Dígito verificador de cada linha para os pesos informados"""
+    remainder = (digits[:, :len(weights)].astype(np.int32) @ np.array(weights, dtype=np.int32)) % 11
+    return np.where(remainder < 2, 0, 11 - remainder)
+
+
+def _validate_batch(documents: Iterable[str], size: int, weights: tuple):
+    digits, valid = _digit_matrix(documents, size)
+    if digits.shape[0] == 0:
+        return valid
+
+    # Dígitos fora de 0-9 (preenchimento \\x00) aparecem como valores > 9 em uint8
+    valid &= (digits <= 9).all(axis=1)
+    valid &= ~(digits == digits[:, :1]).all(axis=1)
+    valid &= _check_digits(digits, weights[0]) == digits[:, size - 2]
+    valid &= _check_digits(digits, weights[1]) == digits[:, size - 1]
+    return valid
+
+
+def validate_cpfs(documents: Iterable[str]) -> List[bool]:
+    """
+    Validar vários CPFs de uma vez
+
+    Args:
+        documents: CPFs (com ou sem formatação)
+
+    Returns:
+        Lista com o resultado de cada CPF, na mesma ordem
+    """
+    documents = list(documents)
+    if not NUMPY_AVAILABLE:
+        return [validate_cpf(document or "") for document in documents]
+    return _validate_batch(documents, 11, CPF_WEIGHTS).tolist()
+
+
+def validate_cnpjs(documents: Iterable[str]) -> List[bool]:
+    """
+    Validar vários CNPJs de uma vez
+
+    Args:
+        documents: CNPJs (com ou sem formatação)
+
+    Returns:
+        Lista com o resultado de cada CNPJ, na mesma ordem
+    """
+    documents = list(documents)
+    if not NUMPY_AVAILABLE:
+        return [validate_cnpj(document or "") for document in documents]
+    return _validate_batch(documents, 14, CNPJ_WEIGHTS).tolist()
@@ -2,24 +2,274 @@
 Módulo para integração com APIs externas brasileiras
 """
 import logging
+import hashlib
 import httpx
 import asyncio
-from typing import Optional, Dict, Any
+import time
+from typing import Optional, Dict, Any, Awaitable, Callable
 from config import settings
+from http_clients import http_clients
+from circuit_breaker import circuit_breakers
+from retry import (
+    RETRYABLE_ERRORS, RETRYABLE_STATUS, RetryBudget, retry_after_seconds, retry_budgets, retry_policy
+)
+from cache import TieredCache
+from cep_index import cep_index
+from cnpj_store import cnpj_store
+from upstream_scheduler import (
+    UpstreamQuotaScheduler, brasil_api_quota, portal_transparencia_quota, data_breach_quota
+)
+from metrics import UPSTREAM_HEDGES, UPSTREAM_LATENCY, UPSTREAM_RETRIES, status_label
+from security import only_digits, redis_client
 
 logger = logging.getLogger(__name__)
 
 
-class BrasilAPIClient:
+class UpstreamError(Exception):
+    """Erro transitório do serviço externo (não deve ser cacheado)"""
+
+
+class CircuitOpenError(UpstreamError):
+    """Upstream marcado como indisponível pelo circuit breaker (falha rápida)"""
+
+
+class SingleFlight:
+    """
+    Agrupa chamadas idênticas simultâneas: enquanto uma consulta ao upstream
+    estiver em andamento, as demais com a mesma chave aguardam o mesmo resultado
+    """
+    
+    def __init__(self):
+        self._in_flight: Dict[str, asyncio.Task] = {}
+        self.calls = 0
+        self.coalesced = 0
+    
+    async def do(self, key: str, func: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Executar func uma única vez por chave em andamento
+        
+        Args:
+            key: Chave normalizada da consulta
+            func: Corrotina que consulta o upstream
+            
+        Returns:
+            Resultado compartilhado da consulta
+        """
+        self.calls += 1
+        task = self._in_flight.get(key)
+        
+        if task is not None:
+            self.coalesced += 1
+        else:
+            task = asyncio.create_task(func())
+            self._in_flight[key] = task
+            task.add_done_callback(lambda _: self._in_flight.pop(key, None))
+        
+        # shield: o cancelamento de um chamador não cancela a consulta dos demais
+        return await asyncio.shield(task)
+    
+    def stats(self) -> Dict[str, int]:
+        """Métricas de chamadas agrupadas"""
+        return {
+            "calls": self.calls,
+            "coalesced": self.coalesced,
+            "in_flight": len(self._in_flight)
+        }
+
+
+def email_key(email: str) -> str:
+    """Chave de agrupamento para email (hash, sem expor o endereço)"""
+    return hashlib.sha256(email.strip().lower().encode()).hexdigest()
+
+
+# Agrupamento de consultas idênticas em andamento
+singleflight = SingleFlight()
+
+# Cache de resultados de CNPJ compartilhado entre workers via Redis
+cnpj_cache = TieredCache(
+    name="cnpj",
+    max_size=settings.CNPJ_CACHE_MAX_SIZE,
+    ttl=settings.CNPJ_CACHE_TTL,
+    stale_ttl=settings.CNPJ_CACHE_STALE_TTL,
+    negative_ttl=settings.CNPJ_CACHE_NEGATIVE_TTL,
+    redis_client=redis_client,
+    error_ttl=settings.CNPJ_CACHE_STALE_IF_ERROR_TTL
+)
+
+
+class BaseAPIClient:
+    """Base dos clientes externos: requisições pelo pool HTTP compartilhado"""
+    
+    def __init__(self, name: str, base_url: str, quota: Optional[UpstreamQuotaScheduler] = None):
+        self.name = name
+        self.base_url = base_url
+        # Cota da chave de API (None = upstream sem limite por chave)
+        self.quota = quota
+    
+    async def _attempt(self, url: str, operation: str, **kwargs) -> httpx.Response:
+        """
+        Executar uma tentativa de GET reutilizando as conexões do host
+        
+        Args:
+            url: URL completa
+            operation: Método do cliente que originou a chamada (rótulo das métricas)
+            **kwargs: Argumentos repassados ao httpx (params, headers, ...)
+            
+        Returns:
+            Resposta HTTP
+            
+        Raises:
+            CircuitOpenError: Host indisponível (circuito aberto)
+            QuotaWaitTimeout: Cota do upstream esgotada por mais que o limite de espera
+        """
+        breaker = circuit_breakers.get(url)
+        if not breaker.allow():
+            raise CircuitOpenError(f"Circuit open for {breaker.name}")
+        
+        if self.quota is not None:
+            try:
+                await self.quota.acquire()
+            except BaseException:
+                breaker.release()
+                raise
+        
+        # Timeout adaptativo (p99 observado), limitado a HTTP_TIMEOUT
+        timeout = breaker.timeout()
+        timeout = httpx.Timeout(timeout, connect=min(timeout, settings.HTTP_CONNECT_TIMEOUT))
+        client = http_clients.get(url)
+        start = time.perf_counter()
+        status = None
+        try:
+            response = await client.get(url, timeout=timeout, **kwargs)
+        except httpx.TimeoutException as e:
+            status = status_label(error=e)
+            breaker.record_failure(timed_out=True)
+            raise
+        except asyncio.CancelledError as e:
+            status = status_label(error=e)
+            breaker.release()
+            raise
+        except Exception as e:
+            status = status_label(error=e)
+            breaker.record_failure()
+            raise
+        finally:
+            elapsed = time.perf_counter() - start
+            if status is not None:
+                UPSTREAM_LATENCY.labels(self.name, operation, status).observe(elapsed)
+        
+        status = status_label(response.status_code)
+        UPSTREAM_LATENCY.labels(self.name, operation, status).observe(elapsed)
+        if response.status_code >= 500 or response.status_code == 429:
+            breaker.record_failure()
+        else:
+            breaker.record_success(elapsed)
+        return response
+    
+    def _can_retry(self, budget: RetryBudget, attempt: int, operation: str) -> bool:
+        """Verificar tentativas restantes e o orçamento de retries do host"""
+        if attempt >= retry_policy.max_attempts:
+            return False
+        if not budget.try_withdraw():
+            UPSTREAM_RETRIES.labels(self.name, operation, "budget_exhausted").inc()
+            return False
+        UPSTREAM_RETRIES.labels(self.name, operation, "retried").inc()
+        return True
+    
+    async def _get(self, url: str, operation: str, **kwargs) -> httpx.Response:
+        """
+        Executar GET idempotente com retentativas (backoff exponencial com jitter)
+        
+        Erros de conexão e status transitórios (429, 5xx) são repetidos enquanto
+        houver tentativas e orçamento de retries no host.
+        
+        Args:
+            url: URL completa
+            operation: Método do cliente que originou a chamada (rótulo das métricas)
+            **kwargs: Argumentos repassados ao httpx (params, headers, ...)
+            
+        Returns:
+            Resposta HTTP (a última, se as tentativas se esgotarem)
+            
+        Raises:
+            CircuitOpenError: Host indisponível (circuito aberto)
+        """
+        budget = retry_budgets.get(url)
+        budget.deposit()
+        attempt = 1
+        
+        while True:
+            try:
+                response = await self._attempt(url, operation, **kwargs)
+            except RETRYABLE_ERRORS as e:
+                if not self._can_retry(budget, attempt, operation):
+                    raise
+                delay = retry_policy.backoff(attempt)
+                logger.warning(f"{self.name} {operation} failed ({type(e).__name__}), retrying in {delay:.2f}s")
+            else:
+                if response.status_code not in RETRYABLE_STATUS or \
+                        not self._can_retry(budget, attempt, operation):
+                    return response
+                delay = retry_policy.backoff(attempt, retry_after_seconds(response))
+                logger.warning(f"{self.name} {operation} returned {response.status_code}, retrying in {delay:.2f}s")
+            
+            await asyncio.sleep(delay)
+            attempt += 1
+    
+    async def _get_hedged(self, url: str, operation: str, **kwargs) -> httpx.Response:
+        """
+        GET com requisição hedged: se a primeira não responder até o p95
+        observado do host, dispara uma segunda e usa a que terminar antes
+        
+        Args:
+            url: URL completa
+            operation: Método do cliente que originou a chamada (rótulo das métricas)
+            **kwargs: Argumentos repassados ao httpx (params, headers, ...)
+            
+        Returns:
+            Resposta HTTP da requisição vencedora
+        """
+        p95 = circuit_breakers.get(url).p95
+        if not settings.HTTP_HEDGING_ENABLED or p95 is None:
+            return await self._get(url, operation, **kwargs)
+        
+        pending = {asyncio.create_task(self._get(url, operation, **kwargs))}
+        hedge = None
+        try:
+            done, pending = await asyncio.wait(pending, timeout=max(p95, settings.HTTP_HEDGE_MIN_DELAY))
+            # A requisição hedged consome o mesmo orçamento dos retries
+            if not done and retry_budgets.get(url).try_withdraw():
+                hedge = asyncio.create_task(self._get(url, operation, **kwargs))
+                pending.add(hedge)
+                UPSTREAM_HEDGES.labels(self.name, operation, "fired").inc()
+            
+            error = None
+            while True:
+                for task in done:
+                    if task.exception() is None:
+                        if task is hedge:
+                            UPSTREAM_HEDGES.labels(self.name, operation, "won").inc()
+                        return task.result()
+                    error = task.exception()
+                if not pending:
+                    raise error
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            # Cancelar a requisição perdedora
+            for task in pending:
+                task.cancel()
+
+
+class BrasilAPIClient(BaseAPIClient):
     """Cliente para BrasilAPI"""
     
     def __init__(self):
-        self.base_url = settings.BRASIL_API_BASE_URL
-        self.timeout = 10
+        super().__init__("brasil_api", settings.BRASIL_API_BASE_URL, quota=brasil_api_quota)
     
     async def get_cnpj(self, cnpj: str) -> Optional[Dict[str, Any]]:
         """
-        Consultar dados de CNPJ via BrasilAPI
+        Consultar dados de CNPJ: base offline da Receita Federal e, para
+        ausentes ou base desatualizada, BrasilAPI (com cache em dois níveis)
         
         Args:
             cnpj: CNPJ a consultar (com ou sem formatação)
@@ -29,31 +279,80 @@ class BrasilAPIClient:
         """
         try:
             # Remover formatação
-            cnpj_clean = ''.join(filter(str.isdigit, cnpj))
+            cnpj_clean = only_digits(cnpj)
+            return await self.lookup_cnpj(cnpj_clean)
+        except Exception as e:
+            logger.error(f"Failed to get CNPJ data: {e}")
+            return None
+    
+    async def lookup_cnpj(self, cnpj_clean: str) -> Optional[Dict[str, Any]]:
+        """
+        Consultar CNPJ como get_cnpj, mas propagando falhas do upstream
+        (a consulta em lote diferencia "não encontrado" de "indisponível")
+        
+        Args:
+            cnpj_clean: CNPJ somente com dígitos
             
-            url = f"{self.base_url}/cnpj/v1/{cnpj_clean}"
+        Returns:
+            Dicionário com dados da empresa ou None se não encontrado
             
-            async with httpx.AsyncClient(timeout=self.timeout) as client:
-                response = await client.get(url)
-                
-                if response.status_code == 200:
-                    data = response.json()
-                    logger.info(f"CNPJ {cnpj_clean} consulted successfully")
-                    return data
-                elif response.status_code == 404:
-                    logger.warning(f"CNPJ {cnpj_clean} not found")
-                    return None
-                else:
-                    logger.error(f"BrasilAPI error: {response.status_code}")
-                    return None
-                    
+        Raises:
+            UpstreamError, QuotaWaitTimeout, httpx.HTTPError: BrasilAPI
+                indisponível e CNPJ ausente da base offline
+        """
+        offline = None
+        if settings.CNPJ_OFFLINE_ENABLED:
+            offline = cnpj_store.lookup(cnpj_clean)
+            if offline is not None and not cnpj_store.is_stale():
+                return offline
+        
+        def load():
+            return singleflight.do(
+                f"cnpj:{cnpj_clean}",
+                lambda: self._fetch_cnpj(cnpj_clean)
+            )
+        
+        try:
+            if not settings.CNPJ_CACHE_ENABLED:
+                return await load() or offline
+            
+            return await cnpj_cache.get_or_load(cnpj_clean, load) or offline
         except Exception as e:
-            logger.error(f"Failed to get CNPJ data: {e}")
+            if offline is None:
+                raise
+            logger.warning(f"BrasilAPI unavailable, serving offline CNPJ data: {e}")
+            return offline
+    
+    async def _fetch_cnpj(self, cnpj_clean: str) -> Optional[Dict[str, Any]]:
+        """
+        Buscar CNPJ diretamente na BrasilAPI
+        
+        Args:
+            cnpj_clean: CNPJ somente com dígitos
+            
+        Returns:
+            Dicionário com dados da empresa ou None se não encontrado
+            
+        Raises:
+            UpstreamError: Resposta inesperada da BrasilAPI
+        """
+        url = f"{self.base_url}/cnpj/v1/{cnpj_clean}"
+        
+        response = await self._get_hedged(url, "get_cnpj")
+        
+        if response.status_code == 200:
+            data = response.json()
+            logger.info(f"CNPJ {cnpj_clean} consulted successfully", extra={"upstream": self.name})
+            return data
+        elif response.status_code == 404:
+            logger.warning(f"CNPJ {cnpj_clean} not found")
             return None
+        else:
+            raise UpstreamError(f"BrasilAPI error: {response.status_code}")
     
     async def get_cep(self, cep: str) -> Optional[Dict[str, Any]]:
         """
-        Consultar dados de CEP via BrasilAPI
+        Consultar dados de CEP no índice offline, com BrasilAPI como fallback
         
         Args:
             cep: CEP a consultar
@@ -61,34 +360,57 @@ class BrasilAPIClient:
         Returns:
             Dicionário com dados do endereço ou None
         """
+        cep_clean = only_digits(cep)
+        
+        if settings.CEP_INDEX_ENABLED:
+            result = cep_index.lookup(cep_clean)
+            if result is not None:
+                return result
+        
+        return await singleflight.do(
+            f"cep:{cep_clean}",
+            lambda: self._query_cep(cep)
+        )
+    
+    async def _query_cep(self, cep: str) -> Optional[Dict[str, Any]]:
+        """Consulta sem agrupamento (ver get_cep)"""
         try:
-            cep_clean = ''.join(filter(str.isdigit, cep))
+            cep_clean = only_digits(cep)
             
             url = f"{self.base_url}/address/v2/{cep_clean}"
             
-            async with httpx.AsyncClient(timeout=self.timeout) as client:
-                response = await client.get(url)
+            response = await self._get(url, "get_cep")
+            
+            if response.status_code == 200:
+                data = response.json()
+                logger.info(f"CEP {cep_clean} consulted successfully", extra={"upstream": self.name})
+                return data
+            else:
+                logger.warning(f"CEP {cep_clean} not found")
+                return None
                 
-                if response.status_code == 200:
-                    data = response.json()
-                    logger.info(f"CEP {cep_clean} consulted successfully")
-                    return data
-                else:
-                    logger.warning(f"CEP {cep_clean} not found")
-                    return None
-                    
         except Exception as e:
             logger.error(f"Failed to get CEP data: {e}")
             return None
 
 
-class PortalTransparenciaClient:
+class PortalTransparenciaClient(BaseAPIClient):
     """Cliente para API do Portal da Transparência"""
     
+    # Endpoints de benefícios consultados em paralelo
+    BENEFICIOS_ENDPOINTS = [
+        "/api-de-dados/bolsa-familia-disponivel-por-cpf-ou-nis",
+        "/api-de-dados/auxilio-brasil-sacado-por-nis",
+        "/api-de-dados/bpc-por-cpf-ou-nis"
+    ]
+    
     def __init__(self):
-        self.base_url = settings.PORTAL_TRANSPARENCIA_BASE_URL
+        super().__init__(
+            "portal_transparencia",
+            settings.PORTAL_TRANSPARENCIA_BASE_URL,
+            quota=portal_transparencia_quota
+        )
         self.token = settings.PORTAL_TRANSPARENCIA_TOKEN
-        self.timeout = 10
     
     async def get_servidores_por_cpf(self, cpf: str) -> Optional[Dict[str, Any]]:
         """
@@ -100,12 +422,20 @@ class PortalTransparenciaClient:
         Returns:
             Dicionário com dados dos servidores ou None
         """
+        cpf_clean = only_digits(cpf)
+        return await singleflight.do(
+            f"servidores:{cpf_clean}",
+            lambda: self._query_servidores(cpf)
+        )
+    
+    async def _query_servidores(self, cpf: str) -> Optional[Dict[str, Any]]:
+        """Consulta sem agrupamento (ver get_servidores_por_cpf)"""
         if not self.token:
             logger.warning("Portal da Transparência token not configured")
             return None
         
         try:
-            cpf_clean = ''.join(filter(str.isdigit, cpf))
+            cpf_clean = only_digits(cpf)
             
             url = f"{self.base_url}/api-de-dados/servidores"
             params = {
@@ -113,17 +443,16 @@ class PortalTransparenciaClient:
                 "token": self.token
             }
             
-            async with httpx.AsyncClient(timeout=self.timeout) as client:
-                response = await client.get(url, params=params)
+            response = await self._get(url, "get_servidores_por_cpf", params=params)
+            
+            if response.status_code == 200:
+                data = response.json()
+                logger.info(f"Servidor data for CPF {cpf_clean} retrieved", extra={"upstream": self.name})
+                return data
+            else:
+                logger.warning(f"No servidor data found for CPF {cpf_clean}")
+                return None
                 
-                if response.status_code == 200:
-                    data = response.json()
-                    logger.info(f"Servidor data for CPF {cpf_clean} retrieved")
-                    return data
-                else:
-                    logger.warning(f"No servidor data found for CPF {cpf_clean}")
-                    return None
-                    
         except Exception as e:
             logger.error(f"Failed to get servidor data: {e}")
             return None
@@ -138,43 +467,56 @@ class PortalTransparenciaClient:
         Returns:
             Dicionário com dados dos benefícios ou None
         """
+        cpf_clean = only_digits(cpf)
+        return await singleflight.do(
+            f"beneficios:{cpf_clean}",
+            lambda: self._query_beneficios(cpf)
+        )
+    
+    async def _query_beneficios(self, cpf: str) -> Optional[Dict[str, Any]]:
+        """Consulta sem agrupamento (ver get_beneficios_por_cpf)"""
         if not self.token:
             logger.warning("Portal da Transparência token not configured")
             return None
         
         try:
-            cpf_clean = ''.join(filter(str.isdigit, cpf))
+            cpf_clean = only_digits(cpf)
+            
+            params = {
+                "cpfOuNis": cpf_clean,
+                "token": self.token
+            }
+            
+            # Consultar todos os endpoints de benefícios em paralelo
+            tasks = {
+                asyncio.create_task(
+                    self._get_beneficio(f"{self.base_url}{endpoint}", params)
+                ): endpoint.split("/")[-1]
+                for endpoint in self.BENEFICIOS_ENDPOINTS
+            }
             
-            # Tentar múltiplos endpoints de benefícios
-            endpoints = [
-                f"{self.base_url}/api-de-dados/bolsa-familia-disponivel-por-cpf-ou-nis",
-                f"{self.base_url}/api-de-dados/auxilio-brasil-sacado-por-nis",
-                f"{self.base_url}/api-de-dados/bpc-por-cpf-ou-nis"
-            ]
+            done, pending = await asyncio.wait(
+                list(tasks),
+                timeout=settings.PORTAL_TRANSPARENCIA_DEADLINE
+            )
             
-            results = {}
+            # Prazo total esgotado: cancelar o restante e devolver resultados parciais
+            for task in pending:
+                task.cancel()
+            if pending:
+                logger.warning(
+                    f"Benefícios deadline reached, {len(pending)} endpoint(s) skipped: "
+                    f"{', '.join(tasks[task] for task in pending)}"
+                )
             
-            async with httpx.AsyncClient(timeout=self.timeout) as client:
-                for endpoint in endpoints:
-                    try:
-                        params = {
-                            "cpfOuNis": cpf_clean,
-                            "token": self.token
-                        }
-                        
-                        response = await client.get(endpoint, params=params)
-                        
-                        if response.status_code == 200:
-                            data = response.json()
-                            endpoint_name = endpoint.split("/")[-1]
-                            results[endpoint_name] = data
-                            
-                    except Exception as e:
-                        logger.warning(f"Failed to query {endpoint}: {e}")
-                        continue
+            results = {}
+            for task in done:
+                data = task.result()
+                if data is not None:
+                    results[tasks[task]] = data
             
             if results:
-                logger.info(f"Benefícios data for CPF {cpf_clean} retrieved")
+                logger.info(f"Benefícios data for CPF {cpf_clean} retrieved", extra={"upstream": self.name})
                 return results
             else:
                 logger.warning(f"No benefícios data found for CPF {cpf_clean}")
@@ -183,13 +525,49 @@ class PortalTransparenciaClient:
         except Exception as e:
             logger.error(f"Failed to get benefícios data: {e}")
             return None
+    
+    async def _get_beneficio(
+        self,
+        endpoint: str,
+        params: Dict[str, str]
+    ) -> Optional[Any]:
+        """
+        Consultar um endpoint de benefício dentro do seu orçamento de tempo
+        
+        Args:
+            endpoint: URL do endpoint
+            params: Parâmetros da consulta
+            
+        Returns:
+            Dados do benefício ou None
+        """
+        try:
+            response = await asyncio.wait_for(
+                self._get(endpoint, "get_beneficios_por_cpf", params=params),
+                timeout=settings.PORTAL_TRANSPARENCIA_ENDPOINT_TIMEOUT
+            )
+            
+            if response.status_code == 200:
+                return response.json()
+            return None
+            
+        except asyncio.TimeoutError:
+            logger.warning(f"Timeout querying {endpoint}")
+            return None
+        except Exception as e:
+            logger.warning(f"Failed to query {endpoint}: {e}")
+            return None
 
 
-class DataBreachClient:
+class DataBreachClient(BaseAPIClient):
     """Cliente para consulta de dados vazados"""
     
     def __init__(self):
-        self.timeout = 10
+        super().__init__(
+            "have_i_been_pwned",
+            settings.HAVE_I_BEEN_PWNED_BASE_URL,
+            quota=data_breach_quota
+        )
     
     async def check_email_breach(self, email: str) -> Optional[Dict[str, Any]]:
         """
@@ -201,40 +579,46 @@ class DataBreachClient:
         Returns:
             Dicionário com informações de vazamento ou None
         """
+        return await singleflight.do(
+            f"breach:{email_key(email)}",
+            lambda: self._query_email_breach(email)
+        )
+    
+    async def _query_email_breach(self, email: str) -> Optional[Dict[str, Any]]:
+        """Consulta sem agrupamento (ver check_email_breach)"""
         if not settings.HAVE_I_BEEN_PWNED_API_KEY:
             logger.warning("Have I Been Pwned API key not configured")
             return None
         
         try:
-            url = f"https://haveibeenpwned.com/api/v3/breachedaccount/{email}"
+            url = f"{self.base_url}/breachedaccount/{email}"
             
             headers = {
                 "User-Agent": "BR-Data-Bot/1.0",
                 "Authorization": f"Bearer {settings.HAVE_I_BEEN_PWNED_API_KEY}"
             }
             
-            async with httpx.AsyncClient(timeout=self.timeout) as client:
-                response = await client.get(url, headers=headers)
+            response = await self._get(url, "check_email_breach", headers=headers)
+            
+            if response.status_code == 200:
+                data = response.json()
+                logger.info(f"Email {email} found in {len(data)} breaches", extra={"upstream": self.name})
+                return {
+                    "email": email,
+                    "breaches": data,
+                    "status": "found"
+                }
+            elif response.status_code == 404:
+                logger.info(f"Email {email} not found in breaches", extra={"upstream": self.name})
+                return {
+                    "email": email,
+                    "breaches": [],
+                    "status": "safe"
+                }
+            else:
+                logger.warning(f"Have I Been Pwned API error: {response.status_code}")
+                return None
                 
-                if response.status_code == 200:
-                    data = response.json()
-                    logger.info(f"Email {email} found in {len(data)} breaches")
-                    return {
-                        "email": email,
-                        "breaches": data,
-                        "status": "found"
-                    }
-                elif response.status_code == 404:
-                    logger.info(f"Email {email} not found in breaches")
-                    return {
-                        "email": email,
-                        "breaches": [],
-                        "status": "safe"
-                    }
-                else:
-                    logger.warning(f"Have I Been Pwned API error: {response.status_code}")
-                    return None
-                    
         except Exception as e:
             logger.error(f"Failed to check email breach: {e}")
             return None
@@ -0,0 +1,96 @@
+"""
+Registro de clientes HTTP compartilhados (pool de conexões por host)
+"""
+import logging
+from typing import Dict, List, Optional
+from urllib.parse import urlsplit
+import httpx
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+# HTTP/2 depende do pacote opcional "h2" (httpx[http2])
+try:
+    import h2  # noqa: F401
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+
+def host_key(url: str) -> str:
+    """Chave do host de uma URL (scheme://host[:porta])"""
+    parts = urlsplit(url)
+    return f"{parts.scheme}://{parts.netloc}"
+
+
+class HTTPClientRegistry:
+    """
+    Mantém um httpx.AsyncClient por host durante todo o ciclo de vida da aplicação,
+    reaproveitando conexões TCP/TLS entre consultas
+    """
+
+    def __init__(self):
+        self._clients: Dict[str, httpx.AsyncClient] = {}
+
+    def _build_client(self) -> httpx.AsyncClient:
+        """Criar cliente com limites de conexão e timeouts configurados"""
+        timeout = httpx.Timeout(
+            settings.HTTP_TIMEOUT,
+            connect=settings.HTTP_CONNECT_TIMEOUT
+        )
+        limits = httpx.Limits(
+            max_connections=settings.HTTP_MAX_CONNECTIONS_PER_HOST,
+            max_keepalive_connections=settings.HTTP_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=settings.HTTP_KEEPALIVE_EXPIRY
+        )
+        return httpx.AsyncClient(
+            timeout=timeout,
+            limits=limits,
+            http2=settings.HTTP2_ENABLED and HTTP2_AVAILABLE
+        )
+
+    def get(self, url: str) -> httpx.AsyncClient:
+        """
+        Obter o cliente compartilhado do host de uma URL
+
+        Args:
+            url: URL (ou URL base) que será requisitada
+
+        Returns:
+            Cliente httpx reutilizável para o host
+        """
+        host = host_key(url)
+
+        client = self._clients.get(host)
+        if client is None or client.is_closed:
+            client = self._build_client()
+            self._clients[host] = client
+            logger.info(f"HTTP client pool created for {host}")
+        return client
+
+    async def startup(self, base_urls: Optional[List[str]] = None) -> None:
+        """
+        Pré-criar clientes para os hosts conhecidos
+
+        Args:
+            base_urls: URLs base dos serviços externos
+        """
+        if not HTTP2_AVAILABLE and settings.HTTP2_ENABLED:
+            logger.warning("HTTP/2 requested but 'h2' package is not installed; using HTTP/1.1")
+        for url in base_urls or []:
+            self.get(url)
+
+    async def close(self) -> None:
+        """Fechar todos os clientes e liberar as conexões"""
+        clients = list(self._clients.values())
+        self._clients.clear()
+        for client in clients:
+            try:
+                await client.aclose()
+            except Exception as e:
+                logger.error(f"Failed to close HTTP client: {e}")
+        logger.info("HTTP client pools closed")
+
+
+# Instância global do registro de clientes
+http_clients = HTTPClientRegistry()
@@ -0,0 +1,105 @@
+"""
+Deduplicação de webhooks: Telegram (update_id) e WhatsApp Cloud API (message_id)
+reenviam a entrega quando a resposta demora, e cada reenvio repetiria a consulta
+e a resposta ao usuário
+
+Cada ID é marcado uma única vez: primeiro no LRU local (reenvios que chegam ao
+mesmo worker são descartados sem ida ao Redis), depois com SET NX EX no Redis,
+que decide entre workers. Sem Redis, vale apenas o LRU local.
+"""
+import logging
+import time
+from typing import Dict
+from config import settings
+from cache import CacheEntry, LRUCache
+from metrics import observe_redis
+from security import async_redis_client
+
+logger = logging.getLogger(__name__)
+
+
+class IdempotencyStore:
+    """Registro de entregas já processadas, com expiração"""
+
+    def __init__(self, redis_client, ttl: int, local_max_size: int, retry_interval: float = 5.0):
+        """
+        Args:
+            redis_client: Cliente redis.asyncio (None usa apenas o LRU local)
+            ttl: Tempo em segundos durante o qual um reenvio é descartado
+            local_max_size: Entradas no LRU local
+            retry_interval: Segundos usando só o LRU local após uma falha do Redis
+        """
+        self.redis_client = redis_client
+        self.ttl = ttl
+        self.local = LRUCache(local_max_size)
+        self.retry_interval = retry_interval
+        self._redis_healthy = True
+        self._retry_at = 0.0
+        self.accepted = 0
+        self.local_duplicates = 0
+        self.redis_duplicates = 0
+        self.redis_fallbacks = 0
+
+    async def first_delivery(self, platform: str, delivery_id: str) -> bool:
+        """
+        Marcar entrega como processada
+
+        Args:
+            platform: "telegram" ou "whatsapp"
+            delivery_id: update_id (Telegram) ou message_id (WhatsApp)
+
+        Returns:
+            True na primeira entrega; False se for reenvio
+        """
+        key = f"idempotency:{platform}:{delivery_id}"
+        now = time.time()
+        if self.local.get(key, now) is not None:
+            self.local_duplicates += 1
+            return False
+
+        # Marcado antes do await: entregas simultâneas no mesmo worker não passam juntas
+        expires_at = now + self.ttl
+        self.local.set(key, CacheEntry(True, expires_at, expires_at))
+
+        # Redis fora há pouco: vale só o LRU local até passar retry_interval
+        if self.redis_client is not None and time.monotonic() < self._retry_at:
+            self.redis_fallbacks += 1
+        elif self.redis_client is not None:
+            try:
+                with observe_redis("idempotency"):
+                    created = await self.redis_client.set(key, 1, nx=True, ex=self.ttl)
+                if not self._redis_healthy:
+                    logger.info("Idempotency store: Redis available again")
+                    self._redis_healthy = True
+                if not created:
+                    self.redis_duplicates += 1
+                    return False
+            except Exception as e:
+                self.redis_fallbacks += 1
+                self._retry_at = time.monotonic() + self.retry_interval
+                if self._redis_healthy:
+                    logger.error(f"Idempotency store: Redis unavailable, using local cache only: {e}")
+                    self._redis_healthy = False
+
+        self.accepted += 1
+        return True
+
+    def stats(self) -> Dict[str, int]:
+        """Contadores da deduplicação"""
+        return {
+            "size": len(self.local),
+            "evictions": self.local.evictions,
+            "accepted": self.accepted,
+            "local_duplicates": self.local_duplicates,
+            "redis_duplicates": self.redis_duplicates,
+            "redis_fallbacks": self.redis_fallbacks
+        }
+
+
+# Instância global da deduplicação de webhooks
+idempotency_store = IdempotencyStore(
+    async_redis_client,
+    ttl=settings.IDEMPOTENCY_TTL,
+    local_max_size=settings.IDEMPOTENCY_LOCAL_MAX_SIZE,
+    retry_interval=settings.REDIS_RETRY_INTERVAL
+)
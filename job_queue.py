@@ -0,0 +1,447 @@
+"""
+Fila de jobs para consultas demoradas: o webhook enfileira e responde na hora,
+um pool de consumidores executa a consulta e envia o resultado ao usuário
+
+Ordem por usuário: cada usuário cai sempre na mesma partição (crc32 % partições)
+e cada partição é consumida por um único job de cada vez.
+
+Backends:
+    RedisStreamJobQueue   um stream por partição (jobs:{n}) com consumer group;
+                          cada worker detém partições por lease no Redis e só
+                          confirma (XACK) depois de executar o job, então um job
+                          interrompido é reentregue ao próximo dono (at-least-once)
+    InMemoryJobQueue      asyncio.Queue por partição, para testes e ambientes sem
+                          Redis (jobs pendentes se perdem ao reiniciar)
+"""
+import asyncio
+import json
+import logging
+import time
+import uuid
+import zlib
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+from config import settings
+from metrics import JOB_LATENCY
+from retry import RetryPolicy
+from security import async_redis_blocking_client, async_redis_client
+
+logger = logging.getLogger(__name__)
+
+JobHandler = Callable[[Dict[str, Any]], Awaitable[None]]
+
+STREAM_GROUP = "workers"
+
+# Renova o lease somente se ainda pertencer a este worker
+RENEW_LEASE_LUA = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('EXPIRE', KEYS[1], ARGV[2])
+end
+return 0
+"""
+
+RELEASE_LEASE_LUA = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+
+def partition_for(user: str, partitions: int) -> int:
+    """Partição do usuário (estável entre processos, ao contrário de hash())"""
+    return zlib.crc32(user.encode("utf-8")) % partitions
+
+
+class BaseJobQueue:
+    """Registro de handlers e execução com retentativas (comum aos backends)"""
+
+    def __init__(self, partitions: int, max_attempts: int, shutdown_timeout: float):
+        self.partitions = max(1, partitions)
+        self.shutdown_timeout = shutdown_timeout
+        self.retry_policy = RetryPolicy(max_attempts, base_delay=0.5, max_delay=10)
+        self._handlers: Dict[str, JobHandler] = {}
+        self._consumers: Dict[int, asyncio.Task] = {}
+        self._stopping = False
+        self.enqueued = 0
+        self.completed = 0
+        self.retried = 0
+        self.failed = 0
+
+    def register(self, job_type: str, handler: JobHandler) -> None:
+        """
+        Associar um tipo de job à corrotina que o executa
+
+        Args:
+            job_type: Nome do tipo (ex.: "telegram.cnpj")
+            handler: Corrotina que recebe o job (type, user, payload, enqueued_at)
+        """
+        self._handlers[job_type] = handler
+
+    def _new_job(self, job_type: str, user: str, payload: Dict[str, Any]) -> Dict[str, Any]:
+        if job_type not in self._handlers:
+            raise ValueError(f"Unknown job type: {job_type}")
+        return {
+            "id": uuid.uuid4().hex,
+            "type": job_type,
+            "user": user,
+            "payload": payload,
+            "enqueued_at": time.time()
+        }
+
+    async def _execute(self, job: Dict[str, Any]) -> None:
+        """Executar o job, com backoff entre tentativas; falha definitiva é descartada"""
+        job_type = job.get("type")
+        handler = self._handlers.get(job_type)
+        if handler is None:
+            logger.error(f"Dropping job {job.get('id')}: no handler for type {job_type}")
+            self.failed += 1
+            return
+
+        outcome = "failed"
+        attempt = 1
+        while True:
+            try:
+                await handler(job)
+                outcome = "completed"
+                self.completed += 1
+                break
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                if self._stopping:
+                    # Encerrando: sem confirmação, o job é reentregue ao próximo dono
+                    raise
+                if attempt >= self.retry_policy.max_attempts:
+                    self.failed += 1
+                    logger.error(f"Job {job['id']} ({job_type}) failed after {attempt} attempts: {e}")
+                    break
+                self.retried += 1
+                logger.warning(f"Job {job['id']} ({job_type}) attempt {attempt} failed: {e}")
+                await asyncio.sleep(self.retry_policy.backoff(attempt))
+                attempt += 1
+
+        JOB_LATENCY.labels(job_type, outcome).observe(max(0.0, time.time() - job["enqueued_at"]))
+
+    async def _stop_consumers(self) -> None:
+        """Aguardar o job em andamento de cada partição (até shutdown_timeout) e cancelar"""
+        self._stopping = True
+        tasks = list(self._consumers.values())
+        self._consumers.clear()
+        if not tasks:
+            return
+        _, pending = await asyncio.wait(tasks, timeout=self.shutdown_timeout)
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def _base_stats(self) -> Dict[str, int]:
+        return {
+            "consumers": len(self._consumers),
+            "enqueued": self.enqueued,
+            "completed": self.completed,
+            "retried": self.retried,
+            "failed": self.failed
+        }
+
+
+class InMemoryJobQueue(BaseJobQueue):
+    """Fila em memória do processo (mesma interface do backend Redis)"""
+
+    def __init__(self, partitions: int, max_attempts: int, shutdown_timeout: float):
+        super().__init__(partitions, max_attempts, shutdown_timeout)
+        self._queues: List[asyncio.Queue] = [asyncio.Queue() for _ in range(self.partitions)]
+
+    async def enqueue(self, job_type: str, user: str, payload: Dict[str, Any]) -> str:
+        """
+        Enfileirar job
+
+        Args:
+            job_type: Tipo registrado com register
+            user: Usuário (define a partição e a ordem de execução)
+            payload: Dados do job (serializáveis em JSON)
+
+        Returns:
+            ID do job
+        """
+        job = self._new_job(job_type, user, payload)
+        self._queues[partition_for(user, self.partitions)].put_nowait(job)
+        self.enqueued += 1
+        return job["id"]
+
+    async def _consume(self, partition: int) -> None:
+        queue = self._queues[partition]
+        while not self._stopping:
+            try:
+                job = await asyncio.wait_for(queue.get(), timeout=1)
+            except asyncio.TimeoutError:
+                continue
+            await self._execute(job)
+
+    async def start(self) -> None:
+        """Iniciar um consumidor por partição"""
+        self._stopping = False
+        for partition in range(self.partitions):
+            self._consumers[partition] = asyncio.create_task(self._consume(partition))
+        logger.info(f"In-memory job queue started with {self.partitions} partitions")
+
+    async def stop(self) -> None:
+        """Parar os consumidores (jobs ainda na fila são perdidos)"""
+        await self._stop_consumers()
+        queued = sum(queue.qsize() for queue in self._queues)
+        if queued:
+            logger.warning(f"In-memory job queue stopped with {queued} queued jobs")
+
+    def stats(self) -> Dict[str, int]:
+        """Contadores da fila"""
+        stats = self._base_stats()
+        stats["queued"] = sum(queue.qsize() for queue in self._queues)
+        return stats
+
+
+class RedisStreamJobQueue(BaseJobQueue):
+    """Fila em Redis Streams com partições distribuídas entre os workers por lease"""
+
+    def __init__(
+        self,
+        redis_client,
+        partitions: int,
+        max_attempts: int,
+        shutdown_timeout: float,
+        lease_seconds: int,
+        max_owned_partitions: int,
+        max_len: int,
+        blocking_client=None
+    ):
+        """
+        Args:
+            redis_client: Cliente redis.asyncio
+            partitions: Quantidade de streams (paralelismo máximo entre usuários)
+            max_attempts: Tentativas por job antes de descartá-lo
+            shutdown_timeout: Espera pelo job em andamento ao encerrar
+            lease_seconds: Validade do lease de cada partição
+            max_owned_partitions: Partições por worker (0 = sem limite)
+            max_len: Tamanho aproximado de cada stream (XADD MAXLEN ~)
+            blocking_client: Cliente sem socket_timeout para o XREADGROUP BLOCK
+                (padrão: redis_client)
+        """
+        super().__init__(partitions, max_attempts, shutdown_timeout)
+        self.redis_client = redis_client
+        self.blocking_client = blocking_client or redis_client
+        self.lease_seconds = max(3, lease_seconds)
+        self.max_owned_partitions = max_owned_partitions or self.partitions
+        self.max_len = max_len
+        self.worker_id = uuid.uuid4().hex
+        self._renew_lease = redis_client.register_script(RENEW_LEASE_LUA)
+        self._release_lease = redis_client.register_script(RELEASE_LEASE_LUA)
+        self._supervisor: Optional[asyncio.Task] = None
+        self.redelivered = 0
+        self.lease_losses = 0
+        self.ack_failures = 0
+        self.consumer_restarts = 0
+
+    @staticmethod
+    def _stream(partition: int) -> str:
+        return f"jobs:{partition}"
+
+    @staticmethod
+    def _lease(partition: int) -> str:
+        return f"jobs:lease:{partition}"
+
+    async def enqueue(self, job_type: str, user: str, payload: Dict[str, Any]) -> str:
+        """
+        Enfileirar job
+
+        Args:
+            job_type: Tipo registrado com register
+            user: Usuário (define a partição e a ordem de execução)
+            payload: Dados do job (serializáveis em JSON)
+
+        Returns:
+            ID do job
+        """
+        job = self._new_job(job_type, user, payload)
+        await self.redis_client.xadd(
+            self._stream(partition_for(user, self.partitions)),
+            {"job": json.dumps(job, ensure_ascii=False)},
+            maxlen=self.max_len,
+            approximate=True
+        )
+        self.enqueued += 1
+        return job["id"]
+
+    async def _ensure_groups(self) -> None:
+        for partition in range(self.partitions):
+            try:
+                await self.redis_client.xgroup_create(
+                    self._stream(partition), STREAM_GROUP, id="0", mkstream=True
+                )
+            except Exception as e:
+                if "BUSYGROUP" not in str(e):
+                    raise
+
+    async def _consume(self, partition: int) -> None:
+        """
+        Consumir a partição em ordem, um job por vez
+
+        O consumidor tem o nome da partição: o novo dono do lease lê primeiro
+        as entregas pendentes ("0"), ou seja, os jobs que o dono anterior não
+        chegou a confirmar, e depois as novas (">").
+        """
+        stream = self._stream(partition)
+        consumer = f"partition-{partition}"
+        read_from = "0"
+        unacked: List[str] = []
+        while not self._stopping:
+            # Confirmações que falharam: repetidas antes de ler, sem executar o job de novo
+            if unacked:
+                if not await self._ack(partition, unacked):
+                    await asyncio.sleep(1)
+                    continue
+                unacked = []
+
+            try:
+                response = await self.blocking_client.xreadgroup(
+                    STREAM_GROUP, consumer, {stream: read_from},
+                    count=10, block=None if read_from == "0" else 1000
+                )
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Job queue partition {partition}: read failed: {e}")
+                await asyncio.sleep(1)
+                continue
+
+            entries = response[0][1] if response else []
+            if read_from == "0" and not entries:
+                read_from = ">"
+                continue
+
+            for entry_id, fields in entries:
+                if self._stopping or partition not in self._consumers:
+                    return
+                if read_from == "0":
+                    self.redelivered += 1
+                try:
+                    job = json.loads(fields["job"])
+                except (KeyError, TypeError, ValueError):
+                    logger.error(f"Job queue partition {partition}: discarding malformed entry {entry_id}")
+                else:
+                    await self._execute(job)
+                if not await self._ack(partition, [entry_id]):
+                    unacked.append(entry_id)
+
+    async def _ack(self, partition: int, entry_ids: List[str]) -> bool:
+        """Confirmar e remover as entradas (payload pode conter email do usuário)"""
+        stream = self._stream(partition)
+        try:
+            pipe = self.redis_client.pipeline(transaction=False)
+            pipe.xack(stream, STREAM_GROUP, *entry_ids)
+            pipe.xdel(stream, *entry_ids)
+            await pipe.execute()
+            return True
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self.ack_failures += 1
+            logger.error(f"Job queue partition {partition}: ack failed for {len(entry_ids)} entries: {e}")
+            return False
+
+    async def _acquire(self, partition: int) -> bool:
+        return bool(await self.redis_client.set(
+            self._lease(partition), self.worker_id, nx=True, ex=self.lease_seconds
+        ))
+
+    async def _supervise(self) -> None:
+        """Criar os consumer groups, renovar os leases próprios e assumir partições sem dono"""
+        groups_ready = False
+        while True:
+            try:
+                if not groups_ready:
+                    await self._ensure_groups()
+                    groups_ready = True
+
+                for partition in list(self._consumers):
+                    renewed = await self._renew_lease(
+                        keys=[self._lease(partition)], args=[self.worker_id, self.lease_seconds]
+                    )
+                    if not renewed:
+                        self.lease_losses += 1
+                        logger.warning(f"Job queue partition {partition}: lease lost")
+                        self._consumers.pop(partition).cancel()
+                        continue
+
+                    # Consumidor encerrado por erro: o lease continua nosso, então é reiniciado
+                    task = self._consumers[partition]
+                    if task.done():
+                        error = None if task.cancelled() else task.exception()
+                        logger.error(f"Job queue partition {partition}: consumer exited ({error}), restarting")
+                        self.consumer_restarts += 1
+                        self._consumers[partition] = asyncio.create_task(self._consume(partition))
+
+                for partition in range(self.partitions):
+                    if len(self._consumers) >= self.max_owned_partitions:
+                        break
+                    if partition in self._consumers:
+                        continue
+                    if await self._acquire(partition):
+                        self._consumers[partition] = asyncio.create_task(self._consume(partition))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Job queue lease maintenance failed: {e}")
+
+            await asyncio.sleep(self.lease_seconds / 3)
+
+    async def start(self) -> None:
+        """Começar a disputar as partições (consumer groups criados pelo supervisor)"""
+        self._stopping = False
+        self._supervisor = asyncio.create_task(self._supervise())
+        logger.info(f"Redis job queue started ({self.partitions} partitions, worker {self.worker_id})")
+
+    async def stop(self) -> None:
+        """Parar os consumidores e liberar os leases (jobs não confirmados são reentregues)"""
+        if self._supervisor is not None:
+            self._supervisor.cancel()
+            await asyncio.gather(self._supervisor, return_exceptions=True)
+            self._supervisor = None
+
+        owned = list(self._consumers)
+        await self._stop_consumers()
+        for partition in owned:
+            try:
+                await self._release_lease(keys=[self._lease(partition)], args=[self.worker_id])
+            except Exception as e:
+                logger.error(f"Failed to release job queue lease {partition}: {e}")
+
+    def stats(self) -> Dict[str, int]:
+        """Contadores da fila"""
+        stats = self._base_stats()
+        stats["redelivered"] = self.redelivered
+        stats["lease_losses"] = self.lease_losses
+        stats["ack_failures"] = self.ack_failures
+        stats["consumer_restarts"] = self.consumer_restarts
+        return stats
+
+
+def create_job_queue() -> BaseJobQueue:
+    """Fila conforme JOB_QUEUE_BACKEND (memória se o Redis não estiver disponível)"""
+    if settings.JOB_QUEUE_BACKEND == "redis" and async_redis_client is not None:
+        return RedisStreamJobQueue(
+            async_redis_client,
+            partitions=settings.JOB_QUEUE_PARTITIONS,
+            max_attempts=settings.JOB_QUEUE_MAX_ATTEMPTS,
+            shutdown_timeout=settings.JOB_QUEUE_SHUTDOWN_TIMEOUT,
+            lease_seconds=settings.JOB_QUEUE_LEASE_SECONDS,
+            max_owned_partitions=settings.JOB_QUEUE_MAX_OWNED_PARTITIONS,
+            max_len=settings.JOB_QUEUE_MAX_LEN,
+            blocking_client=async_redis_blocking_client
+        )
+    return InMemoryJobQueue(
+        partitions=settings.JOB_QUEUE_PARTITIONS,
+        max_attempts=settings.JOB_QUEUE_MAX_ATTEMPTS,
+        shutdown_timeout=settings.JOB_QUEUE_SHUTDOWN_TIMEOUT
+    )
+
+
+# Instância global da fila de jobs
+job_queue = create_job_queue()
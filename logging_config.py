@@ -1,58 +1,227 @@
 """
 Configuração de logging anonimizado
 """
+import atexit
+import copy
+import json
 import logging
 import logging.handlers
 import os
+import queue
+import random
+import re
+import time
+from typing import Dict, Optional, Tuple
 from config import settings
 
 # Criar diretório de logs se não existir
 os.makedirs(os.path.dirname(settings.LOG_FILE), exist_ok=True)
 
 
+# Padrões sensíveis em uma única alternância (formatos mais específicos primeiro).
+# Os padrões numéricos só são tentados no início de uma sequência de dígitos ou em "(",
+# e o de email só no início da parte local, evitando testes em cada posição da linha.
+SENSITIVE_PATTERN = re.compile(
+    r'(?<!\d)(?=[\d(])(?:'
+    r'(?P<cnpj>\d{2}\.\d{3}\.\d{3}/\d{4}-\d{2})'
+    r'|(?P<cpf>\d{3}\.\d{3}\.\d{3}-\d{2})'
+    r'|(?P<phone>\(\d{2}\)\s?\d{4,5}-\d{4})'
+    r'|(?P<cnpj_digits>\d{14}(?!\d))'
+    r'|(?P<cpf_digits>\d{11}(?!\d))'
+    r')'
+    r'|(?P<email>(?<![a-zA-Z0-9._%+-])[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,})'
+)
+
+SENSITIVE_REPLACEMENTS = {
+    "cnpj": "XX.XXX.XXX/XXXX-XX",
+    "cpf": "XXX.XXX.XXX-XX",
+    "email": "user@example.com",
+    "phone": "(XX)XXXX-XXXX",
+    "cnpj_digits": "X" * 14,
+    "cpf_digits": "X" * 11,
+}
+
+# Todo padrão sensível contém dígito ou "@": linhas sem eles dispensam a substituição
+_HAS_CANDIDATE = re.compile(r'[\d@]').search
+
+
+def _replace_sensitive(match: "re.Match") -> str:
+    return SENSITIVE_REPLACEMENTS[match.lastgroup]
+
+
+def anonymize(text: str) -> str:
+    """
+    Anonimizar CPF, CNPJ, email e telefone em uma única passada
+    
+    Args:
+        text: Texto original
+        
+    Returns:
+        Texto com os dados sensíveis mascarados
+    """
+    if not _HAS_CANDIDATE(text):
+        return text
+    return SENSITIVE_PATTERN.sub(_replace_sensitive, text)
+
+
 class AnonymizedFormatter(logging.Formatter):
     """Formatter que anonimiza dados sensíveis nos logs"""
     
     def format(self, record):
-        # Anonimizar CPF (XXX.XXX.XXX-XX)
-        import re
-        record.msg = re.sub(
-            r'\d{3}\.\d{3}\.\d{3}-\d{2}',
-            'XXX.XXX.XXX-XX',
-            str(record.msg)
-        )
+        # Anonimizar a mensagem já formatada (inclui record.args)
+        record.msg = anonymize(record.getMessage())
+        record.args = None
         
-        # Anonimizar CNPJ (XX.XXX.XXX/XXXX-XX)
-        record.msg = re.sub(
-            r'\d{2}\.\d{3}\.\d{3}/\d{4}-\d{2}',
-            'XX.XXX.XXX/XXXX-XX',
-            str(record.msg)
-        )
+        return super().format(record)
+
+
+# Campos estruturados aceitos via extra={...} nas chamadas de log
+STRUCTURED_FIELDS = (
+    "route", "method", "status", "latency_ms", "platform", "query_type", "upstream", "suppressed"
+)
+
+
+class JsonFormatter(AnonymizedFormatter):
+    """Formatter JSON (uma linha por registro) com os campos estruturados"""
+    
+    def format(self, record):
+        record.msg = anonymize(record.getMessage())
+        record.args = None
         
-        # Anonimizar email
-        record.msg = re.sub(
-            r'[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}',
-            'user@example.com',
-            str(record.msg)
-        )
+        entry = {
+            "ts": self.formatTime(record, self.datefmt),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.msg
+        }
+        for field in STRUCTURED_FIELDS:
+            value = getattr(record, field, None)
+            if value is not None:
+                entry[field] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exception"] = anonymize(record.exc_text)
         
-        # Anonimizar telefone
-        record.msg = re.sub(
-            r'\(\d{2}\)\s?\d{4,5}-\d{4}',
-            '(XX)XXXX-XXXX',
-            str(record.msg)
-        )
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+def parse_sample_rates(spec: str) -> Dict[str, float]:
+    """
+    Interpretar LOG_SAMPLE_RATES ("main=0.01,external_apis=0.1")
+    
+    Args:
+        spec: Pares logger=taxa separados por vírgula
         
-        return super().format(record)
+    Returns:
+        Dicionário logger -> fração de registros mantidos
+    """
+    rates = {}
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        name, _, rate = item.partition("=")
+        rates[name.strip()] = min(1.0, max(0.0, float(rate)))
+    return rates
+
+
+class SamplingFilter(logging.Filter):
+    """Amostra registros abaixo de WARNING por logger; avisos e erros passam sempre"""
+    
+    def __init__(self, rates: Dict[str, float]):
+        super().__init__()
+        # Prefixos mais longos primeiro ("external_apis.x" antes de "external_apis")
+        self.rates = sorted(rates.items(), key=lambda item: len(item[0]), reverse=True)
+    
+    def _rate(self, name: str) -> float:
+        for prefix, rate in self.rates:
+            if name == prefix or name.startswith(prefix + "."):
+                return rate
+        return 1.0
+    
+    def filter(self, record):
+        if record.levelno >= logging.WARNING:
+            return True
+        rate = self._rate(record.name)
+        return rate >= 1.0 or random.random() < rate
+
+
+class RepeatedErrorFilter(logging.Filter):
+    """
+    Suprime erros repetidos da mesma linha de código dentro de uma janela;
+    o próximo registro após a janela informa quantos foram suprimidos
+    """
+    
+    def __init__(self, window_seconds: float):
+        super().__init__()
+        self.window = window_seconds
+        self._seen: Dict[Tuple[str, int], list] = {}
+    
+    def filter(self, record):
+        if record.levelno < logging.ERROR or self.window <= 0:
+            return True
+        
+        now = time.monotonic()
+        key = (record.pathname, record.lineno)
+        state = self._seen.get(key)
+        
+        if state is None or now - state[0] >= self.window:
+            suppressed = state[1] if state is not None else 0
+            self._seen[key] = [now, 0]
+            if suppressed:
+                record.suppressed = suppressed
+                record.msg = f"{record.msg} [{suppressed} similar message(s) suppressed]"
+            return True
+        
+        state[1] += 1
+        return False
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler com fila limitada: descarta e contabiliza registros quando cheia"""
+    
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+    
+    def prepare(self, record):
+        # Formatação e anonimização ficam na thread do listener; aqui só se
+        # resolvem os argumentos e o traceback, que dependem do estado atual
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = _exception_formatter.formatException(record.exc_info)
+            record.exc_info = None
+        return record
+    
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+_exception_formatter = logging.Formatter()
+_queue_handler: Optional[DroppingQueueHandler] = None
+_listener: Optional[logging.handlers.QueueListener] = None
 
 
 def setup_logging():
-    """Configurar logging da aplicação"""
+    """
+    Configurar logging da aplicação
+    
+    As chamadas só enfileiram o registro; formatação, anonimização e escrita em
+    arquivo/console acontecem em uma thread de background (QueueListener).
+    Chamadas repetidas não instalam handlers duplicados.
+    """
+    global _queue_handler, _listener
     
     # Obter logger raiz
     root_logger = logging.getLogger()
     root_logger.setLevel(getattr(logging, settings.LOG_LEVEL))
     
+    if _queue_handler is not None:
+        return root_logger
+    
     # Handler para arquivo
     file_handler = logging.handlers.RotatingFileHandler(
         settings.LOG_FILE,
@@ -65,21 +234,54 @@ def setup_logging():
     console_handler = logging.StreamHandler()
     console_handler.setLevel(getattr(logging, settings.LOG_LEVEL))
     
-    # Formatter anonimizado
-    formatter = AnonymizedFormatter(
-        '%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-        datefmt='%Y-%m-%d %H:%M:%S'
-    )
+    # Formatter anonimizado (texto ou JSON estruturado)
+    if settings.LOG_FORMAT == "json":
+        formatter = JsonFormatter(datefmt='%Y-%m-%dT%H:%M:%S')
+    else:
+        formatter = AnonymizedFormatter(
+            '%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+            datefmt='%Y-%m-%d %H:%M:%S'
+        )
     
     file_handler.setFormatter(formatter)
     console_handler.setFormatter(formatter)
     
-    # Adicionar handlers
-    root_logger.addHandler(file_handler)
-    root_logger.addHandler(console_handler)
+    # Fila limitada entre a aplicação e os handlers de saída
+    _queue_handler = DroppingQueueHandler(queue.Queue(maxsize=settings.LOG_QUEUE_SIZE))
+    
+    # Amostragem e supressão de repetições antes de enfileirar (custo mínimo na origem)
+    sample_rates = parse_sample_rates(settings.LOG_SAMPLE_RATES)
+    if sample_rates:
+        _queue_handler.addFilter(SamplingFilter(sample_rates))
+    _queue_handler.addFilter(RepeatedErrorFilter(settings.LOG_ERROR_SUPPRESSION_WINDOW))
+    _listener = logging.handlers.QueueListener(
+        _queue_handler.queue,
+        file_handler,
+        console_handler,
+        respect_handler_level=True
+    )
+    _listener.start()
+    atexit.register(shutdown_logging)
+    
+    # Adicionar handler
+    root_logger.addHandler(_queue_handler)
     
     return root_logger
 
 
+def shutdown_logging() -> None:
+    """Parar o listener, escrevendo os registros ainda na fila"""
+    global _listener
+    
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+def dropped_log_records() -> int:
+    """Quantidade de registros descartados por fila cheia"""
+    return _queue_handler.dropped if _queue_handler is not None else 0
+
+
 # Configurar logging ao importar o módulo
 logger = setup_logging()
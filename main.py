@@ -2,17 +2,34 @@
 Aplicação FastAPI principal para BR Data Bot
 """
 import logging
+import time
 from fastapi import FastAPI, HTTPException, Request, Depends
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, Response
 from contextlib import asynccontextmanager
 from config import settings
-from database import init_db, close_db, get_db
-from logging_config import setup_logging
-from routers import telegram_router, whatsapp_router, admin_router, health_router
+from database import init_db, close_db, close_async_db, get_db, partition_maintenance
+from http_clients import http_clients
+from security import close_async_redis, rate_limiter, blocked_users_cache
+from user_buffer import user_buffer
+from query_logger import query_log_ingestor
+from logging_config import setup_logging, dropped_log_records
+from external_apis import cnpj_cache, singleflight
+from cnpj_store import cnpj_store
+from cep_index import cep_index
+from upstream_scheduler import brasil_api_quota, portal_transparencia_quota, data_breach_quota
+from batch_jobs import batch_jobs
+from job_queue import job_queue
+from idempotency import idempotency_store
+from conversation_state import conversation_state
+from metrics import (
+    REQUEST_LATENCY, cache_collector, stats_collector, event_loop_monitor, metrics_response
+)
+from routers import telegram_router, whatsapp_router, admin_router, health_router, batch_router
 
-# Configurar logging
-logger = setup_logging()
+# Configurar logging (logger nomeado: LOG_SAMPLE_RATES amostra "main" pelo nome)
+setup_logging()
+logger = logging.getLogger(__name__)
 
 
 @asynccontextmanager
@@ -26,10 +43,41 @@ async def lifespan(app: FastAPI):
     except Exception as e:
         logger.error(f"Failed to initialize database: {e}")
     
+    await http_clients.startup([
+        settings.BRASIL_API_BASE_URL,
+        settings.PORTAL_TRANSPARENCIA_BASE_URL,
+        settings.HAVE_I_BEEN_PWNED_BASE_URL,
+        settings.WHATSAPP_GRAPH_API_BASE_URL,
+        settings.TELEGRAM_API_BASE_URL
+    ])
+    logger.info("HTTP client pools initialized")
+    
+    await user_buffer.start()
+    await query_log_ingestor.start()
+    await partition_maintenance.start()
+    await conversation_state.start()
+    if settings.JOB_QUEUE_ENABLED:
+        await job_queue.start()
+    if settings.METRICS_ENABLED:
+        await event_loop_monitor.start()
+    
     yield
     
     # Shutdown
     logger.info("Shutting down application")
+    await event_loop_monitor.stop()
+    await job_queue.stop()
+    await conversation_state.stop()
+    await batch_jobs.stop()
+    await brasil_api_quota.stop()
+    await portal_transparencia_quota.stop()
+    await data_breach_quota.stop()
+    await partition_maintenance.stop()
+    await user_buffer.stop()
+    await query_log_ingestor.stop()
+    await http_clients.close()
+    await close_async_redis()
+    await close_async_db()
     close_db()
 
 
@@ -41,6 +89,27 @@ app = FastAPI(
     lifespan=lifespan
 )
 
+# Métricas lidas a cada scrape (contadores internos dos componentes)
+cache_collector.register(cnpj_cache)
+stats_collector.register("singleflight", singleflight.stats)
+stats_collector.register("user_buffer", user_buffer.stats)
+stats_collector.register("query_log_ingestor", query_log_ingestor.stats)
+stats_collector.register("rate_limiter", lambda: {"redis_fallbacks": rate_limiter.fallbacks})
+stats_collector.register("blocked_users_cache", lambda: {
+    "size": len(blocked_users_cache),
+    "evictions": blocked_users_cache.evictions
+})
+stats_collector.register("brasil_api_quota", brasil_api_quota.stats)
+stats_collector.register("portal_transparencia_quota", portal_transparencia_quota.stats)
+stats_collector.register("have_i_been_pwned_quota", data_breach_quota.stats)
+stats_collector.register("cnpj_offline_store", cnpj_store.stats)
+stats_collector.register("cep_index", cep_index.stats)
+stats_collector.register("batch_jobs", batch_jobs.stats)
+stats_collector.register("job_queue", job_queue.stats)
+stats_collector.register("idempotency", idempotency_store.stats)
+stats_collector.register("conversation_state", conversation_state.stats)
+stats_collector.register("logging", lambda: {"dropped_records": dropped_log_records()})
+
 # Configurar CORS
 app.add_middleware(
     CORSMiddleware,
@@ -54,14 +123,31 @@ app.add_middleware(
 # Middleware para logging de requisições
 @app.middleware("http")
 async def log_requests(request: Request, call_next):
-    """Middleware para logar requisições"""
+    """Middleware para logar requisições (com latência e rota estruturadas)"""
+    start = time.perf_counter()
     try:
         response = await call_next(request)
-        logger.info(f"{request.method} {request.url.path} - {response.status_code}")
-        return response
     except Exception as e:
         logger.error(f"Request error: {e}")
         raise
+    
+    elapsed = time.perf_counter() - start
+    latency_ms = round(elapsed * 1000, 2)
+    # Template da rota (ex.: /admin/users/{user_id}) evita cardinalidade por ID;
+    # caminhos sem rota (404) são agrupados
+    route = request.scope.get("route")
+    route_path = getattr(route, "path", "unmatched")
+    REQUEST_LATENCY.labels(route_path, request.method, response.status_code).observe(elapsed)
+    logger.info(
+        f"{request.method} {request.url.path} - {response.status_code} ({latency_ms} ms)",
+        extra={
+            "route": route_path,
+            "method": request.method,
+            "status": response.status_code,
+            "latency_ms": latency_ms
+        }
+    )
+    return response
 
 
 # Tratamento de exceções global
@@ -90,6 +176,21 @@ app.include_router(health_router.router, prefix="/api", tags=["Health"])
 app.include_router(telegram_router.router, prefix="/api", tags=["Telegram"])
 app.include_router(whatsapp_router.router, prefix="/api", tags=["WhatsApp"])
 app.include_router(admin_router.router, prefix="/api/admin", tags=["Admin"])
+app.include_router(batch_router.router, prefix="/api/batch", tags=["Batch"])
+
+
+# Métricas Prometheus
+@app.get("/metrics", include_in_schema=False)
+async def metrics(request: Request):
+    """Expor métricas no formato Prometheus"""
+    if not settings.METRICS_ENABLED:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if settings.METRICS_TOKEN and \
+            request.headers.get("Authorization") != f"Bearer {settings.METRICS_TOKEN}":
+        raise HTTPException(status_code=401, detail="Unauthorized")
+    
+    content, content_type = metrics_response()
+    return Response(content=content, media_type=content_type)
 
 
 # Rota raiz
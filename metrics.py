@@ -0,0 +1,291 @@
+"""
+Métricas Prometheus: latência de rotas, APIs externas, Redis e banco,
+acerto dos caches e atraso do event loop
+"""
+import asyncio
+import logging
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, Optional
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest
+)
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+# Buckets em segundos (de 1 ms a 30 s)
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+# Operações locais (Redis/banco) ficam concentradas abaixo de 100 ms
+FAST_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5)
+
+REQUEST_LATENCY = Histogram(
+    "http_request_duration_seconds",
+    "Latência das requisições HTTP por rota",
+    ["route", "method", "status"],
+    buckets=LATENCY_BUCKETS
+)
+
+UPSTREAM_LATENCY = Histogram(
+    "upstream_request_duration_seconds",
+    "Latência das chamadas às APIs externas",
+    ["upstream", "operation", "status"],
+    buckets=LATENCY_BUCKETS
+)
+
+UPSTREAM_RETRIES = Counter(
+    "upstream_retries_total",
+    "Retentativas das chamadas às APIs externas",
+    ["upstream", "operation", "outcome"]
+)
+
+UPSTREAM_HEDGES = Counter(
+    "upstream_hedged_requests_total",
+    "Requisições hedged disparadas e vencidas",
+    ["upstream", "operation", "outcome"]
+)
+
+UPSTREAM_QUEUE_WAIT = Histogram(
+    "upstream_quota_wait_seconds",
+    "Tempo de espera na fila de cota das APIs externas",
+    ["upstream", "priority"],
+    buckets=LATENCY_BUCKETS
+)
+
+JOB_LATENCY = Histogram(
+    "job_queue_duration_seconds",
+    "Tempo entre enfileirar e concluir um job (inclui espera na fila e retentativas)",
+    ["job_type", "outcome"],
+    buckets=LATENCY_BUCKETS
+)
+
+CIRCUIT_STATE = Gauge(
+    "circuit_breaker_state",
+    "Estado do circuit breaker por host (0 = fechado, 1 = meio-aberto, 2 = aberto)",
+    ["host"]
+)
+
+UPSTREAM_TIMEOUT = Gauge(
+    "upstream_timeout_seconds",
+    "Timeout adaptativo atual por host",
+    ["host"]
+)
+
+REDIS_LATENCY = Histogram(
+    "redis_operation_duration_seconds",
+    "Latência das operações no Redis",
+    ["operation", "outcome"],
+    buckets=FAST_BUCKETS
+)
+
+DB_LATENCY = Histogram(
+    "db_statement_duration_seconds",
+    "Latência dos comandos SQL",
+    ["engine", "statement"],
+    buckets=FAST_BUCKETS
+)
+
+EVENT_LOOP_LAG = Histogram(
+    "event_loop_lag_seconds",
+    "Atraso do event loop em relação ao agendamento",
+    buckets=FAST_BUCKETS
+)
+
+EVENT_LOOP_LAG_LAST = Gauge(
+    "event_loop_lag_last_seconds",
+    "Último atraso medido do event loop"
+)
+
+
+def metrics_response() -> tuple:
+    """
+    Gerar o corpo do endpoint /metrics
+
+    Returns:
+        Tupla (conteúdo, content type)
+    """
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
+
+
+def status_label(status: Optional[int] = None, error: Optional[BaseException] = None) -> str:
+    """Rótulo de status: código HTTP ou nome da exceção"""
+    if error is not None:
+        return type(error).__name__
+    return str(status)
+
+
+@contextmanager
+def observe_redis(operation: str) -> Iterator[None]:
+    """
+    Medir uma operação no Redis
+
+    Args:
+        operation: Nome lógico da operação (ex.: "rate_limit", "cache_get")
+    """
+    start = time.perf_counter()
+    outcome = "ok"
+    try:
+        yield
+    except BaseException:
+        outcome = "error"
+        raise
+    finally:
+        REDIS_LATENCY.labels(operation, outcome).observe(time.perf_counter() - start)
+
+
+def instrument_engine(engine: Engine, name: str) -> None:
+    """
+    Registrar a duração de cada comando SQL da engine
+
+    Args:
+        engine: Engine síncrona (para engines assíncronas, usar .sync_engine)
+        name: Rótulo da engine ("sync" ou "async")
+    """
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        starts = conn.info.get("query_start")
+        if not starts:
+            return
+        # Só o verbo, para manter a cardinalidade baixa
+        verb = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else "UNKNOWN"
+        DB_LATENCY.labels(name, verb).observe(time.perf_counter() - starts.pop())
+
+    @event.listens_for(engine, "handle_error")
+    def _error(exception_context):
+        connection = exception_context.connection
+        if connection is not None and connection.info.get("query_start"):
+            connection.info["query_start"].pop()
+
+
+class CacheCollector:
+    """Expõe os contadores dos caches lidos no momento da coleta (sem custo por acesso)"""
+
+    def __init__(self):
+        self._caches: Dict[str, object] = {}
+
+    def register(self, cache) -> None:
+        """Registrar cache com método stats() e atributo name"""
+        self._caches[cache.name] = cache
+
+    def collect(self):
+        lookups = CounterMetricFamily(
+            "cache_lookups", "Consultas aos caches por resultado", labels=["cache", "result"]
+        )
+        hit_ratio = GaugeMetricFamily(
+            "cache_hit_ratio", "Taxa de acerto dos caches (memória + Redis)", labels=["cache"]
+        )
+        served = CounterMetricFamily(
+            "cache_served", "Acertos servidos stale ou negativos (subconjunto dos acertos)",
+            labels=["cache", "kind"]
+        )
+        size = GaugeMetricFamily("cache_entries", "Entradas em memória", labels=["cache"])
+        evictions = CounterMetricFamily(
+            "cache_evictions", "Entradas despejadas da memória", labels=["cache"]
+        )
+
+        for name, cache in self._caches.items():
+            stats = cache.stats()
+            for result in ("hits", "redis_hits", "misses"):
+                lookups.add_metric([name, result], stats.get(result, 0))
+            served.add_metric([name, "stale"], stats.get("stale_hits", 0))
+            served.add_metric([name, "negative"], stats.get("negative_hits", 0))
+            hit_ratio.add_metric([name], stats.get("hit_ratio", 0.0))
+            size.add_metric([name], stats.get("size", 0))
+            evictions.add_metric([name], stats.get("evictions", 0))
+
+        yield lookups
+        yield hit_ratio
+        yield served
+        yield size
+        yield evictions
+
+
+class StatsCollector:
+    """Expõe os contadores internos dos componentes (filas, buffers, limitador)"""
+
+    def __init__(self):
+        self._sources: Dict[str, Callable[[], Dict[str, float]]] = {}
+
+    def register(self, component: str, stats: Callable[[], Dict[str, float]]) -> None:
+        """
+        Registrar fonte de contadores
+
+        Args:
+            component: Nome do componente (rótulo)
+            stats: Função que retorna os contadores atuais
+        """
+        self._sources[component] = stats
+
+    def collect(self):
+        family = GaugeMetricFamily(
+            "component_stat", "Contadores internos dos componentes", labels=["component", "stat"]
+        )
+        for component, stats in self._sources.items():
+            try:
+                values = stats()
+            except Exception as e:
+                logger.warning(f"Failed to collect stats from {component}: {e}")
+                continue
+            for stat, value in values.items():
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    family.add_metric([component, stat], value)
+        yield family
+
+
+# Coletores globais (lidos a cada scrape de /metrics)
+cache_collector = CacheCollector()
+stats_collector = StatsCollector()
+REGISTRY.register(cache_collector)
+REGISTRY.register(stats_collector)
+
+
+class EventLoopLagMonitor:
+    """Mede periodicamente quanto o event loop atrasa para acordar um sleep"""
+
+    def __init__(self, interval: float):
+        """
+        Args:
+            interval: Segundos entre medições
+        """
+        self.interval = interval
+        self._task: Optional[asyncio.Task] = None
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            start = loop.time()
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, loop.time() - start - self.interval)
+            EVENT_LOOP_LAG.observe(lag)
+            EVENT_LOOP_LAG_LAST.set(lag)
+
+    async def start(self) -> None:
+        """Iniciar medição em segundo plano"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Parar a medição"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+# Instância global do monitor do event loop
+event_loop_monitor = EventLoopLagMonitor(settings.EVENT_LOOP_LAG_INTERVAL)
@@ -3,7 +3,9 @@ Modelos de dados para o BR Data Bot
 """
 from datetime import datetime
 from typing import Optional
-from sqlalchemy import Column, Integer, String, DateTime, Boolean, Text, Enum
+from sqlalchemy import (
+    Column, Integer, BigInteger, String, DateTime, Boolean, Text, Enum, Index, ARRAY
+)
 from sqlalchemy.ext.declarative import declarative_base
 import enum
 
@@ -45,10 +47,19 @@ class User(Base):
 
 
 class QueryLog(Base):
-    """Log de consultas realizadas (anonimizado)"""
+    """Log de consultas realizadas (anonimizado), particionado por mês em created_at"""
     __tablename__ = "query_logs"
+    __table_args__ = (
+        # Índices alinhados às agregações do painel (filtros + período)
+        Index("ix_query_logs_created_at", "created_at"),
+        Index("ix_query_logs_query_type_created_at", "query_type", "created_at"),
+        Index("ix_query_logs_platform_created_at", "platform", "created_at"),
+        Index("ix_query_logs_user_id_hash_created_at", "user_id_hash", "created_at"),
+        {"postgresql_partition_by": "RANGE (created_at)"},
+    )
     
-    id = Column(Integer, primary_key=True)
+    # A chave de partição precisa fazer parte da chave primária
+    id = Column(Integer, primary_key=True, autoincrement=True)
     user_id_hash = Column(String(255), nullable=False)  # Hash do ID do usuário
     platform = Column(Enum(Platform), nullable=False)
     query_type = Column(Enum(QueryType), nullable=False)
@@ -57,7 +68,22 @@ class QueryLog(Base):
     error_message = Column(Text)
     response_time_ms = Column(Integer)
     ip_address_hash = Column(String(255))  # Hash do IP
-    created_at = Column(DateTime, default=datetime.utcnow)
+    created_at = Column(DateTime, primary_key=True, default=datetime.utcnow)
+
+
+class QueryLogRollup(Base):
+    """Contadores pré-agregados de query_logs por período (painel administrativo)"""
+    __tablename__ = "query_log_rollups"
+    
+    granularity = Column(String(10), primary_key=True)  # hour ou day
+    bucket_start = Column(DateTime, primary_key=True)
+    platform = Column(Enum(Platform), primary_key=True)
+    query_type = Column(Enum(QueryType), primary_key=True)
+    result_status = Column(String(50), primary_key=True)
+    count = Column(BigInteger, nullable=False, default=0)
+    latency_count = Column(BigInteger, nullable=False, default=0)  # Consultas com response_time_ms
+    latency_sum_ms = Column(BigInteger, nullable=False, default=0)
+    latency_histogram = Column(ARRAY(BigInteger))  # Contagens por faixa de rollups.LATENCY_BUCKETS_MS
 
 
 class RateLimit(Base):
@@ -75,6 +101,12 @@ class RateLimit(Base):
 class AdminLog(Base):
     """Log de ações administrativas"""
     __tablename__ = "admin_logs"
+    __table_args__ = (
+        Index("ix_admin_logs_created_at", "created_at"),
+        Index("ix_admin_logs_admin_username_created_at", "admin_username", "created_at"),
+        Index("ix_admin_logs_action_created_at", "action", "created_at"),
+        Index("ix_admin_logs_target_user_id_created_at", "target_user_id", "created_at"),
+    )
     
     id = Column(Integer, primary_key=True)
     admin_username = Column(String(255), nullable=False)
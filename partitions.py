@@ -0,0 +1,189 @@
+"""
+Manutenção das partições mensais de query_logs (criação antecipada e retenção)
+"""
+import asyncio
+import logging
+import re
+from datetime import date, datetime
+from typing import List, Optional
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+PARENT_TABLE = "query_logs"
+DEFAULT_PARTITION = f"{PARENT_TABLE}_default"
+_PARTITION_NAME = re.compile(rf"^{PARENT_TABLE}_(\d{{4}})_(\d{{2}})$")
+
+
+def _add_months(month: date, months: int) -> date:
+    """Somar meses a uma data de início de mês"""
+    index = month.year * 12 + month.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(month: date) -> str:
+    """Nome da partição de um mês (query_logs_AAAA_MM)"""
+    return f"{PARENT_TABLE}_{month.year:04d}_{month.month:02d}"
+
+
+def _create_month_partition(conn, name: str, start: date, end: date) -> int:
+    """
+    Criar a partição de um mês, movendo antes as linhas do mês que caíram na
+    partição padrão (com elas lá, CREATE TABLE ... PARTITION OF falharia)
+
+    Returns:
+        Quantidade de linhas movidas da partição padrão
+    """
+    bounds = f"FOR VALUES FROM ('{start.isoformat()}') TO ('{end.isoformat()}')"
+    if conn.execute(text("SELECT to_regclass(:name)"), {"name": name}).scalar() is not None:
+        return 0
+
+    moved = 0
+    if conn.execute(text("SELECT to_regclass(:name)"), {"name": DEFAULT_PARTITION}).scalar() is not None:
+        moved = conn.execute(text(
+            f"SELECT count(*) FROM {DEFAULT_PARTITION} WHERE created_at >= :start AND created_at < :end"
+        ), {"start": start, "end": end}).scalar()
+
+    if not moved:
+        conn.execute(text(f"CREATE TABLE {name} PARTITION OF {PARENT_TABLE} {bounds}"))
+        return 0
+
+    # Tabela avulsa recebe as linhas e só então é anexada como partição do mês
+    logger.warning(f"Moving {moved} query log rows from {DEFAULT_PARTITION} to {name}")
+    conn.execute(text(f"CREATE TABLE {name} (LIKE {PARENT_TABLE} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)"))
+    conn.execute(text(
+        f"WITH moved AS (DELETE FROM {DEFAULT_PARTITION} "
+        f"WHERE created_at >= :start AND created_at < :end RETURNING *) "
+        f"INSERT INTO {name} SELECT * FROM moved"
+    ), {"start": start, "end": end})
+    conn.execute(text(f"ALTER TABLE {PARENT_TABLE} ATTACH PARTITION {name} {bounds}"))
+    return moved
+
+
+def ensure_query_log_partitions(engine: Engine, months_ahead: int) -> List[str]:
+    """
+    Criar as partições do mês atual e dos próximos meses, além da partição padrão
+
+    Args:
+        engine: Engine síncrona do PostgreSQL
+        months_ahead: Quantidade de meses futuros a criar
+
+    Returns:
+        Nomes das partições garantidas
+    """
+    current = datetime.utcnow().date().replace(day=1)
+    created = []
+
+    # Uma transação por mês: a falha de um mês não impede os demais
+    for offset in range(months_ahead + 1):
+        start = _add_months(current, offset)
+        end = _add_months(start, 1)
+        name = partition_name(start)
+        try:
+            with engine.begin() as conn:
+                _create_month_partition(conn, name, start, end)
+            created.append(name)
+        except Exception as e:
+            logger.error(f"Failed to create query log partition {name}: {e}")
+
+    # Rede de segurança para linhas fora das partições mensais
+    with engine.begin() as conn:
+        conn.execute(text(
+            f"CREATE TABLE IF NOT EXISTS {DEFAULT_PARTITION} PARTITION OF {PARENT_TABLE} DEFAULT"
+        ))
+
+    return created
+
+
+def drop_expired_partitions(engine: Engine, retention_months: int) -> List[str]:
+    """
+    Remover partições inteiras mais antigas que a retenção (sem DELETE linha a linha)
+
+    Args:
+        engine: Engine síncrona do PostgreSQL
+        retention_months: Meses completos mantidos além do mês atual
+
+    Returns:
+        Nomes das partições removidas
+    """
+    cutoff = _add_months(datetime.utcnow().date().replace(day=1), -retention_months)
+    dropped = []
+
+    with engine.begin() as conn:
+        names = conn.execute(text(
+            "SELECT child.relname FROM pg_inherits "
+            "JOIN pg_class parent ON parent.oid = pg_inherits.inhparent "
+            "JOIN pg_class child ON child.oid = pg_inherits.inhrelid "
+            "WHERE parent.relname = :parent"
+        ), {"parent": PARENT_TABLE}).scalars().all()
+
+        for name in names:
+            match = _PARTITION_NAME.match(name)
+            if not match:
+                continue
+            month = date(int(match.group(1)), int(match.group(2)), 1)
+            if month < cutoff:
+                conn.execute(text(f"DROP TABLE IF EXISTS {name}"))
+                dropped.append(name)
+
+    return dropped
+
+
+class PartitionMaintenance:
+    """Tarefa periódica de criação e retenção de partições"""
+
+    def __init__(self, engine: Engine, interval: int, months_ahead: int, retention_months: int):
+        """
+        Args:
+            engine: Engine síncrona do PostgreSQL
+            interval: Segundos entre execuções
+            months_ahead: Meses futuros com partição pré-criada
+            retention_months: Meses mantidos antes de remover a partição
+        """
+        self.engine = engine
+        self.interval = interval
+        self.months_ahead = months_ahead
+        self.retention_months = retention_months
+        self._task: Optional[asyncio.Task] = None
+
+    def run_once(self) -> None:
+        """Executar uma rodada de manutenção (bloqueante)"""
+        if self.engine.dialect.name != "postgresql":
+            return
+        # Retenção roda mesmo se a criação falhar (e vice-versa)
+        try:
+            ensure_query_log_partitions(self.engine, self.months_ahead)
+        except Exception as e:
+            logger.error(f"Query log partition creation failed: {e}")
+        try:
+            dropped = drop_expired_partitions(self.engine, self.retention_months)
+        except Exception as e:
+            logger.error(f"Query log partition retention failed: {e}")
+            return
+        if dropped:
+            logger.info(f"Dropped expired query log partitions: {', '.join(dropped)}")
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await asyncio.to_thread(self.run_once)
+            except Exception as e:
+                logger.error(f"Partition maintenance failed: {e}")
+            await asyncio.sleep(self.interval)
+
+    async def start(self) -> None:
+        """Iniciar manutenção periódica em segundo plano"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Parar a manutenção periódica"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
@@ -0,0 +1,201 @@
+"""
+Ingestão assíncrona de QueryLog: fila limitada em memória e gravação em lote
+em segundo plano, fora do caminho da resposta ao usuário
+"""
+import asyncio
+import logging
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Union
+from sqlalchemy import insert
+from config import settings
+from database import AsyncSessionLocal
+from models import QueryLog, Platform, QueryType
+from rollups import usage_rollups
+from security import hash_user_id, hash_ip_address
+
+logger = logging.getLogger(__name__)
+
+# Colunas gravadas (id é gerado pelo banco)
+QUERY_LOG_COLUMNS = [
+    column.name for column in QueryLog.__table__.columns if column.name != "id"
+]
+
+
+class QueryLogIngestor:
+    """Fila de logs de consulta com backpressure por descarte"""
+
+    def __init__(self, queue_size: int, batch_size: int, flush_interval_ms: int):
+        """
+        Args:
+            queue_size: Máximo de registros aguardando gravação
+            batch_size: Máximo de registros por INSERT
+            flush_interval_ms: Tempo máximo que um registro espera pelo lote
+        """
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval_ms / 1000
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self._task: Optional[asyncio.Task] = None
+        self._writing: Optional[asyncio.Task] = None
+        self._batch: List[Dict[str, Any]] = []
+        self.submitted = 0
+        self.dropped = 0
+        self.written = 0
+        self.failed = 0
+        self.batches = 0
+
+    def submit(self, record: Union[QueryLog, Dict[str, Any]]) -> bool:
+        """
+        Enfileirar registro sem bloquear (descarta se a fila estiver cheia)
+
+        Args:
+            record: QueryLog ou dicionário com as colunas de query_logs
+
+        Returns:
+            True se enfileirado, False se descartado
+        """
+        if isinstance(record, QueryLog):
+            row = {name: getattr(record, name) for name in QUERY_LOG_COLUMNS}
+        else:
+            row = {name: record.get(name) for name in QUERY_LOG_COLUMNS}
+        if row["created_at"] is None:
+            row["created_at"] = datetime.utcnow()
+
+        try:
+            self._queue.put_nowait(row)
+        except asyncio.QueueFull:
+            self.dropped += 1
+            if self.dropped % 1000 == 1:
+                logger.warning(
+                    f"Query log queue full, {self.dropped} record(s) dropped so far",
+                    extra={"platform": row["platform"], "query_type": row["query_type"]}
+                )
+            return False
+
+        self.submitted += 1
+        return True
+
+    def log_query(
+        self,
+        user_id: str,
+        platform: Platform,
+        query_type: QueryType,
+        result_status: str,
+        response_time_ms: Optional[int] = None,
+        query_input: Optional[str] = None,
+        error_message: Optional[str] = None,
+        ip_address: Optional[str] = None
+    ) -> bool:
+        """
+        Registrar consulta anonimizando usuário e IP
+
+        Args:
+            user_id: ID do usuário (será convertido em hash)
+            platform: Plataforma
+            query_type: Tipo de consulta
+            result_status: success, error, rate_limited, etc
+            response_time_ms: Tempo de resposta
+            query_input: Entrada da consulta (já anonimizada)
+            error_message: Mensagem de erro
+            ip_address: IP do usuário (será convertido em hash)
+
+        Returns:
+            True se enfileirado, False se descartado
+        """
+        return self.submit({
+            "user_id_hash": hash_user_id(user_id),
+            "platform": platform,
+            "query_type": query_type,
+            "query_input": query_input,
+            "result_status": result_status,
+            "error_message": error_message,
+            "response_time_ms": response_time_ms,
+            "ip_address_hash": hash_ip_address(ip_address) if ip_address else None
+        })
+
+    async def _write(self, rows: List[Dict[str, Any]]) -> None:
+        """Gravar lote com um INSERT multi-linhas e atualizar os rollups do painel"""
+        try:
+            async with AsyncSessionLocal() as db:
+                await db.execute(insert(QueryLog), rows)
+                await db.commit()
+        except Exception as e:
+            self.failed += len(rows)
+            logger.error(f"Failed to write {len(rows)} query log(s): {e}")
+            return
+
+        self.written += len(rows)
+        self.batches += 1
+        # Só depois do commit: o painel não conta consultas que não foram gravadas
+        await usage_rollups.record_batch(rows)
+
+    async def _next_batch(self) -> List[Dict[str, Any]]:
+        """Aguardar o primeiro registro e completar o lote até o prazo"""
+        rows = self._batch
+        rows.append(await self._queue.get())
+        deadline = asyncio.get_running_loop().time() + self.flush_interval
+
+        while len(rows) < self.batch_size:
+            timeout = deadline - asyncio.get_running_loop().time()
+            if timeout <= 0:
+                break
+            try:
+                rows.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return rows
+
+    def _drain(self) -> List[Dict[str, Any]]:
+        rows, self._batch = self._batch, []
+        while not self._queue.empty():
+            rows.append(self._queue.get_nowait())
+        return rows
+
+    async def _run(self) -> None:
+        while True:
+            rows = await self._next_batch()
+            # Lote entregue à gravação antes do await: _drain não o devolve à fila.
+            # A gravação é protegida do cancelamento; stop() espera por ela
+            self._batch = []
+            self._writing = asyncio.create_task(self._write(rows))
+            await asyncio.shield(self._writing)
+
+    async def start(self) -> None:
+        """Iniciar gravação em segundo plano"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Parar o worker e gravar os registros restantes"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._writing is not None:
+            await self._writing
+            self._writing = None
+
+        rows = self._drain()
+        for start in range(0, len(rows), self.batch_size):
+            await self._write(rows[start:start + self.batch_size])
+
+    def stats(self) -> Dict[str, int]:
+        """Contadores da ingestão"""
+        return {
+            "queued": self._queue.qsize(),
+            "submitted": self.submitted,
+            "dropped": self.dropped,
+            "written": self.written,
+            "failed": self.failed,
+            "batches": self.batches
+        }
+
+
+# Instância global da ingestão de logs de consulta
+query_log_ingestor = QueryLogIngestor(
+    queue_size=settings.QUERY_LOG_QUEUE_SIZE,
+    batch_size=settings.QUERY_LOG_BATCH_SIZE,
+    flush_interval_ms=settings.QUERY_LOG_FLUSH_INTERVAL_MS
+)
@@ -0,0 +1,266 @@
+"""
+Rate limiting assíncrono: janela deslizante ou token bucket em uma única
+ida ao Redis (script Lua), com limitador local quando o Redis está fora
+"""
+import itertools
+import logging
+import math
+import os
+import time
+from collections import OrderedDict, deque
+from typing import Optional, Tuple
+from metrics import observe_redis
+
+logger = logging.getLogger(__name__)
+
+ALGORITHM_SLIDING_WINDOW = "sliding_window"
+ALGORITHM_TOKEN_BUCKET = "token_bucket"
+
+# Resultado do controle de admissão
+ADMISSION_ALLOWED = "allowed"
+ADMISSION_RATE_LIMITED = "rate_limited"
+ADMISSION_BLOCKED = "blocked"
+
+# Horário do próprio Redis, para não depender do relógio de cada worker
+_NOW_MS_LUA = """
+local t = redis.call('TIME')
+local now = tonumber(t[1]) * 1000 + math.floor(tonumber(t[2]) / 1000)
+"""
+
+# KEYS[1]: chave do limite | ARGV: janela (ms), limite, id único da requisição
+# Retorna {permitido, espera_ms}
+SLIDING_WINDOW_LUA = _NOW_MS_LUA + """
+local key = KEYS[1]
+local window = tonumber(ARGV[1])
+local limit = tonumber(ARGV[2])
+redis.call('ZREMRANGEBYSCORE', key, 0, now - window)
+if redis.call('ZCARD', key) < limit then
+    redis.call('ZADD', key, now, ARGV[3])
+    redis.call('PEXPIRE', key, window)
+    return {1, 0}
+end
+local oldest = redis.call('ZRANGE', key, 0, 0, 'WITHSCORES')
+return {0, window - (now - tonumber(oldest[2]))}
+"""
+
+# KEYS[1]: chave do bucket | ARGV: capacidade, tokens por ms, custo
+# Retorna {permitido, espera_ms}
+TOKEN_BUCKET_LUA = _NOW_MS_LUA + """
+local key = KEYS[1]
+local capacity = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local cost = tonumber(ARGV[3])
+local bucket = redis.call('HMGET', key, 'tokens', 'ts')
+local tokens = tonumber(bucket[1]) or capacity
+local ts = tonumber(bucket[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+local allowed = 0
+local wait = 0
+if tokens >= cost then
+    tokens = tokens - cost
+    allowed = 1
+else
+    wait = math.ceil((cost - tokens) / rate)
+end
+redis.call('HSET', key, 'tokens', tostring(tokens), 'ts', now)
+redis.call('PEXPIRE', key, math.ceil(capacity / rate))
+return {allowed, wait}
+"""
+
+
+# Prefixo do controle de admissão: KEYS[2] é a chave de bloqueio do usuário.
+# Usuário bloqueado retorna {-1, ttl_do_bloqueio_s} (-1 = permanente) sem consumir o limite
+ADMISSION_LUA_PREFIX = """
+local block_ttl = redis.call('TTL', KEYS[2])
+if block_ttl ~= -2 then
+    return {-1, block_ttl}
+end
+"""
+
+
+class LocalRateLimiter:
+    """Limitador em memória do processo, usado quando o Redis não responde"""
+
+    def __init__(self, algorithm: str, limit: int, period: int, burst: int, max_keys: int):
+        self.algorithm = algorithm
+        self.limit = limit
+        self.period = period
+        self.burst = burst
+        self.max_keys = max_keys
+        self._state: "OrderedDict[str, object]" = OrderedDict()
+
+    def _touch(self, key: str, factory):
+        state = self._state.get(key)
+        if state is None:
+            state = factory()
+            self._state[key] = state
+            if len(self._state) > self.max_keys:
+                self._state.popitem(last=False)
+        else:
+            self._state.move_to_end(key)
+        return state
+
+    def hit(self, key: str) -> Tuple[bool, float]:
+        """
+        Registrar requisição
+
+        Returns:
+            Tupla (permitido, segundos_ate_liberar)
+        """
+        now = time.monotonic()
+
+        if self.algorithm == ALGORITHM_TOKEN_BUCKET:
+            bucket = self._touch(key, lambda: [float(self.burst), now])
+            rate = self.limit / self.period
+            bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * rate)
+            bucket[1] = now
+            if bucket[0] >= 1:
+                bucket[0] -= 1
+                return True, 0.0
+            return False, (1 - bucket[0]) / rate
+
+        window = self._touch(key, deque)
+        while window and window[0] <= now - self.period:
+            window.popleft()
+        if len(window) < self.limit:
+            window.append(now)
+            return True, 0.0
+        return False, self.period - (now - window[0])
+
+    def refund(self, key: str) -> None:
+        """Devolver a última requisição registrada por hit (não usada)"""
+        state = self._state.get(key)
+        if state is None:
+            return
+        if self.algorithm == ALGORITHM_TOKEN_BUCKET:
+            state[0] = min(self.burst, state[0] + 1)
+        elif state:
+            state.pop()
+
+    def reset(self, key: str) -> None:
+        self._state.pop(key, None)
+
+
+class RateLimiter:
+    """Rate limiter distribuído (Redis assíncrono) com fallback local"""
+
+    def __init__(
+        self,
+        redis_client,
+        algorithm: str,
+        limit: int,
+        period: int,
+        burst: int,
+        local_max_keys: int = 100000,
+        retry_interval: float = 5.0
+    ):
+        """
+        Args:
+            redis_client: Cliente redis.asyncio (None usa apenas o limitador local)
+            algorithm: "sliding_window" ou "token_bucket"
+            limit: Requisições permitidas por período
+            period: Período em segundos
+            burst: Capacidade do bucket (token_bucket)
+            local_max_keys: Máximo de usuários rastreados pelo limitador local
+            retry_interval: Segundos usando só o limitador local após uma falha do Redis
+        """
+        if algorithm not in (ALGORITHM_SLIDING_WINDOW, ALGORITHM_TOKEN_BUCKET):
+            raise ValueError(f"Unknown rate limit algorithm: {algorithm}")
+
+        self.redis_client = redis_client
+        self.algorithm = algorithm
+        self.limit = limit
+        self.period = period
+        self.burst = burst
+        self.local = LocalRateLimiter(algorithm, limit, period, burst, local_max_keys)
+        self.retry_interval = retry_interval
+        self.fallbacks = 0
+        self._redis_healthy = True
+        self._retry_at = 0.0
+        self._ids = itertools.count()
+        self._script = None
+        self._admission_script = None
+        if redis_client is not None:
+            lua = SLIDING_WINDOW_LUA if algorithm == ALGORITHM_SLIDING_WINDOW else TOKEN_BUCKET_LUA
+            self._script = redis_client.register_script(lua)
+            self._admission_script = redis_client.register_script(ADMISSION_LUA_PREFIX + lua)
+
+    def key(self, identifier: str) -> str:
+        """Chave Redis do limite de um identificador"""
+        return f"rate_limit:{self.algorithm}:{identifier}"
+
+    def script_args(self) -> list:
+        """Argumentos do script Lua para o algoritmo configurado"""
+        if self.algorithm == ALGORITHM_SLIDING_WINDOW:
+            request_id = f"{time.time_ns()}-{os.getpid()}-{next(self._ids)}"
+            return [self.period * 1000, self.limit, request_id]
+        return [self.burst, self.limit / (self.period * 1000), 1]
+
+    def _mark_redis(self, healthy: bool, error: Exception = None) -> None:
+        """Registrar mudança de estado do Redis (loga só na transição)"""
+        if healthy and not self._redis_healthy:
+            logger.info("Rate limiter: Redis available again")
+        elif not healthy and self._redis_healthy:
+            logger.error(f"Rate limiter: Redis unavailable, using local limiter: {error}")
+        self._redis_healthy = healthy
+
+    async def _eval(self, script, keys: list) -> Optional[list]:
+        """Executar script no Redis; None se indisponível"""
+        if script is None:
+            return None
+        # Redis fora há pouco: nem tenta, para não pagar o timeout a cada mensagem
+        if time.monotonic() < self._retry_at:
+            self.fallbacks += 1
+            return None
+        try:
+            with observe_redis("rate_limit"):
+                result = await script(keys=keys, args=self.script_args())
+            self._mark_redis(True)
+            return result
+        except Exception as e:
+            self.fallbacks += 1
+            self._retry_at = time.monotonic() + self.retry_interval
+            self._mark_redis(False, e)
+            return None
+
+    async def hit(self, identifier: str) -> Tuple[bool, int]:
+        """
+        Registrar requisição e verificar o limite
+
+        Args:
+            identifier: Identificador do cliente (ex.: "telegram:123")
+
+        Returns:
+            Tupla (permitido, segundos_ate_liberar)
+        """
+        result = await self._eval(self._script, [self.key(identifier)])
+        if result is not None:
+            allowed, wait_ms = result
+            return bool(allowed), math.ceil(int(wait_ms) / 1000)
+
+        allowed, wait = self.local.hit(identifier)
+        return allowed, math.ceil(wait)
+
+    async def admit(self, identifier: str, blocked_key: str) -> Tuple[str, int]:
+        """
+        Verificar bloqueio e rate limit em uma única chamada ao Redis
+
+        Args:
+            identifier: Identificador do cliente (ex.: "telegram:123")
+            blocked_key: Chave Redis de bloqueio do cliente
+
+        Returns:
+            Tupla (status, segundos): espera do rate limit ou TTL do bloqueio
+            (-1 = bloqueio permanente)
+        """
+        result = await self._eval(self._admission_script, [self.key(identifier), blocked_key])
+        if result is None:
+            allowed, wait = self.local.hit(identifier)
+            return (ADMISSION_ALLOWED if allowed else ADMISSION_RATE_LIMITED), math.ceil(wait)
+
+        status, value = int(result[0]), int(result[1])
+        if status == -1:
+            return ADMISSION_BLOCKED, value
+        if status == 1:
+            return ADMISSION_ALLOWED, 0
+        return ADMISSION_RATE_LIMITED, math.ceil(value / 1000)
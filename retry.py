@@ -0,0 +1,147 @@
+"""
+Política de retentativas das APIs externas: backoff exponencial com jitter
+e orçamento de retentativas por host (evita tempestades de retry)
+"""
+import random
+import time
+from typing import Dict, Optional
+import httpx
+from config import settings
+from http_clients import host_key
+
+# Status transitórios que justificam nova tentativa de um GET
+RETRYABLE_STATUS = frozenset({429, 500, 502, 503, 504})
+
+# Falhas de transporte em que o pedido pode ser repetido com segurança
+RETRYABLE_ERRORS = (
+    httpx.ConnectError,
+    httpx.ConnectTimeout,
+    httpx.ReadError,
+    httpx.RemoteProtocolError,
+    httpx.PoolTimeout
+)
+
+
+class RetryBudget:
+    """
+    Orçamento de retentativas de um host: cada requisição deposita uma fração
+    de ficha e cada retry (ou requisição hedged) consome uma ficha inteira
+    """
+
+    def __init__(self, ratio: float, min_per_second: float, max_tokens: float):
+        """
+        Args:
+            ratio: Retries permitidos por requisição original (ex.: 0.1 = 10%)
+            min_per_second: Retries sempre permitidos por segundo (tráfego baixo)
+            max_tokens: Acúmulo máximo de fichas
+        """
+        self.ratio = ratio
+        self.min_per_second = min_per_second
+        self.max_tokens = max_tokens
+        self._tokens = max_tokens
+        self._updated = time.monotonic()
+        self.withdrawn = 0
+        self.exhausted = 0
+
+    def _refill(self, amount: float) -> None:
+        now = time.monotonic()
+        amount += (now - self._updated) * self.min_per_second
+        self._updated = now
+        self._tokens = min(self.max_tokens, self._tokens + amount)
+
+    def deposit(self) -> None:
+        """Registrar requisição original"""
+        self._refill(self.ratio)
+
+    def try_withdraw(self) -> bool:
+        """
+        Consumir uma ficha para um retry
+
+        Returns:
+            False se o orçamento do host estiver esgotado
+        """
+        self._refill(0.0)
+        if self._tokens < 1:
+            self.exhausted += 1
+            return False
+        self._tokens -= 1
+        self.withdrawn += 1
+        return True
+
+
+class RetryPolicy:
+    """Tentativas máximas e backoff exponencial com jitter completo"""
+
+    def __init__(self, max_attempts: int, base_delay: float, max_delay: float):
+        """
+        Args:
+            max_attempts: Total de tentativas (1 = sem retry)
+            base_delay: Atraso base em segundos
+            max_delay: Atraso máximo em segundos
+        """
+        self.max_attempts = max(1, max_attempts)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def backoff(self, attempt: int, retry_after: Optional[float] = None) -> float:
+        """
+        Atraso antes da próxima tentativa
+
+        Args:
+            attempt: Tentativa que acabou de falhar (1 = primeira)
+            retry_after: Valor do cabeçalho Retry-After, se houver
+
+        Returns:
+            Segundos a aguardar
+        """
+        if retry_after is not None:
+            return min(self.max_delay, max(0.0, retry_after))
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+
+
+def retry_after_seconds(response: httpx.Response) -> Optional[float]:
+    """Ler Retry-After em segundos (formato de data é ignorado)"""
+    value = response.headers.get("Retry-After")
+    if value is None:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        return None
+
+
+class RetryBudgetRegistry:
+    """Um orçamento de retentativas por host (scheme://host)"""
+
+    def __init__(self):
+        self._budgets: Dict[str, RetryBudget] = {}
+
+    def get(self, url: str) -> RetryBudget:
+        """
+        Obter o orçamento do host de uma URL
+
+        Args:
+            url: URL que será requisitada
+
+        Returns:
+            Orçamento de retentativas do host
+        """
+        host = host_key(url)
+        budget = self._budgets.get(host)
+        if budget is None:
+            budget = RetryBudget(
+                ratio=settings.HTTP_RETRY_BUDGET_RATIO,
+                min_per_second=settings.HTTP_RETRY_BUDGET_MIN_PER_SECOND,
+                max_tokens=settings.HTTP_RETRY_BUDGET_MAX_TOKENS
+            )
+            self._budgets[host] = budget
+        return budget
+
+
+# Instâncias globais
+retry_policy = RetryPolicy(
+    max_attempts=settings.HTTP_RETRY_MAX_ATTEMPTS,
+    base_delay=settings.HTTP_RETRY_BASE_DELAY,
+    max_delay=settings.HTTP_RETRY_MAX_DELAY
+)
+retry_budgets = RetryBudgetRegistry()
@@ -0,0 +1,353 @@
+"""
+Rollups de uso para o painel administrativo: contadores por minuto/hora/dia
+por plataforma, tipo de consulta e status, com histogramas de latência
+"""
+import bisect
+import enum
+import logging
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from sqlalchemy import literal_column, select
+from sqlalchemy.dialects.postgresql import insert
+from config import settings
+from database import AsyncSessionLocal
+from metrics import observe_redis
+from models import QueryLogRollup, Platform, QueryType
+from security import async_redis_client
+
+logger = logging.getLogger(__name__)
+
+# Limites superiores (ms) das faixas do histograma; a última faixa é "acima de 10s"
+LATENCY_BUCKETS_MS = (50, 100, 250, 500, 1000, 2500, 5000, 10000)
+HISTOGRAM_SIZE = len(LATENCY_BUCKETS_MS) + 1
+
+GRANULARITY_SECONDS = {"minute": 60, "hour": 3600, "day": 86400}
+
+# Retenção dos contadores no Redis (segundos)
+REDIS_RETENTION = {"minute": 2 * 86400, "hour": 14 * 86400, "day": 90 * 86400}
+
+# Granularidades persistidas na tabela de resumo
+TABLE_GRANULARITIES = ("hour", "day")
+
+# Leitura máxima de buckets por minuto no Redis
+MAX_MINUTE_BUCKETS = 1440
+
+# Soma elemento a elemento dos histogramas no upsert
+_MERGE_HISTOGRAM_SQL = (
+    "ARRAY(SELECT x + y FROM unnest("
+    "query_log_rollups.latency_histogram, excluded.latency_histogram"
+    ") WITH ORDINALITY AS u(x, y, i) ORDER BY i)"
+)
+
+RollupKey = Tuple[str, datetime, str, str, str]
+
+
+def _value(value: Any) -> str:
+    return value.value if isinstance(value, enum.Enum) else str(value)
+
+
+def bucket_start(moment: datetime, granularity: str) -> datetime:
+    """
+    Início do bucket que contém o instante
+
+    Args:
+        moment: Instante em UTC (sem timezone, como em created_at)
+        granularity: minute, hour ou day
+
+    Returns:
+        Início do bucket em UTC
+    """
+    seconds = GRANULARITY_SECONDS[granularity]
+    epoch = int(moment.replace(tzinfo=timezone.utc).timestamp())
+    return datetime.fromtimestamp(epoch - epoch % seconds, timezone.utc).replace(tzinfo=None)
+
+
+def latency_bucket(response_time_ms: int) -> int:
+    """Índice da faixa do histograma para uma latência"""
+    return bisect.bisect_left(LATENCY_BUCKETS_MS, response_time_ms)
+
+
+def percentile(histogram: List[int], quantile: float) -> Optional[int]:
+    """
+    Percentil aproximado (limite superior da faixa) a partir do histograma
+
+    Args:
+        histogram: Contagens por faixa de LATENCY_BUCKETS_MS
+        quantile: Quantil entre 0 e 1
+
+    Returns:
+        Latência em ms, ou None se não houver amostras
+    """
+    total = sum(histogram)
+    if not total:
+        return None
+    target = quantile * total
+    running = 0
+    for index, count in enumerate(histogram):
+        running += count
+        if running >= target:
+            return LATENCY_BUCKETS_MS[min(index, len(LATENCY_BUCKETS_MS) - 1)]
+    return LATENCY_BUCKETS_MS[-1]
+
+
+class UsageRollups:
+    """Mantém os rollups no Redis e na tabela query_log_rollups"""
+
+    def __init__(self, redis_client=None):
+        self.redis_client = redis_client
+        self.errors = 0
+
+    def aggregate(self, rows: Iterable[Dict[str, Any]]) -> Dict[RollupKey, Dict[str, Any]]:
+        """
+        Agregar registros de QueryLog por granularidade e dimensões
+
+        Args:
+            rows: Registros com as colunas de query_logs
+
+        Returns:
+            Contadores por (granularidade, bucket, plataforma, tipo, status)
+        """
+        aggregated: Dict[RollupKey, Dict[str, Any]] = defaultdict(lambda: {
+            "count": 0,
+            "latency_count": 0,
+            "latency_sum_ms": 0,
+            "latency_histogram": [0] * HISTOGRAM_SIZE
+        })
+
+        for row in rows:
+            created_at = row.get("created_at") or datetime.utcnow()
+            dimensions = (
+                _value(row["platform"]),
+                _value(row["query_type"]),
+                row.get("result_status") or "unknown"
+            )
+            latency = row.get("response_time_ms")
+
+            for granularity in GRANULARITY_SECONDS:
+                start = bucket_start(created_at, granularity)
+                counters = aggregated[(granularity, start, *dimensions)]
+                counters["count"] += 1
+                if latency is not None:
+                    counters["latency_count"] += 1
+                    counters["latency_sum_ms"] += latency
+                    counters["latency_histogram"][latency_bucket(latency)] += 1
+
+        return aggregated
+
+    async def _write_redis(self, aggregated: Dict[RollupKey, Dict[str, Any]]) -> None:
+        """Incrementar contadores no Redis em um único pipeline"""
+        if self.redis_client is None:
+            return
+
+        pipe = self.redis_client.pipeline(transaction=False)
+        expirations = {}
+        for (granularity, start, platform, query_type, status), counters in aggregated.items():
+            key = f"rollup:{granularity}:{int(start.replace(tzinfo=timezone.utc).timestamp())}"
+            prefix = f"{platform}|{query_type}|{status}"
+            pipe.hincrby(key, f"{prefix}|count", counters["count"])
+            if counters["latency_count"]:
+                pipe.hincrby(key, f"{prefix}|lat_count", counters["latency_count"])
+                pipe.hincrby(key, f"{prefix}|lat_sum", counters["latency_sum_ms"])
+                for index, count in enumerate(counters["latency_histogram"]):
+                    if count:
+                        pipe.hincrby(key, f"{prefix}|h{index}", count)
+            expirations[key] = REDIS_RETENTION[granularity]
+
+        for key, ttl in expirations.items():
+            pipe.expire(key, ttl)
+        with observe_redis("rollup_write"):
+            await pipe.execute()
+
+    async def _write_table(self, aggregated: Dict[RollupKey, Dict[str, Any]]) -> None:
+        """Somar contadores horários e diários na tabela de resumo"""
+        values = []
+        for (granularity, start, platform, query_type, status), counters in aggregated.items():
+            if granularity not in TABLE_GRANULARITIES:
+                continue
+            try:
+                values.append({
+                    "granularity": granularity,
+                    "bucket_start": start,
+                    "platform": Platform(platform),
+                    "query_type": QueryType(query_type),
+                    "result_status": status,
+                    **counters
+                })
+            except ValueError:
+                logger.warning(f"Skipping rollup with unknown dimensions: {platform}/{query_type}")
+
+        if not values:
+            return
+
+        stmt = insert(QueryLogRollup).values(values)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[
+                QueryLogRollup.granularity,
+                QueryLogRollup.bucket_start,
+                QueryLogRollup.platform,
+                QueryLogRollup.query_type,
+                QueryLogRollup.result_status
+            ],
+            set_={
+                "count": QueryLogRollup.count + stmt.excluded["count"],
+                "latency_count": QueryLogRollup.latency_count + stmt.excluded.latency_count,
+                "latency_sum_ms": QueryLogRollup.latency_sum_ms + stmt.excluded.latency_sum_ms,
+                "latency_histogram": literal_column(_MERGE_HISTOGRAM_SQL)
+            }
+        )
+        async with AsyncSessionLocal() as db:
+            await db.execute(stmt)
+            await db.commit()
+
+    async def record_batch(self, rows: List[Dict[str, Any]]) -> None:
+        """
+        Atualizar os rollups com um lote de registros ingeridos
+
+        Args:
+            rows: Registros com as colunas de query_logs
+        """
+        if not settings.ROLLUPS_ENABLED or not rows:
+            return
+
+        aggregated = self.aggregate(rows)
+        for write in (self._write_redis, self._write_table):
+            try:
+                await write(aggregated)
+            except Exception as e:
+                self.errors += 1
+                logger.error(f"Failed to update usage rollups ({write.__name__}): {e}")
+
+    async def _read_redis(self, since: datetime, until: datetime) -> List[Dict[str, Any]]:
+        """Ler buckets por minuto do Redis"""
+        if self.redis_client is None:
+            return []
+
+        starts = []
+        current = bucket_start(since, "minute")
+        while current <= until and len(starts) < MAX_MINUTE_BUCKETS:
+            starts.append(current)
+            current += timedelta(minutes=1)
+
+        pipe = self.redis_client.pipeline(transaction=False)
+        for start in starts:
+            pipe.hgetall(f"rollup:minute:{int(start.replace(tzinfo=timezone.utc).timestamp())}")
+        with observe_redis("rollup_read"):
+            hashes = await pipe.execute()
+
+        buckets = []
+        for start, fields in zip(starts, hashes):
+            grouped: Dict[str, Dict[str, Any]] = {}
+            for field, raw in fields.items():
+                platform, query_type, status, name = field.split("|")
+                entry = grouped.setdefault(f"{platform}|{query_type}|{status}", {
+                    "bucket_start": start,
+                    "platform": platform,
+                    "query_type": query_type,
+                    "result_status": status,
+                    "count": 0,
+                    "latency_count": 0,
+                    "latency_sum_ms": 0,
+                    "latency_histogram": [0] * HISTOGRAM_SIZE
+                })
+                if name == "count":
+                    entry["count"] = int(raw)
+                elif name == "lat_count":
+                    entry["latency_count"] = int(raw)
+                elif name == "lat_sum":
+                    entry["latency_sum_ms"] = int(raw)
+                elif name.startswith("h"):
+                    entry["latency_histogram"][int(name[1:])] = int(raw)
+            buckets.extend(grouped.values())
+        return buckets
+
+    async def _read_table(
+        self,
+        granularity: str,
+        since: datetime,
+        until: datetime
+    ) -> List[Dict[str, Any]]:
+        """Ler buckets horários ou diários da tabela de resumo"""
+        async with AsyncSessionLocal() as db:
+            result = await db.execute(
+                select(QueryLogRollup).where(
+                    QueryLogRollup.granularity == granularity,
+                    QueryLogRollup.bucket_start >= bucket_start(since, granularity),
+                    QueryLogRollup.bucket_start <= until
+                ).order_by(QueryLogRollup.bucket_start)
+            )
+            return [
+                {
+                    "bucket_start": rollup.bucket_start,
+                    "platform": rollup.platform.value,
+                    "query_type": rollup.query_type.value,
+                    "result_status": rollup.result_status,
+                    "count": rollup.count,
+                    "latency_count": rollup.latency_count,
+                    "latency_sum_ms": rollup.latency_sum_ms,
+                    "latency_histogram": list(rollup.latency_histogram or [0] * HISTOGRAM_SIZE)
+                }
+                for rollup in result.scalars()
+            ]
+
+    async def summary(
+        self,
+        granularity: str,
+        since: datetime,
+        until: Optional[datetime] = None
+    ) -> Dict[str, Any]:
+        """
+        Estatísticas do painel em O(buckets)
+
+        Args:
+            granularity: minute (Redis), hour ou day (tabela de resumo)
+            since: Início do período (UTC)
+            until: Fim do período (UTC, padrão: agora)
+
+        Returns:
+            Buckets do período e totais por dimensão com latência média e percentis
+        """
+        if granularity not in GRANULARITY_SECONDS:
+            raise ValueError(f"Unknown granularity: {granularity}")
+
+        until = until or datetime.utcnow()
+        if granularity == "minute":
+            buckets = await self._read_redis(since, until)
+        else:
+            buckets = await self._read_table(granularity, since, until)
+
+        totals = {
+            "by_platform": defaultdict(int),
+            "by_query_type": defaultdict(int),
+            "by_status": defaultdict(int)
+        }
+        histogram = [0] * HISTOGRAM_SIZE
+        count = latency_count = latency_sum = 0
+        for bucket in buckets:
+            count += bucket["count"]
+            latency_count += bucket["latency_count"]
+            latency_sum += bucket["latency_sum_ms"]
+            totals["by_platform"][bucket["platform"]] += bucket["count"]
+            totals["by_query_type"][bucket["query_type"]] += bucket["count"]
+            totals["by_status"][bucket["result_status"]] += bucket["count"]
+            histogram = [a + b for a, b in zip(histogram, bucket["latency_histogram"])]
+
+        return {
+            "granularity": granularity,
+            "since": since.isoformat(),
+            "until": until.isoformat(),
+            "total_queries": count,
+            "by_platform": dict(totals["by_platform"]),
+            "by_query_type": dict(totals["by_query_type"]),
+            "by_status": dict(totals["by_status"]),
+            "avg_response_time_ms": round(latency_sum / latency_count, 1) if latency_count else None,
+            "p50_response_time_ms": percentile(histogram, 0.50),
+            "p95_response_time_ms": percentile(histogram, 0.95),
+            "latency_buckets_ms": list(LATENCY_BUCKETS_MS),
+            "latency_histogram": histogram,
+            "buckets": buckets
+        }
+
+
+# Instância global dos rollups
+usage_rollups = UsageRollups(async_redis_client)
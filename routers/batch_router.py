@@ -0,0 +1,117 @@
+"""
+Router da consulta de CNPJ em lote (equipe de compliance)
+"""
+import json
+import logging
+from fastapi import APIRouter, Depends, File, HTTPException, Query, UploadFile
+from fastapi.responses import StreamingResponse
+from fastapi.security import HTTPBasic, HTTPBasicCredentials
+from config import settings
+from security import verify_admin_credentials
+from batch_jobs import (
+    CSV_FIELDS, BatchTooLarge, batch_jobs, csv_line, parse_upload, result_csv_line
+)
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+basic_auth = HTTPBasic()
+
+# Tamanho máximo do arquivo (bytes por linha x BATCH_MAX_ITEMS)
+MAX_UPLOAD_BYTES = settings.BATCH_MAX_ITEMS * 256
+
+OUTPUT_FORMATS = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv; charset=utf-8"
+}
+
+
+def require_admin(credentials: HTTPBasicCredentials = Depends(basic_auth)) -> str:
+    """Autenticação HTTP Basic com as credenciais do painel administrativo"""
+    if not verify_admin_credentials(credentials.username, credentials.password):
+        raise HTTPException(
+            status_code=401,
+            detail="Invalid credentials",
+            headers={"WWW-Authenticate": "Basic"}
+        )
+    return credentials.username
+
+
+def _stream_results(job_id: str, offset: int, output_format: str, summary: dict) -> StreamingResponse:
+    """Resposta transmitida com os resultados do lote conforme ficam prontos"""
+
+    async def body():
+        if output_format == "csv":
+            yield csv_line(CSV_FIELDS)
+        async for result in batch_jobs.stream(job_id, offset):
+            if output_format == "csv":
+                yield result_csv_line(result)
+            else:
+                yield json.dumps(result, ensure_ascii=False) + "\n"
+
+    return StreamingResponse(
+        body(),
+        media_type=OUTPUT_FORMATS[output_format],
+        headers={
+            "X-Batch-Job-Id": job_id,
+            "X-Batch-Total": str(summary["total"]),
+            "X-Batch-Offset": str(offset)
+        }
+    )
+
+
+@router.post("/cnpj")
+async def submit_cnpj_batch(
+    file: UploadFile = File(...),
+    output_format: str = Query("ndjson", alias="format", pattern="^(ndjson|csv)$"),
+    username: str = Depends(require_admin)
+):
+    """
+    Enviar arquivo CSV/NDJSON de CNPJs e receber os resultados em streaming
+
+    O ID do lote vem no cabeçalho X-Batch-Job-Id; se a conexão cair, os
+    resultados continuam sendo gerados e podem ser lidos em GET /cnpj/{job_id}.
+    """
+    content = await file.read(MAX_UPLOAD_BYTES + 1)
+    if len(content) > MAX_UPLOAD_BYTES:
+        raise HTTPException(status_code=413, detail="File too large")
+
+    try:
+        documents = parse_upload(content, file.filename, file.content_type)
+    except BatchTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    if not documents:
+        raise HTTPException(status_code=400, detail="No CNPJs found in file")
+
+    job = await batch_jobs.submit(documents, username)
+    return _stream_results(job.id, 0, output_format, job.summary())
+
+
+@router.get("/cnpj/{job_id}")
+async def get_cnpj_batch_results(
+    job_id: str,
+    offset: int = Query(0, ge=0),
+    output_format: str = Query("ndjson", alias="format", pattern="^(ndjson|csv)$"),
+    username: str = Depends(require_admin)
+):
+    """
+    Retomar a leitura dos resultados a partir de offset
+
+    Lotes interrompidos (reinício do worker) voltam a ser executados.
+    """
+    summary = await batch_jobs.resume(job_id)
+    if summary is None:
+        raise HTTPException(status_code=404, detail="Batch job not found")
+    return _stream_results(job_id, offset, output_format, summary)
+
+
+@router.get("/cnpj/{job_id}/status")
+async def get_cnpj_batch_status(job_id: str, username: str = Depends(require_admin)):
+    """Progresso do lote"""
+    summary = await batch_jobs.status(job_id)
+    if summary is None:
+        raise HTTPException(status_code=404, detail="Batch job not found")
+    return summary
@@ -1,25 +1,100 @@
 """
 Módulo de segurança: rate limiting, hashing e validações
 """
+import asyncio
 import hashlib
 import logging
+import re
+import secrets
 import time
 from typing import Optional, Tuple
 from datetime import datetime, timedelta
 import redis
+import redis.asyncio as aioredis
 from config import settings
+from cache import CacheEntry, LRUCache
+from rate_limiter import (
+    RateLimiter,
+    ADMISSION_ALLOWED,
+    ADMISSION_BLOCKED,
+    ADMISSION_RATE_LIMITED
+)
 
 logger = logging.getLogger(__name__)
 
 # Conexão com Redis
 try:
-    redis_client = redis.from_url(settings.REDIS_URL, decode_responses=True)
+    redis_client = redis.from_url(
+        settings.REDIS_URL,
+        decode_responses=True,
+        socket_connect_timeout=settings.REDIS_SOCKET_CONNECT_TIMEOUT,
+        socket_timeout=settings.REDIS_SOCKET_TIMEOUT
+    )
     redis_client.ping()
     logger.info("Redis connected successfully")
 except Exception as e:
     logger.warning(f"Redis connection failed: {e}. Rate limiting will be limited.")
     redis_client = None
 
+# Conexão assíncrona com Redis (caminho quente dos handlers); conecta sob demanda.
+# Timeouts curtos: com o Redis fora, cada mensagem não pode esperar o TCP desistir
+try:
+    async_redis_client = aioredis.from_url(
+        settings.REDIS_URL,
+        decode_responses=True,
+        socket_connect_timeout=settings.REDIS_SOCKET_CONNECT_TIMEOUT,
+        socket_timeout=settings.REDIS_SOCKET_TIMEOUT
+    )
+except Exception as e:
+    logger.warning(f"Async Redis client creation failed: {e}. Using local rate limiter.")
+    async_redis_client = None
+
+# Leituras bloqueantes (pub/sub, XREADGROUP BLOCK): sem socket_timeout, que
+# interromperia a espera ociosa; conexão morta é detectada pelo keepalive do TCP
+try:
+    async_redis_blocking_client = aioredis.from_url(
+        settings.REDIS_URL,
+        decode_responses=True,
+        socket_connect_timeout=settings.REDIS_SOCKET_CONNECT_TIMEOUT,
+        socket_keepalive=True
+    ) if async_redis_client is not None else None
+except Exception as e:
+    logger.warning(f"Async Redis blocking client creation failed: {e}")
+    async_redis_blocking_client = None
+
+# Rate limiter distribuído com fallback local
+rate_limiter = RateLimiter(
+    async_redis_client,
+    algorithm=settings.RATE_LIMIT_ALGORITHM,
+    limit=settings.RATE_LIMIT_REQUESTS,
+    period=settings.RATE_LIMIT_PERIOD,
+    burst=settings.RATE_LIMIT_BURST or settings.RATE_LIMIT_REQUESTS,
+    local_max_keys=settings.RATE_LIMIT_LOCAL_MAX_KEYS,
+    retry_interval=settings.REDIS_RETRY_INTERVAL
+)
+
+# Cache local de usuários sabidamente bloqueados: floods de contas bloqueadas não chegam ao Redis
+blocked_users_cache = LRUCache(settings.BLOCKED_USER_CACHE_MAX_SIZE)
+
+
+def _cache_blocked(key: str, ttl: int) -> None:
+    """Guardar bloqueio no cache local (ttl -1 = bloqueio permanente)"""
+    if ttl < 0 or ttl > settings.BLOCKED_USER_CACHE_TTL:
+        ttl = settings.BLOCKED_USER_CACHE_TTL
+    expires_at = time.time() + ttl
+    blocked_users_cache.set(key, CacheEntry(True, expires_at, expires_at))
+
+
+async def close_async_redis() -> None:
+    """Fechar as conexões assíncronas com Redis"""
+    for client in (async_redis_client, async_redis_blocking_client):
+        if client is None:
+            continue
+        try:
+            await client.aclose()
+        except Exception as e:
+            logger.error(f"Failed to close async Redis client: {e}")
+
 
 def hash_user_id(user_id: str) -> str:
     """
@@ -47,7 +122,7 @@ def hash_ip_address(ip_address: str) -> str:
     return hashlib.sha256(ip_address.encode()).hexdigest()[:16]
 
 
-def check_rate_limit(user_id: str, platform: str) -> Tuple[bool, Optional[str]]:
+async def check_rate_limit(user_id: str, platform: str) -> Tuple[bool, Optional[str]]:
     """
     Verificar se o usuário excedeu o rate limit
     
@@ -58,29 +133,53 @@ def check_rate_limit(user_id: str, platform: str) -> Tuple[bool, Optional[str]]:
     Returns:
         Tupla (permitido, mensagem_erro)
     """
-    if not settings.RATE_LIMIT_ENABLED or redis_client is None:
+    if not settings.RATE_LIMIT_ENABLED:
         return True, None
     
-    try:
-        key = f"rate_limit:{platform}:{user_id}"
-        current_count = redis_client.incr(key)
-        
-        # Definir expiração na primeira requisição
-        if current_count == 1:
-            redis_client.expire(key, settings.RATE_LIMIT_PERIOD)
-        
-        if current_count > settings.RATE_LIMIT_REQUESTS:
-            remaining_time = redis_client.ttl(key)
-            message = f"Limite de requisições excedido. Tente novamente em {remaining_time} segundos."
-            logger.warning(f"Rate limit exceeded for {user_id} on {platform}")
-            return False, message
-        
-        return True, None
+    allowed, remaining_time = await rate_limiter.hit(f"{platform}:{user_id}")
+    
+    if not allowed:
+        message = f"Limite de requisições excedido. Tente novamente em {remaining_time} segundos."
+        logger.warning(f"Rate limit exceeded for {user_id} on {platform}")
+        return False, message
+    
+    return True, None
+
+
+async def check_admission(user_id: str, platform: str) -> Tuple[str, Optional[str]]:
+    """
+    Controle de admissão: bloqueio e rate limit em uma única ida ao Redis
+    
+    Args:
+        user_id: ID do usuário
+        platform: Plataforma (telegram ou whatsapp)
         
-    except Exception as e:
-        logger.error(f"Rate limit check error: {e}")
-        # Permitir em caso de erro
-        return True, None
+    Returns:
+        Tupla (status, mensagem_erro) com status "allowed", "blocked" ou "rate_limited"
+    """
+    blocked_key = f"blocked_user:{platform}:{user_id}"
+    
+    if blocked_users_cache.get(blocked_key, time.time()) is not None:
+        return ADMISSION_BLOCKED, None
+    
+    if not settings.RATE_LIMIT_ENABLED:
+        if await asyncio.to_thread(is_user_blocked, user_id, platform):
+            _cache_blocked(blocked_key, settings.BLOCKED_USER_CACHE_TTL)
+            return ADMISSION_BLOCKED, None
+        return ADMISSION_ALLOWED, None
+    
+    status, seconds = await rate_limiter.admit(f"{platform}:{user_id}", blocked_key)
+    
+    if status == ADMISSION_BLOCKED:
+        _cache_blocked(blocked_key, seconds)
+        return status, None
+    
+    if status == ADMISSION_RATE_LIMITED:
+        message = f"Limite de requisições excedido. Tente novamente em {seconds} segundos."
+        logger.warning(f"Rate limit exceeded for {user_id} on {platform}")
+        return status, message
+    
+    return status, None
 
 
 def reset_rate_limit(user_id: str, platform: str) -> None:
@@ -91,12 +190,13 @@ def reset_rate_limit(user_id: str, platform: str) -> None:
         user_id: ID do usuário
         platform: Plataforma
     """
+    rate_limiter.local.reset(f"{platform}:{user_id}")
+    
     if redis_client is None:
         return
     
     try:
-        key = f"rate_limit:{platform}:{user_id}"
-        redis_client.delete(key)
+        redis_client.delete(rate_limiter.key(f"{platform}:{user_id}"))
         logger.info(f"Rate limit reset for {user_id} on {platform}")
     except Exception as e:
         logger.error(f"Failed to reset rate limit: {e}")
@@ -111,11 +211,13 @@ def block_user(user_id: str, platform: str, duration_minutes: int = None) -> Non
         platform: Plataforma
         duration_minutes: Duração do bloqueio em minutos (None = permanente)
     """
+    key = f"blocked_user:{platform}:{user_id}"
+    _cache_blocked(key, duration_minutes * 60 if duration_minutes else -1)
+    
     if redis_client is None:
         return
     
     try:
-        key = f"blocked_user:{platform}:{user_id}"
         redis_client.set(key, "1")
         
         if duration_minutes:
@@ -156,20 +258,68 @@ def unblock_user(user_id: str, platform: str) -> None:
         user_id: ID do usuário
         platform: Plataforma
     """
+    key = f"blocked_user:{platform}:{user_id}"
+    blocked_users_cache.delete(key)
+    
     if redis_client is None:
         return
     
     try:
-        key = f"blocked_user:{platform}:{user_id}"
         redis_client.delete(key)
         logger.info(f"User {user_id} unblocked on {platform}")
     except Exception as e:
         logger.error(f"Failed to unblock user: {e}")
 
 
+# Pesos do módulo 11 para o primeiro e o segundo dígito verificador
+CPF_WEIGHTS = (tuple(range(10, 1, -1)), tuple(range(11, 1, -1)))
+CNPJ_WEIGHTS = ((5, 4, 3, 2, 9, 8, 7, 6, 5, 4, 3, 2), (6, 5, 4, 3, 2, 9, 8, 7, 6, 5, 4, 3, 2))
+
+
+# Somente 0-9: str.isdigit aceita dígitos Unicode (ex.: "１"), que não são dígitos de documento
+_NON_DIGITS = re.compile(r"[^0-9]")
+
+
+def only_digits(value: str) -> str:
+    """
+    Remover formatação de CPF/CNPJ/CEP, mantendo apenas dígitos ASCII
+    
+    Args:
+        value: Texto informado pelo usuário
+        
+    Returns:
+        Somente os caracteres 0-9
+    """
+    return _NON_DIGITS.sub("", value or "")
+
+
+def mod11_check_digit(digits: str, weights: tuple) -> int:
+    """
+    Calcular dígito verificador (módulo 11) de CPF/CNPJ
+    
+    Args:
+        digits: Dígitos anteriores ao verificador
+        weights: Pesos de cada posição
+        
+    Returns:
+        Dígito verificador (0 quando o resto é menor que 2)
+    """
+    remainder = sum(int(digit) * weight for digit, weight in zip(digits, weights)) % 11
+    return 0 if remainder < 2 else 11 - remainder
+
+
+def _valid_check_digits(document: str, size: int, weights: tuple) -> bool:
+    """Verificar tamanho, sequência repetida e os dois dígitos verificadores"""
+    if len(document) != size or document == document[0] * size:
+        return False
+    first = mod11_check_digit(document[:size - 2], weights[0])
+    second = mod11_check_digit(document[:size - 1], weights[1])
+    return document[-2:] == f"{first}{second}"
+
+
 def validate_cnpj(cnpj: str) -> bool:
     """
-    Validar formato de CNPJ
+    Validar CNPJ (formato e dígitos verificadores)
     
     Args:
         cnpj: CNPJ a validar
@@ -178,22 +328,14 @@ def validate_cnpj(cnpj: str) -> bool:
         True se válido, False caso contrário
     """
     # Remover caracteres especiais
-    cnpj_clean = ''.join(filter(str.isdigit, cnpj))
-    
-    # Verificar se tem 14 dígitos
-    if len(cnpj_clean) != 14:
-        return False
-    
-    # Verificar se não é sequência repetida
-    if cnpj_clean == cnpj_clean[0] * 14:
-        return False
+    cnpj_clean = only_digits(cnpj)
     
-    return True
+    return _valid_check_digits(cnpj_clean, 14, CNPJ_WEIGHTS)
 
 
 def validate_cpf(cpf: str) -> bool:
     """
-    Validar formato de CPF
+    Validar CPF (formato e dígitos verificadores)
     
     Args:
         cpf: CPF a validar
@@ -202,17 +344,9 @@ def validate_cpf(cpf: str) -> bool:
         True se válido, False caso contrário
     """
     # Remover caracteres especiais
-    cpf_clean = ''.join(filter(str.isdigit, cpf))
-    
-    # Verificar se tem 11 dígitos
-    if len(cpf_clean) != 11:
-        return False
+    cpf_clean = only_digits(cpf)
     
-    # Verificar se não é sequência repetida
-    if cpf_clean == cpf_clean[0] * 11:
-        return False
-    
-    return True
+    return _valid_check_digits(cpf_clean, 11, CPF_WEIGHTS)
 
 
 def validate_email(email: str) -> bool:
@@ -228,3 +362,19 @@ def validate_email(email: str) -> bool:
     import re
     pattern = r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$'
     return re.match(pattern, email) is not None
+
+
+def verify_admin_credentials(username: str, password: str) -> bool:
+    """
+    Conferir credenciais do painel administrativo (comparação em tempo constante)
+    
+    Args:
+        username: Usuário informado
+        password: Senha informada
+        
+    Returns:
+        True se conferem com ADMIN_USERNAME/ADMIN_PASSWORD
+    """
+    username_ok = secrets.compare_digest(username.encode("utf-8"), settings.ADMIN_USERNAME.encode("utf-8"))
+    password_ok = secrets.compare_digest(password.encode("utf-8"), settings.ADMIN_PASSWORD.encode("utf-8"))
+    return username_ok and password_ok
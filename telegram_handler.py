@@ -4,11 +4,12 @@ Handler para processamento de mensagens do Telegram
 import logging
 import asyncio
 from typing import Optional, Dict, Any
-from datetime import datetime
 from config import settings
+from http_clients import http_clients
 from security import (
-    check_rate_limit, 
-    is_user_blocked, 
+    check_admission,
+    ADMISSION_BLOCKED,
+    ADMISSION_RATE_LIMITED,
     validate_cnpj, 
     validate_cpf,
     validate_email
@@ -17,11 +18,21 @@ from services.cnpj_service import cnpj_service
 from services.transparencia_service import transparencia_service
 from services.veicular_service import veicular_service
 from services.breach_service import breach_service
-from models import User, Platform
-from database import SessionLocal
+from models import Platform, QueryType
+from user_buffer import user_buffer
+from upstream_scheduler import set_upstream_context
+from job_queue import job_queue
+from idempotency import idempotency_store
+from conversation_state import conversation_state
 
 logger = logging.getLogger(__name__)
 
+# Campos estruturados dos logs deste handler (ver logging_config.STRUCTURED_FIELDS)
+LOG_EXTRA = {"platform": Platform.TELEGRAM.value}
+
+# Tipo de consulta de cada job enfileirado
+QUERY_TYPES = {"cnpj": QueryType.CNPJ.value, "email": QueryType.DADOS_VAZADOS.value}
+
 
 class TelegramHandler:
     """Handler para processamento de mensagens do Telegram"""
@@ -34,13 +45,23 @@ class TelegramHandler:
     ESTADO_AGUARDANDO_EMAIL = "aguardando_email"
     ESTADO_AGUARDANDO_PLACA = "aguardando_placa"
     
+    # Opções numeradas do menu principal
+    OPCOES_MENU = {
+        "1": "/consulta_cnpj",
+        "2": "/transparencia",
+        "3": "/veicular",
+        "4": "/dados_vazados",
+        "5": "/ajuda"
+    }
+    
     @staticmethod
     async def processar_mensagem(
         user_id: str,
         username: str,
         first_name: str,
         text: str,
-        ip_address: str
+        ip_address: str,
+        update_id: Optional[int] = None
     ) -> Dict[str, Any]:
         """
         Processar mensagem do Telegram
@@ -51,50 +72,115 @@ class TelegramHandler:
             first_name: Primeiro nome do usuário
             text: Texto da mensagem
             ip_address: IP do usuário
+            update_id: Campo update_id do payload do webhook (reenvios com o
+                mesmo ID são ignorados; sem ele, não há deduplicação)
             
         Returns:
             Dicionário com resposta a enviar
         """
         try:
-            # Verificar se usuário está bloqueado
-            if is_user_blocked(user_id, "telegram"):
-                logger.warning(f"Blocked user attempted to use bot: {user_id}")
+            # Reenvio do webhook: descartado antes do rate limit e do banco
+            if settings.IDEMPOTENCY_ENABLED and update_id is not None and \
+                    not await idempotency_store.first_delivery("telegram", str(update_id)):
+                logger.info(f"Duplicate Telegram update ignored: {update_id}", extra=LOG_EXTRA)
+                return {
+                    "success": True,
+                    "duplicate": True,
+                    "send_reply": False
+                }
+            
+            # Bloqueio/rate limit e estado da conversa lidos em paralelo
+            (status, error_message), conversa = await asyncio.gather(
+                check_admission(user_id, "telegram"),
+                conversation_state.get("telegram", user_id)
+            )
+            
+            if status == ADMISSION_BLOCKED:
+                logger.warning(f"Blocked user attempted to use bot: {user_id}", extra=LOG_EXTRA)
                 return {
                     "success": False,
                     "message": "❌ Sua conta foi bloqueada. Entre em contato com o administrador.",
                     "send_reply": True
                 }
             
-            # Verificar rate limit
-            allowed, error_message = check_rate_limit(user_id, "telegram")
-            if not allowed:
-                logger.warning(f"Rate limit exceeded for user: {user_id}")
+            if status == ADMISSION_RATE_LIMITED:
+                logger.warning(f"Rate limit exceeded for user: {user_id}", extra=LOG_EXTRA)
                 return {
                     "success": False,
                     "message": f"⏱️ {error_message}",
                     "send_reply": True
                 }
             
+            # Cota das APIs externas repartida por usuário
+            set_upstream_context(f"telegram:{user_id}")
+            
             # Registrar ou atualizar usuário
             await TelegramHandler._upsert_user(user_id, username, first_name)
             
-            # Processar comando
+            # Processar comando ou resposta ao passo atual da conversa
+            estado_atual = conversa.get("estado", TelegramHandler.ESTADO_INICIAL)
             if text.startswith("/"):
-                return await TelegramHandler._processar_comando(
+                resposta = await TelegramHandler._processar_comando(
                     user_id, text, ip_address
                 )
+            else:
+                resposta = await TelegramHandler._processar_resposta(
+                    user_id, text.strip(), ip_address, estado_atual
+                )
             
-            # Se não for comando, mostrar menu
-            return await TelegramHandler._mostrar_menu(user_id)
+            # Gravar o novo estado (uma ida ao Redis); sem mudança, só renovar a expiração
+            novo_estado = resposta.get("estado")
+            if novo_estado is not None and novo_estado != estado_atual:
+                await conversation_state.set("telegram", user_id, {"estado": novo_estado})
+            elif conversa:
+                await conversation_state.touch("telegram", user_id, conversa)
+            
+            return resposta
             
         except Exception as e:
-            logger.error(f"Error processing Telegram message: {e}")
+            logger.error(f"Error processing Telegram message: {e}", extra=LOG_EXTRA)
             return {
                 "success": False,
                 "message": "❌ Erro ao processar sua mensagem. Tente novamente.",
                 "send_reply": True
             }
     
+    @staticmethod
+    async def _processar_resposta(
+        user_id: str,
+        texto: str,
+        ip_address: str,
+        estado: str
+    ) -> Dict[str, Any]:
+        """Tratar texto livre conforme o passo da conversa"""
+        
+        if estado == TelegramHandler.ESTADO_AGUARDANDO_CNPJ:
+            if not validate_cnpj(texto):
+                return {
+                    "success": False,
+                    "message": "❌ CNPJ inválido. Digite novamente ou use /menu para voltar.",
+                    "estado": TelegramHandler.ESTADO_AGUARDANDO_CNPJ,
+                    "send_reply": True
+                }
+            return await TelegramHandler.processar_entrada_cnpj(user_id, texto, ip_address)
+        
+        if estado == TelegramHandler.ESTADO_AGUARDANDO_EMAIL:
+            if not validate_email(texto):
+                return {
+                    "success": False,
+                    "message": "❌ Email inválido. Digite novamente ou use /menu para voltar.",
+                    "estado": TelegramHandler.ESTADO_AGUARDANDO_EMAIL,
+                    "send_reply": True
+                }
+            return await TelegramHandler.processar_entrada_email(user_id, texto, ip_address)
+        
+        if estado == TelegramHandler.ESTADO_MENU and texto in TelegramHandler.OPCOES_MENU:
+            return await TelegramHandler._processar_comando(
+                user_id, TelegramHandler.OPCOES_MENU[texto], ip_address
+            )
+        
+        return await TelegramHandler._mostrar_menu(user_id)
+    
     @staticmethod
     async def _processar_comando(
         user_id: str,
@@ -223,7 +309,22 @@ Digite o número ou use os comandos:
         cnpj: str,
         ip_address: str
     ) -> Dict[str, Any]:
-        """Processar entrada de CNPJ"""
+        """Processar entrada de CNPJ (resultado enviado depois, pela fila de jobs)"""
+        
+        if await TelegramHandler._enfileirar("cnpj", user_id, {"cnpj": cnpj, "ip_address": ip_address}):
+            return TelegramHandler._resposta_em_andamento()
+        
+        return await TelegramHandler._consultar_cnpj(user_id, cnpj, ip_address)
+    
+    @staticmethod
+    async def _consultar_cnpj(
+        user_id: str,
+        cnpj: str,
+        ip_address: str
+    ) -> Dict[str, Any]:
+        """Consultar CNPJ e montar a resposta"""
+        
+        set_upstream_context(f"telegram:{user_id}")
         
         resultado = await cnpj_service.consultar_cnpj(
             cnpj=cnpj,
@@ -270,7 +371,22 @@ Email: {data.get('contato', {}).get('email')}
         email: str,
         ip_address: str
     ) -> Dict[str, Any]:
-        """Processar entrada de email para verificação de vazamento"""
+        """Processar entrada de email para verificação de vazamento (resultado pela fila de jobs)"""
+        
+        if await TelegramHandler._enfileirar("email", user_id, {"email": email, "ip_address": ip_address}):
+            return TelegramHandler._resposta_em_andamento()
+        
+        return await TelegramHandler._verificar_email(user_id, email, ip_address)
+    
+    @staticmethod
+    async def _verificar_email(
+        user_id: str,
+        email: str,
+        ip_address: str
+    ) -> Dict[str, Any]:
+        """Verificar vazamento do email e montar a resposta"""
+        
+        set_upstream_context(f"telegram:{user_id}")
         
         resultado = await breach_service.consultar_email_vazado(
             email=email,
@@ -321,40 +437,117 @@ Vazamentos encontrados: {data.get('breach_count')}
         }
     
     @staticmethod
-    async def _upsert_user(
-        user_id: str,
-        username: Optional[str],
-        first_name: Optional[str]
-    ) -> None:
-        """Registrar ou atualizar usuário"""
+    async def _enfileirar(tipo: str, user_id: str, dados: Dict[str, Any]) -> bool:
+        """
+        Enfileirar consulta para execução em segundo plano
+        
+        Returns:
+            True se enfileirada; False se a fila estiver desativada ou indisponível
+            (a consulta é então feita na própria requisição)
+        """
+        if not settings.JOB_QUEUE_ENABLED:
+            return False
         try:
-            db = SessionLocal()
+            await job_queue.enqueue(
+                f"telegram.{tipo}",
+                f"telegram:{user_id}",
+                {"user_id": user_id, **dados}
+            )
+            return True
+        except Exception as e:
+            logger.error(
+                f"Failed to enqueue telegram {tipo} job, running inline: {e}",
+                extra={**LOG_EXTRA, "query_type": QUERY_TYPES[tipo]}
+            )
+            return False
+    
+    @staticmethod
+    def _resposta_em_andamento() -> Dict[str, Any]:
+        """Confirmação imediata enquanto a consulta roda na fila"""
+        return {
+            "success": True,
+            "message": "⏳ Consulta em andamento. Você receberá o resultado em instantes.",
+            "estado": TelegramHandler.ESTADO_MENU,
+            "send_reply": True
+        }
+    
+    @staticmethod
+    async def executar_job(job: Dict[str, Any]) -> None:
+        """
+        Executar consulta enfileirada e enviar o resultado pelo sendMessage
+        
+        Raises:
+            RuntimeError: Falha no envio (o job é tentado novamente)
+        """
+        dados = job["payload"]
+        user_id = dados["user_id"]
+        
+        # Resposta guardada no job: nas retentativas só o envio é repetido
+        if "resposta" not in job:
+            if job["type"] == "telegram.cnpj":
+                resposta = await TelegramHandler._consultar_cnpj(user_id, dados["cnpj"], dados["ip_address"])
+            else:
+                resposta = await TelegramHandler._verificar_email(user_id, dados["email"], dados["ip_address"])
+            job["resposta"] = resposta["message"]
+        
+        if not await TelegramHandler.enviar_mensagem(user_id, job["resposta"]):
+            raise RuntimeError(f"Failed to deliver {job['type']} result to {user_id}")
+    
+    @staticmethod
+    async def enviar_mensagem(
+        chat_id: str,
+        message_text: str
+    ) -> bool:
+        """
+        Enviar mensagem via Bot API (sendMessage)
+        
+        Args:
+            chat_id: Chat do destinatário (em conversa privada, o ID do usuário)
+            message_text: Texto da mensagem
             
-            user = db.query(User).filter(
-                User.user_id == user_id,
-                User.platform == Platform.TELEGRAM
-            ).first()
+        Returns:
+            True se enviado com sucesso, False caso contrário
+        """
+        try:
+            url = f"{settings.TELEGRAM_API_BASE_URL}/bot{settings.TELEGRAM_BOT_TOKEN}/sendMessage"
             
-            if user:
-                user.username = username
-                user.first_name = first_name
-                user.last_interaction = datetime.utcnow()
-            else:
-                user = User(
-                    user_id=user_id,
-                    platform=Platform.TELEGRAM,
-                    username=username,
-                    first_name=first_name,
-                    accepted_terms=False
-                )
-                db.add(user)
+            data = {
+                "chat_id": chat_id,
+                "text": message_text
+            }
             
-            db.commit()
-            db.close()
+            client = http_clients.get(url)
+            response = await client.post(url, json=data)
             
+            if response.status_code == 200:
+                logger.info(f"Message sent to Telegram chat {chat_id}", extra=LOG_EXTRA)
+                return True
+            else:
+                logger.error(f"Failed to send Telegram message: {response.status_code}", extra=LOG_EXTRA)
+                return False
+                
         except Exception as e:
-            logger.error(f"Error upserting user: {e}")
+            logger.error(f"Error sending Telegram message: {e}", extra=LOG_EXTRA)
+            return False
+    
+    @staticmethod
+    async def _upsert_user(
+        user_id: str,
+        username: Optional[str],
+        first_name: Optional[str]
+    ) -> None:
+        """Registrar ou atualizar usuário (gravação em lote pelo user_buffer)"""
+        user_buffer.touch(
+            user_id,
+            Platform.TELEGRAM,
+            username=username,
+            first_name=first_name
+        )
 
 
 # Instância global do handler
 telegram_handler = TelegramHandler()
+
+# Consultas respondidas de forma assíncrona
+job_queue.register("telegram.cnpj", TelegramHandler.executar_job)
+job_queue.register("telegram.email", TelegramHandler.executar_job)
@@ -0,0 +1,129 @@
+"""
+Configuração dos testes: módulos da aplicação ficam na raiz do repositório,
+e FakeRedis substitui o cliente redis.asyncio nos testes dos componentes
+"""
+import asyncio
+import os
+import sys
+import tempfile
+from typing import Any, Dict, List, Optional, Tuple
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Logs dos testes fora do repositório (logging_config cria o arquivo ao ser importado)
+os.environ.setdefault("LOG_FILE", os.path.join(tempfile.gettempdir(), "br_data_bot", "test.log"))
+
+
+class FakePipeline:
+    """Pipeline que acumula os comandos e os aplica em execute"""
+
+    def __init__(self, redis: "FakeRedis"):
+        self.redis = redis
+        self.commands: List[Tuple[str, tuple, dict]] = []
+
+    def __getattr__(self, name):
+        def queue(*args, **kwargs):
+            self.commands.append((name, args, kwargs))
+            return self
+        return queue
+
+    async def execute(self) -> list:
+        self.redis.calls.append(("pipeline", len(self.commands)))
+        if self.redis.pipeline_errors:
+            self.redis.pipeline_errors -= 1
+            raise ConnectionError("pipeline failed")
+        return [await getattr(self.redis, name)(*args, **kwargs) for name, args, kwargs in self.commands]
+
+
+class FakeRedis:
+    """
+    Redis em memória (strings, hashes e listas) com o subconjunto de comandos
+    usado pela aplicação
+
+    Args:
+        error: Exceção levantada por todo comando (Redis fora do ar)
+        set_result: Resposta fixa de SET (None simula NX sem criar a chave)
+        script_result: Resposta dos scripts registrados com register_script
+        pipeline_errors: Quantos execute() de pipeline falham antes de funcionar
+        hold_reads: Leituras (HGETALL) ficam paradas até release.set()
+    """
+
+    def __init__(self, error: Optional[Exception] = None, set_result: Any = True,
+                 script_result: Any = None, pipeline_errors: int = 0, hold_reads: bool = False):
+        self.error = error
+        self.set_result = set_result
+        self.script_result = script_result
+        self.pipeline_errors = pipeline_errors
+        self.data: Dict[str, Any] = {}
+        self.ttls: Dict[str, int] = {}
+        self.calls: List[tuple] = []
+        self.reading = asyncio.Event()
+        self.release = asyncio.Event()
+        if not hold_reads:
+            self.release.set()
+
+    def _call(self, name: str, key: str = None) -> None:
+        self.calls.append((name, key))
+        if self.error is not None:
+            raise self.error
+
+    def commands(self, name: str) -> list:
+        """Chaves usadas nas chamadas de um comando"""
+        return [key for command, key in self.calls if command == name]
+
+    def pipeline(self, transaction: bool = True) -> FakePipeline:
+        return FakePipeline(self)
+
+    def register_script(self, lua: str):
+        async def script(keys=None, args=None):
+            self._call("evalsha", keys[0] if keys else None)
+            return self.script_result
+        return script
+
+    async def get(self, key):
+        self._call("get", key)
+        return self.data.get(key)
+
+    async def set(self, key, value, nx=False, ex=None):
+        self._call("set", key)
+        if self.set_result and not (nx and key in self.data):
+            self.data[key] = str(value)
+            if ex is not None:
+                self.ttls[key] = ex
+            return True
+        return None
+
+    async def delete(self, *keys):
+        for key in keys:
+            self._call("delete", key)
+            self.data.pop(key, None)
+
+    async def expire(self, key, ttl):
+        self._call("expire", key)
+        self.ttls[key] = ttl
+        return key in self.data
+
+    async def hset(self, key, mapping=None):
+        self._call("hset", key)
+        self.data.setdefault(key, {}).update({name: str(value) for name, value in mapping.items()})
+
+    async def hgetall(self, key):
+        self._call("hgetall", key)
+        snapshot = dict(self.data.get(key, {}))
+        self.reading.set()
+        await self.release.wait()
+        return snapshot
+
+    async def rpush(self, key, *values):
+        self._call("rpush", key)
+        self.data.setdefault(key, []).extend(values)
+        return len(self.data[key])
+
+    async def lrange(self, key, start, end):
+        self._call("lrange", key)
+        values = self.data.get(key, [])
+        return values[start:] if end == -1 else values[start:end + 1]
+
+    async def publish(self, channel, message):
+        self._call("publish", channel)
+        return 0
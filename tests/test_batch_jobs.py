@@ -0,0 +1,167 @@
+"""
+Leitura do arquivo e preparação dos CNPJs da consulta em lote
+"""
+import asyncio
+import json
+import pytest
+from conftest import FakeRedis
+from batch_jobs import BatchJob, BatchJobManager, BatchTooLarge, parse_upload, prepare_documents
+
+VALID = "11222333000181"
+VALID_FORMATTED = "11.222.333/0001-81"
+OTHER_VALID = "11444777000161"
+
+
+def test_csv_with_header_uses_cnpj_column():
+    content = f"nome,cnpj\nACME,{VALID}\nOutra,{OTHER_VALID}\n".encode()
+    assert parse_upload(content, "lista.csv") == [VALID, OTHER_VALID]
+
+
+def test_csv_without_header_uses_first_column():
+    content = f"{VALID},ACME\n{OTHER_VALID},Outra\n".encode()
+    assert parse_upload(content, "lista.csv") == [VALID, OTHER_VALID]
+
+
+def test_csv_text_header_without_cnpj_column_is_skipped():
+    content = f"documento\n{VALID}\n".encode()
+    assert parse_upload(content, "lista.csv") == [VALID]
+
+
+def test_csv_semicolon_separator():
+    content = f"razao;cnpj\nACME;{VALID_FORMATTED}\n".encode()
+    assert parse_upload(content, "lista.csv") == [VALID_FORMATTED]
+
+
+def test_csv_blank_lines_and_short_rows():
+    content = f"cnpj;nome\n\n{VALID};ACME\n;\n".encode()
+    assert parse_upload(content, "lista.csv") == [VALID, ""]
+
+
+def test_ndjson_objects_and_strings():
+    lines = [json.dumps({"cnpj": VALID}), json.dumps(OTHER_VALID), json.dumps({"outro": 1})]
+    content = "\n".join(lines).encode()
+    assert parse_upload(content, "lista.ndjson") == [VALID, OTHER_VALID, ""]
+
+
+def test_ndjson_detected_by_content():
+    content = json.dumps({"cnpj": VALID}).encode()
+    assert parse_upload(content, "upload") == [VALID]
+
+
+def test_ndjson_invalid_line():
+    with pytest.raises(ValueError):
+        parse_upload(b'{"cnpj": "1"}\n{quebrado', "lista.ndjson")
+
+
+def test_max_items_limit():
+    content = "\n".join([VALID] * 4).encode()
+    assert len(parse_upload(content, "lista.csv", max_items=4)) == 4
+    with pytest.raises(BatchTooLarge):
+        parse_upload("\n".join([VALID] * 5).encode(), "lista.csv", max_items=4)
+    with pytest.raises(BatchTooLarge):
+        parse_upload(("cnpj\n" + "\n".join([VALID] * 5)).encode(), "lista.csv", max_items=4)
+
+
+def test_prepare_deduplicates_and_reports_invalid():
+    documents = [VALID, VALID_FORMATTED, OTHER_VALID, "123", "123", "11222333000182"]
+    items, invalid, duplicates = prepare_documents(documents)
+    assert items == [VALID, OTHER_VALID]
+    assert invalid == ["123", "11222333000182"]
+    assert duplicates == 2
+
+
+def test_prepare_unicode_digits_are_invalid():
+    documents = [VALID, "1122233300018１", "１1222333000181"]
+    items, invalid, duplicates = prepare_documents(documents)
+    assert items == [VALID]
+    assert invalid == ["1122233300018１", "１1222333000181"]
+    assert duplicates == 0
+
+
+def test_unicode_digit_csv_cell_end_to_end():
+    content = f"cnpj\n{VALID}\n1122233300018１\n".encode()
+    items, invalid, _ = prepare_documents(parse_upload(content, "lista.csv"))
+    assert items == [VALID]
+    assert invalid == ["1122233300018１"]
+
+
+def test_quoted_csv_is_not_taken_for_ndjson():
+    # Formato exportado pelo Excel: todas as células entre aspas
+    content = f'"cnpj","nome"\n"{VALID_FORMATTED}","ACME"\n'.encode()
+    assert parse_upload(content, "lista.csv", "text/csv") == [VALID_FORMATTED]
+    assert parse_upload(content, "lista", "") == [VALID_FORMATTED]
+
+
+def test_ndjson_strings_detected_without_extension():
+    content = f'"{VALID}"\n"{OTHER_VALID}"\n'.encode()
+    assert parse_upload(content, "lista", "") == [VALID, OTHER_VALID]
+
+
+def make_manager(redis):
+    manager = BatchJobManager(redis, concurrency=2, ttl=60, flush_size=10)
+
+    async def lookup(cnpj_clean):
+        return {"cnpj": cnpj_clean, "status": "not_found"}
+
+    manager._lookup = lookup
+    return manager
+
+
+def test_failed_flush_is_resent_by_next_flush():
+    async def scenario():
+        redis = FakeRedis(pipeline_errors=1)
+        manager = make_manager(redis)
+        job = BatchJob("job1", "admin", [VALID, OTHER_VALID])
+        for cnpj in (VALID, OTHER_VALID):
+            job.append({"cnpj": cnpj, "status": "not_found"})
+
+        await manager._flush(job)
+        flushed_after_failure = job.flushed
+        await manager._flush(job)
+        return redis, job, flushed_after_failure
+
+    redis, job, flushed_after_failure = asyncio.run(scenario())
+    assert flushed_after_failure == 0
+    assert job.flushed == 2
+    assert len(redis.data["batch_job:job1:results"]) == 2
+    assert redis.data["batch_job:job1"]["completed"] == "2"
+
+
+def test_stream_of_finished_job_ends_when_results_are_missing():
+    async def scenario():
+        redis = FakeRedis()
+        manager = make_manager(redis)
+        # Contador à frente da lista (gravação perdida): o stream não pode ficar em loop
+        redis.data["batch_job:job1"] = {"status": "done", "completed": "5"}
+        redis.data["batch_job:job1:results"] = [json.dumps({"cnpj": VALID, "status": "found"})]
+        return [result async for result in manager.stream("job1")]
+
+    results = asyncio.run(asyncio.wait_for(scenario(), timeout=5))
+    assert [result["cnpj"] for result in results] == [VALID]
+
+
+def test_finished_job_is_served_from_redis_not_memory():
+    async def scenario():
+        manager = make_manager(FakeRedis())
+        job = await manager.submit([VALID, OTHER_VALID, "123"], "admin")
+        await job.task
+        streamed = [result async for result in manager.stream(job.id)]
+        return manager, job, await manager.status(job.id), streamed
+
+    manager, job, status, streamed = asyncio.run(scenario())
+    assert job.id not in manager._jobs
+    assert status["status"] == "done"
+    assert status["completed"] == 3
+    assert len(streamed) == 3
+
+
+def test_finished_job_stays_in_memory_without_redis():
+    async def scenario():
+        manager = make_manager(None)
+        job = await manager.submit([VALID], "admin")
+        await job.task
+        return await manager.status(job.id)
+
+    status = asyncio.run(scenario())
+    assert status["status"] == "done"
+    assert status["completed"] == 1
@@ -0,0 +1,117 @@
+"""
+Despacho das mensagens conforme o estado da conversa (Telegram e WhatsApp)
+"""
+import asyncio
+import sys
+import types
+import uuid
+import pytest
+from conversation_state import ConversationStateStore
+
+# Serviços de consulta (pacote services) não são exercitados aqui: o despacho
+# por estado é testado com as consultas substituídas no fixture
+SERVICES = ("cnpj_service", "transparencia_service", "veicular_service", "breach_service")
+try:
+    import services  # noqa: F401
+except ImportError:
+    sys.modules["services"] = types.ModuleType("services")
+    for name in SERVICES:
+        module = types.ModuleType(f"services.{name}")
+        setattr(module, name, None)
+        sys.modules[f"services.{name}"] = module
+
+import telegram_handler  # noqa: E402
+import whatsapp_handler  # noqa: E402
+
+VALID_CNPJ = "11222333000181"
+
+HANDLERS = [
+    ("telegram", telegram_handler, telegram_handler.TelegramHandler),
+    ("whatsapp", whatsapp_handler, whatsapp_handler.WhatsAppHandler)
+]
+
+
+@pytest.fixture(params=HANDLERS, ids=["telegram", "whatsapp"])
+def bot(request, monkeypatch):
+    """Handler com admissão liberada, estado em memória e consultas registradas"""
+    platform, module, handler = request.param
+    store = ConversationStateStore(None, ttl=60, local_max_size=100)
+    calls = []
+
+    async def admitted(user_id, platform):
+        return "ok", None
+
+    async def upsert(*args, **kwargs):
+        return None
+
+    async def entrada_cnpj(user_id, cnpj, ip_address):
+        calls.append(("cnpj", cnpj))
+        return {"success": True, "message": "resultado", "estado": handler.ESTADO_MENU, "send_reply": True}
+
+    monkeypatch.setattr(module, "check_admission", admitted)
+    monkeypatch.setattr(module, "conversation_state", store)
+    monkeypatch.setattr(handler, "_upsert_user", staticmethod(upsert))
+    monkeypatch.setattr(handler, "processar_entrada_cnpj", staticmethod(entrada_cnpj))
+    return platform, handler, store, calls
+
+
+def send(platform, handler, text, user_id="42"):
+    if platform == "telegram":
+        coro = handler.processar_mensagem(user_id, "user", "User", text, "127.0.0.1")
+    else:
+        coro = handler.processar_mensagem(user_id, "User", text, f"wamid.{uuid.uuid4().hex}", "127.0.0.1")
+    return asyncio.run(coro)
+
+
+def test_cnpj_after_command_is_looked_up(bot):
+    platform, handler, store, calls = bot
+
+    resposta = send(platform, handler, "/consulta_cnpj")
+    assert resposta["estado"] == handler.ESTADO_AGUARDANDO_CNPJ
+
+    resposta = send(platform, handler, VALID_CNPJ)
+    assert calls == [("cnpj", VALID_CNPJ)]
+    assert resposta["message"] == "resultado"
+    assert asyncio.run(store.get(platform, "42")) == {"estado": handler.ESTADO_MENU}
+
+
+def test_invalid_cnpj_prompts_again(bot):
+    platform, handler, store, calls = bot
+
+    touched = []
+    original_touch = store.touch
+
+    async def touch(*args):
+        touched.append(args[:2])
+        await original_touch(*args)
+
+    store.touch = touch
+    send(platform, handler, "/consulta_cnpj")
+    resposta = send(platform, handler, "123")
+    assert calls == []
+    assert "CNPJ inválido" in resposta["message"]
+    assert resposta["estado"] == handler.ESTADO_AGUARDANDO_CNPJ
+    # Estado inalterado: só a expiração é renovada
+    assert touched == [(platform, "42")]
+
+    # Segue aguardando: a próxima entrada válida é consultada
+    send(platform, handler, VALID_CNPJ)
+    assert calls == [("cnpj", VALID_CNPJ)]
+
+
+@pytest.mark.parametrize("digit", ["1", "2", "3", "4", "5"])
+def test_menu_digit_runs_its_command(bot, digit):
+    platform, handler, store, calls = bot
+
+    send(platform, handler, "/menu")
+    resposta = send(platform, handler, digit)
+    esperado = asyncio.run(handler._processar_comando("42", handler.OPCOES_MENU[digit], "127.0.0.1"))
+    assert resposta["message"] == esperado["message"]
+
+
+def test_digit_outside_menu_shows_menu(bot):
+    platform, handler, store, calls = bot
+
+    resposta = send(platform, handler, "1")
+    assert resposta["estado"] == handler.ESTADO_MENU
+    assert calls == []
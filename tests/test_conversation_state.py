@@ -0,0 +1,71 @@
+"""
+Estado da conversa: cache local, renovação da expiração e leituras concorrentes
+"""
+import asyncio
+from conftest import FakeRedis
+from conversation_state import ConversationStateStore
+
+
+def test_read_started_before_write_does_not_overwrite_local_copy():
+    async def scenario():
+        redis = FakeRedis(hold_reads=True)
+        redis.data["conversation:telegram:1"] = {"estado": "menu"}
+        store = ConversationStateStore(redis, ttl=60, local_max_size=10)
+        store._subscribed = True
+
+        read = asyncio.create_task(store.get("telegram", "1"))
+        await redis.reading.wait()
+        # Escrita chega enquanto a leitura antiga ainda está no Redis
+        await store.set("telegram", "1", {"estado": "aguardando_cnpj"})
+        redis.release.set()
+        stale = await read
+        return stale, await store.get("telegram", "1")
+
+    stale, current = asyncio.run(scenario())
+    assert stale == {"estado": "menu"}
+    assert current == {"estado": "aguardando_cnpj"}
+
+
+def test_invalidation_during_read_is_not_lost():
+    async def scenario():
+        redis = FakeRedis(hold_reads=True)
+        redis.data["conversation:telegram:1"] = {"estado": "menu"}
+        store = ConversationStateStore(redis, ttl=60, local_max_size=10)
+        store._subscribed = True
+
+        read = asyncio.create_task(store.get("telegram", "1"))
+        await redis.reading.wait()
+        # Invalidação publicada por outro worker durante a leitura
+        store._generation += 1
+        redis.release.set()
+        await read
+        return store.stats()
+
+    stats = asyncio.run(scenario())
+    assert stats["size"] == 0
+
+
+def test_touch_refreshes_expiry_without_rewriting_state():
+    async def scenario():
+        redis = FakeRedis()
+        store = ConversationStateStore(redis, ttl=60, local_max_size=10)
+        await store.touch("whatsapp", "5511", {"estado": "menu"})
+        return redis, store.stats()
+
+    redis, stats = asyncio.run(scenario())
+    assert redis.calls == [("expire", "conversation:whatsapp:5511")]
+    assert redis.ttls == {"conversation:whatsapp:5511": 60}
+    assert stats["writes"] == 0
+
+
+def test_redis_is_skipped_during_retry_interval():
+    redis = FakeRedis(error=ConnectionError("down"))
+
+    async def scenario():
+        store = ConversationStateStore(redis, ttl=60, local_max_size=10, retry_interval=60)
+        return [await store.get("telegram", "1") for _ in range(3)], store.stats()
+
+    states, stats = asyncio.run(scenario())
+    assert states == [{}, {}, {}]
+    assert len(redis.calls) == 1
+    assert stats["redis_errors"] == 1
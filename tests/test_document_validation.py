@@ -0,0 +1,50 @@
+"""
+Validação em lote (document_validation) deve concordar com a escalar (security)
+"""
+import pytest
+from document_validation import validate_cnpjs, validate_cpfs
+from security import validate_cnpj, validate_cpf
+
+CNPJS = [
+    "11222333000181",          # válido
+    "11.222.333/0001-81",      # válido, formatado
+    "11222333000182",          # dígito verificador errado
+    "11111111111111",          # dígitos repetidos
+    "1122233300018",           # curto
+    "112223330001811",         # longo
+    "1122233300018１",         # dígito Unicode (fullwidth) no verificador
+    "１1222333000181",         # dígito Unicode no corpo
+    "１１２２２３３３０００１８１",  # somente dígitos Unicode
+    "",
+    "abc",
+]
+
+CPFS = [
+    "52998224725",             # válido
+    "529.982.247-25",          # válido, formatado
+    "52998224724",             # dígito verificador errado
+    "00000000000",             # dígitos repetidos
+    "5299822472",              # curto
+    "5299822472５",            # dígito Unicode no verificador
+    "５2998224725",            # dígito Unicode no corpo
+    "",
+]
+
+
+def test_cnpj_batch_matches_scalar():
+    assert validate_cnpjs(CNPJS) == [validate_cnpj(cnpj) for cnpj in CNPJS]
+
+
+def test_cpf_batch_matches_scalar():
+    assert validate_cpfs(CPFS) == [validate_cpf(cpf) for cpf in CPFS]
+
+
+@pytest.mark.parametrize("document", ["1122233300018１", "１1222333000181"])
+def test_unicode_digits_are_rejected(document):
+    assert validate_cnpj(document) is False
+    assert validate_cnpjs([document, "11222333000181"]) == [False, True]
+
+
+def test_expected_results():
+    assert validate_cnpjs(CNPJS[:4]) == [True, True, False, False]
+    assert validate_cpfs(CPFS[:4]) == [True, True, False, False]
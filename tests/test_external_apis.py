@@ -0,0 +1,44 @@
+"""
+Limpeza das entradas antes das chamadas às APIs externas
+"""
+import asyncio
+import pytest
+from external_apis import brasil_api, portal_transparencia
+
+# Dígitos de largura total: str.isdigit os aceita, mas não são dígitos de CEP/CPF
+UNICODE_CEP = "０１３１０１００"
+UNICODE_CPF = "１２３４５６７８９０９"
+
+
+class Response:
+    status_code = 404
+
+    def json(self):
+        return {}
+
+
+@pytest.fixture
+def sent_requests(monkeypatch):
+    """URLs e parâmetros enviados aos upstreams (sem rede)"""
+    sent = []
+
+    def fake_get(client):
+        async def get(url, operation, **kwargs):
+            sent.append((url, kwargs.get("params", {})))
+            return Response()
+        return get
+
+    monkeypatch.setattr(brasil_api, "_get", fake_get(brasil_api))
+    monkeypatch.setattr(portal_transparencia, "_get", fake_get(portal_transparencia))
+    monkeypatch.setattr(portal_transparencia, "token", "token")
+    return sent
+
+
+def test_cep_with_unicode_digits_is_not_sent_upstream(sent_requests):
+    asyncio.run(brasil_api._query_cep(f"01310-100 {UNICODE_CEP}"))
+    assert sent_requests == [(f"{brasil_api.base_url}/address/v2/01310100", {})]
+
+
+def test_cpf_with_unicode_digits_is_not_sent_upstream(sent_requests):
+    asyncio.run(portal_transparencia._query_servidores(f"123.456.789-09{UNICODE_CPF}"))
+    assert sent_requests[0][1]["cpf"] == "12345678909"
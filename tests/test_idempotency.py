@@ -0,0 +1,55 @@
+"""
+Deduplicação de entregas de webhook (LRU local + SET NX no Redis)
+"""
+import asyncio
+from conftest import FakeRedis
+from idempotency import IdempotencyStore
+
+
+def test_local_repeat_is_dropped_without_redis_round_trip():
+    redis = FakeRedis()
+    store = IdempotencyStore(redis, ttl=60, local_max_size=10)
+
+    assert asyncio.run(store.first_delivery("telegram", "1")) is True
+    assert asyncio.run(store.first_delivery("telegram", "1")) is False
+    assert redis.commands("set") == ["idempotency:telegram:1"]
+    assert redis.ttls == {"idempotency:telegram:1": 60}
+    assert store.stats()["local_duplicates"] == 1
+    assert store.stats()["accepted"] == 1
+
+
+def test_same_id_on_other_platform_is_distinct():
+    store = IdempotencyStore(None, ttl=60, local_max_size=10)
+
+    assert asyncio.run(store.first_delivery("telegram", "1")) is True
+    assert asyncio.run(store.first_delivery("whatsapp", "1")) is True
+
+
+def test_repeat_seen_by_another_worker_is_dropped():
+    # SET NX não criou a chave: outro worker já processou a entrega
+    store = IdempotencyStore(FakeRedis(set_result=None), ttl=60, local_max_size=10)
+
+    assert asyncio.run(store.first_delivery("whatsapp", "wamid.1")) is False
+    assert store.stats()["redis_duplicates"] == 1
+    assert store.stats()["accepted"] == 0
+
+
+def test_redis_error_accepts_delivery_and_keeps_local_mark():
+    redis = FakeRedis(error=ConnectionError("down"))
+    store = IdempotencyStore(redis, ttl=60, local_max_size=10)
+
+    assert asyncio.run(store.first_delivery("telegram", "7")) is True
+    assert store.stats()["redis_fallbacks"] == 1
+    # O LRU local continua descartando o reenvio no mesmo worker
+    assert asyncio.run(store.first_delivery("telegram", "7")) is False
+    assert len(redis.calls) == 1
+
+
+def test_redis_is_skipped_during_retry_interval():
+    redis = FakeRedis(error=ConnectionError("down"))
+    store = IdempotencyStore(redis, ttl=60, local_max_size=10, retry_interval=60)
+
+    assert asyncio.run(store.first_delivery("telegram", "1")) is True
+    assert asyncio.run(store.first_delivery("telegram", "2")) is True
+    assert len(redis.calls) == 1
+    assert store.stats()["redis_fallbacks"] == 2
@@ -0,0 +1,150 @@
+"""
+Fila de jobs em memória: ordem por usuário, retentativas e encerramento
+"""
+import asyncio
+from job_queue import InMemoryJobQueue
+from retry import RetryPolicy
+
+
+def make_queue(partitions=4, max_attempts=3, shutdown_timeout=1.0):
+    queue = InMemoryJobQueue(partitions, max_attempts, shutdown_timeout)
+    queue.retry_policy = RetryPolicy(max_attempts, base_delay=0.001, max_delay=0.001)
+    return queue
+
+
+async def wait_until(condition, timeout=2.0):
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not condition():
+        assert asyncio.get_running_loop().time() < deadline, "timed out"
+        await asyncio.sleep(0.005)
+
+
+def test_jobs_of_same_user_run_in_order():
+    async def scenario():
+        queue = make_queue()
+        executed = []
+
+        async def handler(job):
+            # Jobs anteriores demoram mais: só a partição garante a ordem
+            await asyncio.sleep(0.02 / (job["payload"]["seq"] + 1))
+            executed.append((job["user"], job["payload"]["seq"]))
+
+        queue.register("test.job", handler)
+        await queue.start()
+        for seq in range(5):
+            for user in ("alice", "bob"):
+                await queue.enqueue("test.job", user, {"seq": seq})
+        await wait_until(lambda: queue.completed == 10)
+        await queue.stop()
+        return executed
+
+    executed = asyncio.run(scenario())
+    for user in ("alice", "bob"):
+        assert [seq for who, seq in executed if who == user] == list(range(5))
+
+
+def test_failing_job_is_retried_then_dropped():
+    async def scenario():
+        queue = make_queue(max_attempts=3)
+        attempts = []
+        executed = []
+
+        async def failing(job):
+            attempts.append(job["id"])
+            raise RuntimeError("send failed")
+
+        async def ok(job):
+            executed.append(job["id"])
+
+        queue.register("test.fail", failing)
+        queue.register("test.ok", ok)
+        await queue.start()
+        await queue.enqueue("test.fail", "alice", {})
+        next_id = await queue.enqueue("test.ok", "alice", {})
+        await wait_until(lambda: queue.completed == 1)
+        await queue.stop()
+        return queue, attempts, executed, next_id
+
+    queue, attempts, executed, next_id = asyncio.run(scenario())
+    assert len(attempts) == 3
+    assert queue.retried == 2
+    assert queue.failed == 1
+    # A falha definitiva não bloqueia a partição
+    assert executed == [next_id]
+
+
+def test_retry_reuses_job_state_between_attempts():
+    async def scenario():
+        queue = make_queue(max_attempts=3)
+        lookups = []
+        sends = []
+
+        async def handler(job):
+            if "resposta" not in job:
+                lookups.append(job["id"])
+                job["resposta"] = "resultado"
+            sends.append(job["resposta"])
+            if len(sends) < 3:
+                raise RuntimeError("send failed")
+
+        queue.register("test.job", handler)
+        await queue.start()
+        await queue.enqueue("test.job", "alice", {})
+        await wait_until(lambda: queue.completed == 1)
+        await queue.stop()
+        return lookups, sends
+
+    lookups, sends = asyncio.run(scenario())
+    assert len(lookups) == 1
+    assert sends == ["resultado"] * 3
+
+
+def test_stop_waits_for_running_job_and_keeps_queued_ones():
+    async def scenario():
+        queue = make_queue(partitions=1)
+        started = asyncio.Event()
+        executed = []
+
+        async def handler(job):
+            started.set()
+            await asyncio.sleep(0.05)
+            executed.append(job["payload"]["seq"])
+
+        queue.register("test.job", handler)
+        await queue.start()
+        await queue.enqueue("test.job", "alice", {"seq": 0})
+        await queue.enqueue("test.job", "alice", {"seq": 1})
+        await started.wait()
+        await queue.stop()
+        return queue, executed
+
+    queue, executed = asyncio.run(scenario())
+    assert executed == [0]
+    assert queue.stats()["queued"] == 1
+    assert queue.stats()["consumers"] == 0
+
+
+def test_failure_while_stopping_is_not_retried():
+    async def scenario():
+        queue = make_queue(partitions=1, max_attempts=3)
+        started = asyncio.Event()
+        attempts = []
+
+        async def handler(job):
+            attempts.append(job["id"])
+            started.set()
+            await asyncio.sleep(0.05)
+            raise RuntimeError("interrupted")
+
+        queue.register("test.job", handler)
+        await queue.start()
+        await queue.enqueue("test.job", "alice", {})
+        await started.wait()
+        await queue.stop()
+        return queue, attempts
+
+    queue, attempts = asyncio.run(scenario())
+    # Sem confirmação: o backend Redis reentrega o job ao próximo dono da partição
+    assert len(attempts) == 1
+    assert queue.retried == 0
+    assert queue.failed == 0
@@ -0,0 +1,29 @@
+"""
+Amostragem de logs por nome do logger (LOG_SAMPLE_RATES)
+"""
+import logging
+import logging_config
+from config import settings
+from logging_config import SamplingFilter, parse_sample_rates
+
+
+def make_record(name, level=logging.INFO):
+    return logging.getLogger(name).makeRecord(name, level, __file__, 1, "GET / - 200", None, None)
+
+
+def test_default_rates_sample_request_logs_of_main(monkeypatch):
+    sampling = SamplingFilter(parse_sample_rates(settings.LOG_SAMPLE_RATES))
+    monkeypatch.setattr(logging_config.random, "random", lambda: 0.5)
+
+    assert sampling.filter(make_record("main")) is False
+    assert sampling.filter(make_record("httpx")) is False
+    # Avisos e erros nunca são amostrados; loggers sem taxa passam sempre
+    assert sampling.filter(make_record("main", logging.WARNING)) is True
+    assert sampling.filter(make_record("job_queue")) is True
+
+
+def test_rates_match_logger_prefixes():
+    sampling = SamplingFilter(parse_sample_rates("external_apis=0,external_apis.brasil=1"))
+
+    assert sampling.filter(make_record("external_apis.cep")) is False
+    assert sampling.filter(make_record("external_apis.brasil")) is True
@@ -0,0 +1,88 @@
+"""
+Partições mensais de query_logs: linhas na partição padrão e ordem da manutenção
+"""
+from datetime import date, datetime
+from types import SimpleNamespace
+import partitions
+from partitions import PartitionMaintenance, ensure_query_log_partitions, partition_name
+
+
+class FakeConnection:
+    def __init__(self, engine):
+        self.engine = engine
+
+    def execute(self, statement, params=None):
+        sql = str(statement)
+        self.engine.statements.append(sql)
+        if "to_regclass" in sql:
+            value = params["name"] if params["name"] in self.engine.tables else None
+        elif "count(*)" in sql:
+            value = self.engine.default_rows.get(params["start"], 0)
+        else:
+            value = None
+        return SimpleNamespace(scalar=lambda: value)
+
+
+class FakeEngine:
+    """Engine PostgreSQL que registra os comandos executados"""
+
+    def __init__(self, tables=(), default_rows=None):
+        self.dialect = SimpleNamespace(name="postgresql")
+        self.tables = set(tables)
+        self.default_rows = default_rows or {}
+        self.statements = []
+
+    def begin(self):
+        engine = self
+
+        class Transaction:
+            def __enter__(self):
+                return FakeConnection(engine)
+
+            def __exit__(self, *exc):
+                return False
+
+        return Transaction()
+
+
+def test_rows_in_default_partition_are_moved_before_attaching_month():
+    current = datetime.utcnow().date().replace(day=1)
+    engine = FakeEngine(tables={partitions.DEFAULT_PARTITION}, default_rows={current: 3})
+
+    created = ensure_query_log_partitions(engine, months_ahead=1)
+
+    name = partition_name(current)
+    assert created[0] == name
+    statements = [sql for sql in engine.statements if name in sql and "to_regclass" not in sql]
+    assert statements[0].startswith(f"CREATE TABLE {name} (LIKE query_logs")
+    assert "DELETE FROM query_logs_default" in statements[1]
+    assert statements[2].startswith(f"ALTER TABLE query_logs ATTACH PARTITION {name}")
+    # Mês seguinte sem linhas na partição padrão: criação direta
+    assert any(sql.startswith(f"CREATE TABLE {created[1]} PARTITION OF") for sql in engine.statements)
+
+
+def test_existing_month_partition_is_left_alone():
+    current = datetime.utcnow().date().replace(day=1)
+    engine = FakeEngine(tables={partition_name(current)})
+
+    ensure_query_log_partitions(engine, months_ahead=0)
+
+    assert not any(sql.startswith(f"CREATE TABLE {partition_name(current)}") for sql in engine.statements)
+
+
+def test_retention_runs_when_partition_creation_fails(monkeypatch):
+    dropped = []
+
+    def failing_ensure(engine, months_ahead):
+        raise RuntimeError("updating partition constraint for default partition would be violated")
+
+    monkeypatch.setattr(partitions, "ensure_query_log_partitions", failing_ensure)
+    monkeypatch.setattr(partitions, "drop_expired_partitions",
+                        lambda engine, retention_months: dropped.append(retention_months) or [])
+
+    PartitionMaintenance(FakeEngine(), interval=60, months_ahead=1, retention_months=12).run_once()
+    assert dropped == [12]
+
+
+def test_partition_name_pads_month():
+    assert partition_name(date(2024, 3, 1)) == "query_logs_2024_03"
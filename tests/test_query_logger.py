@@ -0,0 +1,62 @@
+"""
+Ingestão de QueryLog: encerramento sem perder nem duplicar registros
+"""
+import asyncio
+from query_logger import QueryLogIngestor
+
+
+def make_ingestor(written, started, release):
+    ingestor = QueryLogIngestor(queue_size=100, batch_size=10, flush_interval_ms=10)
+
+    async def write(rows):
+        # INSERT já confirmado; a espera simula a atualização dos rollups
+        written.extend(row["query_input"] for row in rows)
+        started.set()
+        await release.wait()
+
+    ingestor._write = write
+    return ingestor
+
+
+def submit(ingestor, count, first=0):
+    for number in range(first, first + count):
+        ingestor.submit({"platform": "telegram", "query_type": "cnpj", "query_input": str(number)})
+
+
+def test_stop_during_write_does_not_duplicate_rows():
+    async def scenario():
+        written = []
+        started = asyncio.Event()
+        release = asyncio.Event()
+        ingestor = make_ingestor(written, started, release)
+        await ingestor.start()
+        submit(ingestor, 3)
+        await started.wait()
+        # Registros que chegam durante a gravação ficam para o dreno do stop()
+        submit(ingestor, 2, first=3)
+
+        stopping = asyncio.create_task(ingestor.stop())
+        await asyncio.sleep(0.01)
+        release.set()
+        await stopping
+        return written
+
+    assert asyncio.run(scenario()) == ["0", "1", "2", "3", "4"]
+
+
+def test_stop_while_collecting_batch_writes_pending_rows():
+    async def scenario():
+        written = []
+        ingestor = QueryLogIngestor(queue_size=100, batch_size=10, flush_interval_ms=60000)
+
+        async def write(rows):
+            written.extend(row["query_input"] for row in rows)
+
+        ingestor._write = write
+        await ingestor.start()
+        submit(ingestor, 2)
+        await asyncio.sleep(0.01)
+        await ingestor.stop()
+        return written
+
+    assert asyncio.run(scenario()) == ["0", "1"]
@@ -0,0 +1,38 @@
+"""
+Rate limiter: fallback local e intervalo sem tentar o Redis após uma falha
+"""
+import asyncio
+from conftest import FakeRedis
+from rate_limiter import ADMISSION_ALLOWED, ADMISSION_RATE_LIMITED, RateLimiter
+
+
+def make_limiter(redis, retry_interval=60):
+    return RateLimiter(
+        redis, algorithm="sliding_window", limit=2, period=60, burst=2, retry_interval=retry_interval
+    )
+
+
+def test_falls_back_to_local_limiter_when_redis_fails():
+    limiter = make_limiter(FakeRedis(error=ConnectionError("down")))
+
+    results = [asyncio.run(limiter.admit("telegram:1", "blocked:telegram:1"))[0] for _ in range(3)]
+    assert results == [ADMISSION_ALLOWED, ADMISSION_ALLOWED, ADMISSION_RATE_LIMITED]
+    assert limiter.fallbacks == 3
+
+
+def test_redis_is_skipped_during_retry_interval():
+    redis = FakeRedis(error=ConnectionError("down"))
+    limiter = make_limiter(redis)
+
+    for _ in range(5):
+        asyncio.run(limiter.hit("telegram:1"))
+    assert len(redis.calls) == 1
+
+
+def test_redis_is_retried_after_interval():
+    redis = FakeRedis(error=ConnectionError("down"))
+    limiter = make_limiter(redis, retry_interval=0)
+
+    for _ in range(3):
+        asyncio.run(limiter.hit("telegram:1"))
+    assert len(redis.calls) == 3
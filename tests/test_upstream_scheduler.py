@@ -0,0 +1,31 @@
+"""
+Agendador de cota dos upstreams: fichas não se perdem com pedidos expirados
+"""
+import asyncio
+import pytest
+from upstream_scheduler import QuotaWaitTimeout, UpstreamQuotaScheduler
+
+
+def test_token_taken_for_expired_waiter_is_refunded():
+    async def scenario():
+        # Uma ficha por minuto: perder a ficha faria o próximo pedido expirar
+        scheduler = UpstreamQuotaScheduler("hibp", None, requests_per_minute=1, burst=1, max_wait=0.05)
+        take_token = scheduler._take_token
+
+        async def slow_take_token():
+            await asyncio.sleep(0.1)
+            return await take_token()
+
+        scheduler._take_token = slow_take_token
+        with pytest.raises(QuotaWaitTimeout):
+            await scheduler.acquire()
+        await asyncio.sleep(0.1)
+
+        scheduler._take_token = take_token
+        scheduler.max_wait = 0.5
+        await scheduler.acquire()
+        await scheduler.stop()
+        return scheduler.stats()
+
+    stats = asyncio.run(scenario())
+    assert stats == {"waiting": 0, "granted": 1, "timeouts": 1}
@@ -0,0 +1,243 @@
+"""
+Agendador de cota das APIs externas: token bucket por chave de API compartilhado
+entre workers (Redis), com filas justas por usuário e prioridade para consultas
+interativas sobre trabalho em segundo plano
+"""
+import asyncio
+import contextvars
+import logging
+import time
+from collections import OrderedDict, deque
+from typing import Dict, Optional, Tuple
+from config import settings
+from metrics import UPSTREAM_QUEUE_WAIT
+from rate_limiter import ALGORITHM_TOKEN_BUCKET, TOKEN_BUCKET_LUA, LocalRateLimiter
+from security import async_redis_client
+
+logger = logging.getLogger(__name__)
+
+# Prioridades (menor valor é atendido primeiro)
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BACKGROUND = 1
+PRIORITY_NAMES = {PRIORITY_INTERACTIVE: "interactive", PRIORITY_BACKGROUND: "background"}
+
+# Identidade da requisição em andamento (propagada para as tasks filhas)
+_current_user: contextvars.ContextVar[str] = contextvars.ContextVar("upstream_user", default="anonymous")
+_current_priority: contextvars.ContextVar[int] = contextvars.ContextVar(
+    "upstream_priority", default=PRIORITY_INTERACTIVE
+)
+
+
+def set_upstream_context(user: str, priority: int = PRIORITY_INTERACTIVE) -> None:
+    """
+    Identificar o usuário e a prioridade das chamadas externas desta requisição
+
+    Args:
+        user: Identificador do usuário (ex.: "telegram:123")
+        priority: PRIORITY_INTERACTIVE ou PRIORITY_BACKGROUND
+    """
+    _current_user.set(user)
+    _current_priority.set(priority)
+
+
+class QuotaWaitTimeout(Exception):
+    """A requisição esperou mais que o limite pela cota do upstream"""
+
+
+class UpstreamQuotaScheduler:
+    """Libera chamadas a um upstream no ritmo da sua cota, de forma justa entre usuários"""
+
+    def __init__(
+        self,
+        name: str,
+        redis_client,
+        requests_per_minute: int,
+        burst: int,
+        max_wait: float
+    ):
+        """
+        Args:
+            name: Nome do upstream (chave da cota no Redis e rótulo das métricas)
+            redis_client: Cliente redis.asyncio (None usa apenas a cota local)
+            requests_per_minute: Cota da chave de API
+            burst: Requisições que podem sair de uma vez (capacidade do bucket)
+            max_wait: Espera máxima na fila em segundos
+        """
+        self.name = name
+        self.redis_client = redis_client
+        self.requests_per_minute = requests_per_minute
+        self.burst = max(1, burst)
+        self.max_wait = max_wait
+        self.local = LocalRateLimiter(ALGORITHM_TOKEN_BUCKET, requests_per_minute, 60, self.burst, 1)
+        self._script = redis_client.register_script(TOKEN_BUCKET_LUA) if redis_client is not None else None
+        self._redis_healthy = True
+        # prioridade -> usuário -> fila de espera (round-robin entre usuários)
+        self._queues: Dict[int, "OrderedDict[str, deque]"] = {
+            priority: OrderedDict() for priority in PRIORITY_NAMES
+        }
+        self._waiting = 0
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self.granted = 0
+        self.timeouts = 0
+
+    def _key(self) -> str:
+        return f"upstream_quota:{self.name}"
+
+    async def _take_token(self) -> Tuple[bool, float]:
+        """Consumir uma ficha da cota; retorna (permitido, segundos_ate_liberar)"""
+        if self._script is not None:
+            try:
+                allowed, wait_ms = await self._script(
+                    keys=[self._key()],
+                    args=[self.burst, self.requests_per_minute / 60000, 1]
+                )
+                if not self._redis_healthy:
+                    logger.info(f"Upstream quota {self.name}: Redis available again")
+                    self._redis_healthy = True
+                return bool(allowed), int(wait_ms) / 1000
+            except Exception as e:
+                if self._redis_healthy:
+                    logger.error(f"Upstream quota {self.name}: Redis unavailable, using local quota: {e}")
+                    self._redis_healthy = False
+        return self.local.hit(self.name)
+
+    async def _refund_token(self) -> None:
+        """Devolver uma ficha consumida sem pedido para liberar"""
+        if self._script is not None and self._redis_healthy:
+            try:
+                # Custo negativo soma a ficha; o excesso sobre a capacidade é
+                # cortado na próxima execução do script
+                await self._script(
+                    keys=[self._key()],
+                    args=[self.burst, self.requests_per_minute / 60000, -1]
+                )
+            except Exception as e:
+                logger.warning(f"Upstream quota {self.name}: failed to refund token: {e}")
+            return
+        self.local.refund(self.name)
+
+    def _pop_waiter(self) -> Optional[asyncio.Future]:
+        """Próximo pedido: maior prioridade, alternando entre usuários"""
+        for priority in sorted(self._queues):
+            users = self._queues[priority]
+            while users:
+                user, waiters = users.popitem(last=False)
+                future = waiters.popleft()
+                self._waiting -= 1
+                if waiters:
+                    users[user] = waiters
+                if not future.done():
+                    return future
+        return None
+
+    def _discard(self, priority: int, user: str, future: asyncio.Future) -> None:
+        """Remover pedido cancelado ou expirado da fila (não consome cota)"""
+        waiters = self._queues[priority].get(user)
+        if waiters is None:
+            return
+        try:
+            waiters.remove(future)
+            self._waiting -= 1
+        except ValueError:
+            return
+        if not waiters:
+            del self._queues[priority][user]
+
+    async def _run(self) -> None:
+        while True:
+            if not self._waiting:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+
+            allowed, wait = await self._take_token()
+            if not allowed:
+                await asyncio.sleep(max(wait, 0.001))
+                continue
+
+            # O pedido pode ter expirado ou sido cancelado durante _take_token
+            future = self._pop_waiter()
+            if future is None:
+                await self._refund_token()
+                continue
+            future.set_result(None)
+            self.granted += 1
+
+    async def acquire(self) -> None:
+        """
+        Aguardar a vez de chamar o upstream
+
+        Usa o usuário e a prioridade definidos por set_upstream_context.
+
+        Raises:
+            QuotaWaitTimeout: Espera maior que max_wait
+        """
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+        priority = _current_priority.get()
+        user = _current_user.get()
+        future = asyncio.get_running_loop().create_future()
+        self._queues[priority].setdefault(user, deque()).append(future)
+        self._waiting += 1
+        self._wakeup.set()
+
+        start = time.perf_counter()
+        try:
+            await asyncio.wait_for(future, timeout=self.max_wait)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            self._discard(priority, user, future)
+            raise QuotaWaitTimeout(f"Upstream quota wait exceeded for {self.name}")
+        except asyncio.CancelledError:
+            self._discard(priority, user, future)
+            raise
+        finally:
+            UPSTREAM_QUEUE_WAIT.labels(self.name, PRIORITY_NAMES[priority]).observe(
+                time.perf_counter() - start
+            )
+
+    async def stop(self) -> None:
+        """Parar o despachante"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def stats(self) -> Dict[str, int]:
+        """Contadores do agendador"""
+        return {
+            "waiting": self._waiting,
+            "granted": self.granted,
+            "timeouts": self.timeouts
+        }
+
+
+# Agendadores das APIs com cota por chave
+brasil_api_quota = UpstreamQuotaScheduler(
+    name="brasil_api",
+    redis_client=async_redis_client,
+    requests_per_minute=settings.BRASIL_API_REQUESTS_PER_MINUTE,
+    burst=settings.BRASIL_API_BURST,
+    max_wait=settings.UPSTREAM_QUOTA_MAX_WAIT
+)
+
+portal_transparencia_quota = UpstreamQuotaScheduler(
+    name="portal_transparencia",
+    redis_client=async_redis_client,
+    requests_per_minute=settings.PORTAL_TRANSPARENCIA_REQUESTS_PER_MINUTE,
+    burst=settings.PORTAL_TRANSPARENCIA_BURST,
+    max_wait=settings.UPSTREAM_QUOTA_MAX_WAIT
+)
+
+data_breach_quota = UpstreamQuotaScheduler(
+    name="have_i_been_pwned",
+    redis_client=async_redis_client,
+    requests_per_minute=settings.HAVE_I_BEEN_PWNED_REQUESTS_PER_MINUTE,
+    burst=settings.HAVE_I_BEEN_PWNED_BURST,
+    max_wait=settings.UPSTREAM_QUOTA_MAX_WAIT
+)
@@ -0,0 +1,154 @@
+"""
+Buffer write-behind de usuários: agrupa as interações por usuário e grava
+em lote com um único INSERT ... ON CONFLICT DO UPDATE
+"""
+import asyncio
+import logging
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+from sqlalchemy import func
+from sqlalchemy.dialects.postgresql import insert
+from config import settings
+from database import AsyncSessionLocal
+from models import User, Platform
+
+logger = logging.getLogger(__name__)
+
+
+class UserTouchBuffer:
+    """Acumula atualizações de usuários em memória e as grava periodicamente"""
+
+    def __init__(self, flush_interval_ms: int, max_rows: int):
+        """
+        Args:
+            flush_interval_ms: Intervalo máximo entre gravações
+            max_rows: Quantidade de usuários pendentes que antecipa a gravação
+        """
+        self.flush_interval = flush_interval_ms / 1000
+        self.max_rows = max_rows
+        self._pending: Dict[Tuple[str, Platform], Dict[str, Any]] = {}
+        self._wakeup = asyncio.Event()
+        self._lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+        self.flushes = 0
+        self.flushed_rows = 0
+        self.errors = 0
+
+    def touch(
+        self,
+        user_id: str,
+        platform: Platform,
+        username: Optional[str] = None,
+        first_name: Optional[str] = None,
+        phone_number: Optional[str] = None
+    ) -> None:
+        """
+        Registrar interação do usuário (sem acesso ao banco)
+
+        Args:
+            user_id: ID do usuário na plataforma
+            platform: Plataforma
+            username: Username (Telegram)
+            first_name: Primeiro nome
+            phone_number: Telefone (WhatsApp)
+        """
+        now = datetime.utcnow()
+        self._pending[(user_id, platform)] = {
+            "user_id": user_id,
+            "platform": platform,
+            "username": username,
+            "first_name": first_name,
+            "phone_number": phone_number,
+            "accepted_terms": False,
+            "created_at": now,
+            "updated_at": now,
+            "last_interaction": now
+        }
+        if len(self._pending) >= self.max_rows:
+            self._wakeup.set()
+
+    def _build_statement(self, rows: List[Dict[str, Any]]):
+        """INSERT em lote que só atualiza os dados de contato e a última interação"""
+        stmt = insert(User).values(rows)
+        return stmt.on_conflict_do_update(
+            index_elements=[User.user_id],
+            set_={
+                "username": func.coalesce(stmt.excluded.username, User.username),
+                "first_name": func.coalesce(stmt.excluded.first_name, User.first_name),
+                "phone_number": func.coalesce(stmt.excluded.phone_number, User.phone_number),
+                "last_interaction": stmt.excluded.last_interaction,
+                "updated_at": stmt.excluded.updated_at
+            }
+        )
+
+    async def flush(self) -> None:
+        """Gravar todas as interações pendentes"""
+        async with self._lock:
+            if not self._pending:
+                return
+
+            pending, self._pending = self._pending, {}
+
+            # ON CONFLICT não aceita a mesma chave duas vezes no mesmo comando
+            rows = list({row["user_id"]: row for row in pending.values()}.values())
+
+            try:
+                async with AsyncSessionLocal() as db:
+                    for start in range(0, len(rows), self.max_rows):
+                        await db.execute(self._build_statement(rows[start:start + self.max_rows]))
+                    await db.commit()
+                self.flushes += 1
+                self.flushed_rows += len(rows)
+            except asyncio.CancelledError:
+                self._restore(pending)
+                raise
+            except Exception as e:
+                self.errors += 1
+                logger.error(f"Failed to flush {len(rows)} user updates: {e}")
+                self._restore(pending)
+
+    def _restore(self, pending: Dict[Tuple[str, Platform], Dict[str, Any]]) -> None:
+        """Devolver ao buffer sem sobrescrever interações mais recentes"""
+        for key, row in pending.items():
+            self._pending.setdefault(key, row)
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+
+    async def start(self) -> None:
+        """Iniciar gravação periódica em segundo plano"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Parar a gravação periódica e gravar o que estiver pendente"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    def stats(self) -> Dict[str, int]:
+        """Contadores do buffer"""
+        return {
+            "pending": len(self._pending),
+            "flushes": self.flushes,
+            "flushed_rows": self.flushed_rows,
+            "errors": self.errors
+        }
+
+
+# Instância global do buffer
+user_buffer = UserTouchBuffer(
+    flush_interval_ms=settings.USER_BUFFER_FLUSH_INTERVAL_MS,
+    max_rows=settings.USER_BUFFER_MAX_ROWS
+)
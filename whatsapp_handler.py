@@ -1,14 +1,15 @@
 """
 Handler para processamento de mensagens do WhatsApp
 """
+import asyncio
 import logging
-import httpx
 from typing import Optional, Dict, Any
-from datetime import datetime
 from config import settings
+from http_clients import http_clients
 from security import (
-    check_rate_limit,
-    is_user_blocked,
+    check_admission,
+    ADMISSION_BLOCKED,
+    ADMISSION_RATE_LIMITED,
     validate_cnpj,
     validate_cpf,
     validate_email
@@ -17,15 +18,42 @@ from services.cnpj_service import cnpj_service
 from services.transparencia_service import transparencia_service
 from services.veicular_service import veicular_service
 from services.breach_service import breach_service
-from models import User, Platform
-from database import SessionLocal
+from models import Platform, QueryType
+from user_buffer import user_buffer
+from upstream_scheduler import set_upstream_context
+from job_queue import job_queue
+from idempotency import idempotency_store
+from conversation_state import conversation_state
 
 logger = logging.getLogger(__name__)
 
+# Campos estruturados dos logs deste handler (ver logging_config.STRUCTURED_FIELDS)
+LOG_EXTRA = {"platform": Platform.WHATSAPP.value}
+
+# Tipo de consulta de cada job enfileirado
+QUERY_TYPES = {"cnpj": QueryType.CNPJ.value, "email": QueryType.DADOS_VAZADOS.value}
+
 
 class WhatsAppHandler:
     """Handler para processamento de mensagens do WhatsApp"""
     
+    # Estados de conversa
+    ESTADO_INICIAL = "inicial"
+    ESTADO_MENU = "menu"
+    ESTADO_AGUARDANDO_CNPJ = "aguardando_cnpj"
+    ESTADO_AGUARDANDO_CPF = "aguardando_cpf"
+    ESTADO_AGUARDANDO_EMAIL = "aguardando_email"
+    ESTADO_AGUARDANDO_PLACA = "aguardando_placa"
+    
+    # Opções numeradas do menu principal
+    OPCOES_MENU = {
+        "1": "/consulta_cnpj",
+        "2": "/transparencia",
+        "3": "/veicular",
+        "4": "/dados_vazados",
+        "5": "/ajuda"
+    }
+    
     @staticmethod
     async def processar_mensagem(
         user_id: str,
@@ -41,52 +69,115 @@ class WhatsAppHandler:
             user_id: ID do usuário (phone number)
             user_name: Nome do usuário
             message_text: Texto da mensagem
-            message_id: ID da mensagem
+            message_id: ID da mensagem (reenvios com o mesmo ID são ignorados)
             ip_address: IP do usuário
             
         Returns:
             Dicionário com resposta a enviar
         """
         try:
-            # Verificar se usuário está bloqueado
-            if is_user_blocked(user_id, "whatsapp"):
-                logger.warning(f"Blocked user attempted to use bot: {user_id}")
+            # Reenvio do webhook: descartado antes do rate limit e do banco
+            if settings.IDEMPOTENCY_ENABLED and message_id and \
+                    not await idempotency_store.first_delivery("whatsapp", str(message_id)):
+                logger.info(f"Duplicate WhatsApp message ignored: {message_id}", extra=LOG_EXTRA)
+                return {
+                    "success": True,
+                    "duplicate": True,
+                    "send_reply": False
+                }
+            
+            # Bloqueio/rate limit e estado da conversa lidos em paralelo
+            (status, error_message), conversa = await asyncio.gather(
+                check_admission(user_id, "whatsapp"),
+                conversation_state.get("whatsapp", user_id)
+            )
+            
+            if status == ADMISSION_BLOCKED:
+                logger.warning(f"Blocked user attempted to use bot: {user_id}", extra=LOG_EXTRA)
                 return {
                     "success": False,
                     "message": "❌ Sua conta foi bloqueada. Entre em contato com o administrador.",
                     "send_reply": True
                 }
             
-            # Verificar rate limit
-            allowed, error_message = check_rate_limit(user_id, "whatsapp")
-            if not allowed:
-                logger.warning(f"Rate limit exceeded for user: {user_id}")
+            if status == ADMISSION_RATE_LIMITED:
+                logger.warning(f"Rate limit exceeded for user: {user_id}", extra=LOG_EXTRA)
                 return {
                     "success": False,
                     "message": f"⏱️ {error_message}",
                     "send_reply": True
                 }
             
+            # Cota das APIs externas repartida por usuário
+            set_upstream_context(f"whatsapp:{user_id}")
+            
             # Registrar ou atualizar usuário
             await WhatsAppHandler._upsert_user(user_id, user_name)
             
-            # Processar comando ou mensagem
+            # Processar comando ou resposta ao passo atual da conversa
+            estado_atual = conversa.get("estado", WhatsAppHandler.ESTADO_INICIAL)
             if message_text.startswith("/"):
-                return await WhatsAppHandler._processar_comando(
+                resposta = await WhatsAppHandler._processar_comando(
                     user_id, message_text, ip_address
                 )
+            else:
+                resposta = await WhatsAppHandler._processar_resposta(
+                    user_id, message_text.strip(), ip_address, estado_atual
+                )
             
-            # Se não for comando, mostrar menu
-            return await WhatsAppHandler._mostrar_menu(user_id)
+            # Gravar o novo estado (uma ida ao Redis); sem mudança, só renovar a expiração
+            novo_estado = resposta.get("estado")
+            if novo_estado is not None and novo_estado != estado_atual:
+                await conversation_state.set("whatsapp", user_id, {"estado": novo_estado})
+            elif conversa:
+                await conversation_state.touch("whatsapp", user_id, conversa)
+            
+            return resposta
             
         except Exception as e:
-            logger.error(f"Error processing WhatsApp message: {e}")
+            logger.error(f"Error processing WhatsApp message: {e}", extra=LOG_EXTRA)
             return {
                 "success": False,
                 "message": "❌ Erro ao processar sua mensagem. Tente novamente.",
                 "send_reply": True
             }
     
+    @staticmethod
+    async def _processar_resposta(
+        user_id: str,
+        texto: str,
+        ip_address: str,
+        estado: str
+    ) -> Dict[str, Any]:
+        """Tratar texto livre conforme o passo da conversa"""
+        
+        if estado == WhatsAppHandler.ESTADO_AGUARDANDO_CNPJ:
+            if not validate_cnpj(texto):
+                return {
+                    "success": False,
+                    "message": "❌ CNPJ inválido. Digite novamente ou use /menu para voltar.",
+                    "estado": WhatsAppHandler.ESTADO_AGUARDANDO_CNPJ,
+                    "send_reply": True
+                }
+            return await WhatsAppHandler.processar_entrada_cnpj(user_id, texto, ip_address)
+        
+        if estado == WhatsAppHandler.ESTADO_AGUARDANDO_EMAIL:
+            if not validate_email(texto):
+                return {
+                    "success": False,
+                    "message": "❌ Email inválido. Digite novamente ou use /menu para voltar.",
+                    "estado": WhatsAppHandler.ESTADO_AGUARDANDO_EMAIL,
+                    "send_reply": True
+                }
+            return await WhatsAppHandler.processar_entrada_email(user_id, texto, ip_address)
+        
+        if estado == WhatsAppHandler.ESTADO_MENU and texto in WhatsAppHandler.OPCOES_MENU:
+            return await WhatsAppHandler._processar_comando(
+                user_id, WhatsAppHandler.OPCOES_MENU[texto], ip_address
+            )
+        
+        return await WhatsAppHandler._mostrar_menu(user_id)
+    
     @staticmethod
     async def _processar_comando(
         user_id: str,
@@ -105,6 +196,7 @@ class WhatsAppHandler:
             return {
                 "success": True,
                 "message": "📋 Digite o CNPJ a consultar (com ou sem formatação):",
+                "estado": WhatsAppHandler.ESTADO_AGUARDANDO_CNPJ,
                 "send_reply": True
             }
         
@@ -112,6 +204,7 @@ class WhatsAppHandler:
             return {
                 "success": True,
                 "message": "🔍 Escolha o tipo de consulta:\n\n1️⃣ Servidores públicos\n2️⃣ Benefícios públicos\n\nDigite 1 ou 2:",
+                "estado": WhatsAppHandler.ESTADO_AGUARDANDO_CPF,
                 "send_reply": True
             }
         
@@ -119,6 +212,7 @@ class WhatsAppHandler:
             return {
                 "success": True,
                 "message": "🚗 Digite a placa do veículo (ABC-1234 ou ABC1D34):",
+                "estado": WhatsAppHandler.ESTADO_AGUARDANDO_PLACA,
                 "send_reply": True
             }
         
@@ -126,6 +220,7 @@ class WhatsAppHandler:
             return {
                 "success": True,
                 "message": "🔐 Digite seu email para verificar se foi vazado:",
+                "estado": WhatsAppHandler.ESTADO_AGUARDANDO_EMAIL,
                 "send_reply": True
             }
         
@@ -138,6 +233,7 @@ class WhatsAppHandler:
         return {
             "success": True,
             "message": settings.TERMS_OF_USE + "\n\n👇 Digite /aceitar para continuar ou /sair para cancelar",
+            "estado": WhatsAppHandler.ESTADO_INICIAL,
             "send_reply": True
         }
     
@@ -200,6 +296,7 @@ Digite o número ou use os comandos:
         return {
             "success": True,
             "message": menu,
+            "estado": WhatsAppHandler.ESTADO_MENU,
             "send_reply": True
         }
     
@@ -209,7 +306,22 @@ Digite o número ou use os comandos:
         cnpj: str,
         ip_address: str
     ) -> Dict[str, Any]:
-        """Processar entrada de CNPJ"""
+        """Processar entrada de CNPJ (resultado enviado depois, pela fila de jobs)"""
+        
+        if await WhatsAppHandler._enfileirar("cnpj", user_id, {"cnpj": cnpj, "ip_address": ip_address}):
+            return WhatsAppHandler._resposta_em_andamento()
+        
+        return await WhatsAppHandler._consultar_cnpj(user_id, cnpj, ip_address)
+    
+    @staticmethod
+    async def _consultar_cnpj(
+        user_id: str,
+        cnpj: str,
+        ip_address: str
+    ) -> Dict[str, Any]:
+        """Consultar CNPJ e montar a resposta"""
+        
+        set_upstream_context(f"whatsapp:{user_id}")
         
         resultado = await cnpj_service.consultar_cnpj(
             cnpj=cnpj,
@@ -246,6 +358,7 @@ Email: {data.get('contato', {}).get('email')}
         return {
             "success": resultado["success"],
             "message": mensagem,
+            "estado": WhatsAppHandler.ESTADO_MENU,
             "send_reply": True
         }
     
@@ -255,7 +368,22 @@ Email: {data.get('contato', {}).get('email')}
         email: str,
         ip_address: str
     ) -> Dict[str, Any]:
-        """Processar entrada de email para verificação de vazamento"""
+        """Processar entrada de email para verificação de vazamento (resultado pela fila de jobs)"""
+        
+        if await WhatsAppHandler._enfileirar("email", user_id, {"email": email, "ip_address": ip_address}):
+            return WhatsAppHandler._resposta_em_andamento()
+        
+        return await WhatsAppHandler._verificar_email(user_id, email, ip_address)
+    
+    @staticmethod
+    async def _verificar_email(
+        user_id: str,
+        email: str,
+        ip_address: str
+    ) -> Dict[str, Any]:
+        """Verificar vazamento do email e montar a resposta"""
+        
+        set_upstream_context(f"whatsapp:{user_id}")
         
         resultado = await breach_service.consultar_email_vazado(
             email=email,
@@ -301,9 +429,67 @@ Vazamentos encontrados: {data.get('breach_count')}
         return {
             "success": resultado["success"],
             "message": mensagem,
+            "estado": WhatsAppHandler.ESTADO_MENU,
+            "send_reply": True
+        }
+    
+    @staticmethod
+    async def _enfileirar(tipo: str, user_id: str, dados: Dict[str, Any]) -> bool:
+        """
+        Enfileirar consulta para execução em segundo plano
+        
+        Returns:
+            True se enfileirada; False se a fila estiver desativada ou indisponível
+            (a consulta é então feita na própria requisição)
+        """
+        if not settings.JOB_QUEUE_ENABLED:
+            return False
+        try:
+            await job_queue.enqueue(
+                f"whatsapp.{tipo}",
+                f"whatsapp:{user_id}",
+                {"user_id": user_id, **dados}
+            )
+            return True
+        except Exception as e:
+            logger.error(
+                f"Failed to enqueue whatsapp {tipo} job, running inline: {e}",
+                extra={**LOG_EXTRA, "query_type": QUERY_TYPES[tipo]}
+            )
+            return False
+    
+    @staticmethod
+    def _resposta_em_andamento() -> Dict[str, Any]:
+        """Confirmação imediata enquanto a consulta roda na fila"""
+        return {
+            "success": True,
+            "message": "⏳ Consulta em andamento. Você receberá o resultado em instantes.",
+            "estado": WhatsAppHandler.ESTADO_MENU,
             "send_reply": True
         }
     
+    @staticmethod
+    async def executar_job(job: Dict[str, Any]) -> None:
+        """
+        Executar consulta enfileirada e enviar o resultado pela Cloud API
+        
+        Raises:
+            RuntimeError: Falha no envio (o job é tentado novamente)
+        """
+        dados = job["payload"]
+        user_id = dados["user_id"]
+        
+        # Resposta guardada no job: nas retentativas só o envio é repetido
+        if "resposta" not in job:
+            if job["type"] == "whatsapp.cnpj":
+                resposta = await WhatsAppHandler._consultar_cnpj(user_id, dados["cnpj"], dados["ip_address"])
+            else:
+                resposta = await WhatsAppHandler._verificar_email(user_id, dados["email"], dados["ip_address"])
+            job["resposta"] = resposta["message"]
+        
+        if not await WhatsAppHandler.enviar_mensagem(user_id, job["resposta"]):
+            raise RuntimeError(f"Failed to deliver {job['type']} result to {user_id}")
+    
     @staticmethod
     async def enviar_mensagem(
         phone_number: str,
@@ -320,7 +506,7 @@ Vazamentos encontrados: {data.get('breach_count')}
             True se enviado com sucesso, False caso contrário
         """
         try:
-            url = f"https://graph.instagram.com/v18.0/{settings.WHATSAPP_PHONE_NUMBER_ID}/messages"
+            url = f"{settings.WHATSAPP_GRAPH_API_BASE_URL}/{settings.WHATSAPP_PHONE_NUMBER_ID}/messages"
             
             headers = {
                 "Authorization": f"Bearer {settings.WHATSAPP_API_TOKEN}",
@@ -336,18 +522,18 @@ Vazamentos encontrados: {data.get('breach_count')}
                 }
             }
             
-            async with httpx.AsyncClient(timeout=10) as client:
-                response = await client.post(url, json=data, headers=headers)
-                
-                if response.status_code == 200:
-                    logger.info(f"Message sent to {phone_number}")
-                    return True
-                else:
-                    logger.error(f"Failed to send message: {response.status_code}")
-                    return False
+            client = http_clients.get(url)
+            response = await client.post(url, json=data, headers=headers)
+            
+            if response.status_code == 200:
+                logger.info(f"Message sent to {phone_number}", extra=LOG_EXTRA)
+                return True
+            else:
+                logger.error(f"Failed to send message: {response.status_code}", extra=LOG_EXTRA)
+                return False
                     
         except Exception as e:
-            logger.error(f"Error sending WhatsApp message: {e}")
+            logger.error(f"Error sending WhatsApp message: {e}", extra=LOG_EXTRA)
             return False
     
     @staticmethod
@@ -355,34 +541,18 @@ Vazamentos encontrados: {data.get('breach_count')}
         user_id: str,
         user_name: Optional[str]
     ) -> None:
-        """Registrar ou atualizar usuário"""
-        try:
-            db = SessionLocal()
-            
-            user = db.query(User).filter(
-                User.user_id == user_id,
-                User.platform == Platform.WHATSAPP
-            ).first()
-            
-            if user:
-                user.first_name = user_name
-                user.last_interaction = datetime.utcnow()
-            else:
-                user = User(
-                    user_id=user_id,
-                    platform=Platform.WHATSAPP,
-                    first_name=user_name,
-                    phone_number=user_id,
-                    accepted_terms=False
-                )
-                db.add(user)
-            
-            db.commit()
-            db.close()
-            
-        except Exception as e:
-            logger.error(f"Error upserting user: {e}")
+        """Registrar ou atualizar usuário (gravação em lote pelo user_buffer)"""
+        user_buffer.touch(
+            user_id,
+            Platform.WHATSAPP,
+            first_name=user_name,
+            phone_number=user_id
+        )
 
 
 # Instância global do handler
 whatsapp_handler = WhatsAppHandler()
+
+# Consultas respondidas de forma assíncrona
+job_queue.register("whatsapp.cnpj", WhatsAppHandler.executar_job)
+job_queue.register("whatsapp.email", WhatsAppHandler.executar_job)